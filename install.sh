@@ -178,7 +178,7 @@ install_program() {
     mkdir -p /etc/rpt-swi
     
     # Copy program files
-    cp -r src/* /opt/rpt-swi/
+    cp -r src /opt/rpt-swi/
     cp requirements.txt /opt/rpt-swi/
     cp README.md /opt/rpt-swi/
     cp LICENSE /opt/rpt-swi/
@@ -189,11 +189,14 @@ install_program() {
     # Set permissions
     chmod -R 755 /opt/rpt-swi
     chmod 644 /etc/rpt-swi/settings.yaml
-    chmod 755 /opt/rpt-swi/main.py
     
-    # Create symlinks
-    ln -sf /opt/rpt-swi/main.py /usr/local/bin/rpt-swi
-    ln -sf /opt/rpt-swi/main.py /usr/local/bin/rptswi
+    # Create launchers (main.py imports the src package, so it runs as a module)
+    cat > /usr/local/bin/rpt-swi << 'EOF'
+#!/bin/sh
+PYTHONPATH=/opt/rpt-swi exec /opt/rpt-swi/venv/bin/python -m src.main "$@"
+EOF
+    chmod 755 /usr/local/bin/rpt-swi
+    ln -sf /usr/local/bin/rpt-swi /usr/local/bin/rptswi
     
     # Create systemd service
     cat > /etc/systemd/system/rpt-swi.service << EOF
@@ -205,7 +208,8 @@ Wants=network.target
 [Service]
 Type=simple
 User=root
-ExecStart=/opt/rpt-swi/venv/bin/python /opt/rpt-swi/main.py
+WorkingDirectory=/opt/rpt-swi
+ExecStart=/opt/rpt-swi/venv/bin/python -m src.main
 Restart=on-failure
 RestartSec=10
 StandardOutput=journal
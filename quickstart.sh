@@ -75,12 +75,13 @@ Create program directory
 print_status "Setting up program..."
 mkdir -p /opt/rpt-swi
 cp -r ./* /opt/rpt-swi/ 2>/dev/null || true
-Make executable
+Create launcher (main.py imports the src package, so it runs as a module)
 
-chmod +x /opt/rpt-swi/src/main.py
-Create symlink
-
-ln -sf /opt/rpt-swi/src/main.py /usr/local/bin/rpt-swi 2>/dev/null || true
+cat > /usr/local/bin/rpt-swi << 'EOF'
+#!/bin/sh
+PYTHONPATH=/opt/rpt-swi exec python3 -m src.main "$@"
+EOF
+chmod 755 /usr/local/bin/rpt-swi
 Create config directory
 
 mkdir -p ~/.config/rpt-swi
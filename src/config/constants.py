@@ -179,9 +179,17 @@ FIREWALL_ACTIONS = {
     "drop": "Drop",
     "reject": "Reject",
     "log": "Log Only",
+    "throttle": "Throttle Bandwidth",
     "quarantine": "Quarantine"
 }
 
+# روش‌های اعمال مسدودسازی در کرنل
+FIREWALL_BACKENDS = {
+    "iptables": "One iptables rule per blocked device",
+    "ipset": "Kernel hash sets behind a fixed set of iptables rules",
+    "nftables": "Own nftables table of verdict maps, changed in atomic batches"
+}
+
 # رنگ‌های وضعیت
 STATUS_COLORS = {
     "online": "green",
@@ -12,8 +12,22 @@ class DatabaseConfig:
     """تنظیمات پایگاه داده"""
     path: str = str(Path.home() / '.config' / 'rpt-swi' / 'devices.db')
     backup_interval: int = 24  # ساعت
+    backup_pages_per_step: int = 256  # صفحات کپی‌شده در هر گام پشتیبان‌گیری
     cleanup_days: int = 30
-    max_history: int = 1000
+    max_history: int = 1000  # بیشترین تعداد اسکن نگه‌داری‌شده
+    device_retention_days: int = 180  # 0 = حذف نشود
+    retention_batch_size: int = 2000
+    synchronous: str = "NORMAL"  # در حالت WAL امن و سریع است
+    cache_size_kb: int = 20000
+    mmap_size_mb: int = 256
+    history_gap_seconds: int = 900  # فاصله مجاز بین دو مشاهده در یک بازه حضور
+    hourly_rollup_days: int = 90
+    daily_rollup_days: int = 730
+    writer_queue_size: int = 10000  # بیشترین تعداد نوشتن در صف
+    writer_batch_size: int = 500
+    writer_flush_ms: int = 20  # پنجره زمانی commit گروهی
+    profile_queries: bool = False  # زمان‌سنجی پرس‌وجوها (سربار دارد)
+    slow_query_ms: int = 100  # پرس‌وجوهای کندتر در logs/slow_queries.log ثبت می‌شوند
 
 @dataclass
 class ScannerConfig:
@@ -29,6 +43,21 @@ class ScannerConfig:
 class FirewallConfig:
     """تنظیمات فایروال"""
     chain_name: str = "RPT-SWI"
+    backend: str = "iptables"  # iptables: یک قانون برای هر دستگاه، ipset: مجموعه‌های hash، nftables: نگاشت‌های verdict
+    ipset_maxelem: int = 262144
+    nft_table: str = "rpt_swi"
+    temporary_block_seconds: int = 3600  # مدت مسدودسازی موقت (permanent=False)
+    rule_reconcile_seconds: int = 60  # فاصله همگام‌سازی فهرست قوانین حافظه با کرنل (ثانیه)
+    enforce_desired_state: bool = True  # در هر همگام‌سازی، کرنل با قوانین ذخیره‌شده یکسان می‌شود
+    counter_sample_seconds: int = 10  # فاصله نمونه‌برداری شمارنده‌های بسته‌های رد شده
+    counter_history: int = 60  # تعداد نمونه‌های نگه‌داشته در بافر حلقوی
+    drop_alert_pps: int = 0  # هشدار وقتی یک دستگاه بیش از این بسته در ثانیه ارسال کند (0 = خاموش)
+    nflog_group: int = 0  # گروه NFLOG برای ثبت بسته‌های رد شده (0 = خاموش)
+    nflog_flush_seconds: int = 10  # فاصله ذخیره جریان‌های تجمیع‌شده در رویدادها
+    nflog_max_flows: int = 4096  # حداکثر جریان‌های نگه‌داشته در حافظه (LRU)
+    throttle_interface: str = ""  # خالی = رابط مسیر پیش‌فرض
+    throttle_rate: str = "1mbit"  # محدودیت پهنای باند به جای DROP
+    quarantine_rate: str = "256kbit"  # پهنای باند مشترک یک شبکه قرنطینه
     backup_on_change: bool = True
     auto_save_rules: bool = True
     default_action: str = "DROP"
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from datetime import datetime
+
+from src.core.history import DAY, HOUR
+
+WEEK = 7 * DAY
+PERIODS = {
+    'day': DAY,
+    'week': WEEK
+}
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+def _floor(ts, width):
+    return ts - ts % width
+
+def _modules():
+    """numpy and pandas, imported on first use so the rest of the tool runs without them"""
+    try:
+        import numpy
+        import pandas
+    except ImportError:
+        raise RuntimeError("Presence analytics need numpy and pandas (pip install pandas)") from None
+    return numpy, pandas
+
+def split_intervals(np, device_ids, lo, hi, width):
+    """Cut [lo, hi) intervals into width-aligned buckets without a Python loop
+
+    Returns (device_ids, bucket_ts, seconds) arrays with one entry per
+    bucket an interval overlaps, the same split DeviceHistory.rollup does.
+    """
+    first = lo - lo % width
+    counts = np.maximum((hi - first + width - 1) // width, 0)
+    index = np.repeat(np.arange(len(lo)), counts)
+    # Position of each bucket within its own interval: 0, 1, 2, 0, 1, ...
+    offsets = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    buckets = first[index] + offsets * width
+    seconds = np.minimum(hi[index], buckets + width) - np.maximum(lo[index], buckets)
+    keep = seconds > 0
+    return device_ids[index][keep], buckets[keep], seconds[keep]
+
+class PresenceAnalytics:
+    """Fleet presence reports computed on NumPy/pandas columns
+
+    History is read chunk_size rows at a time straight into integer
+    arrays and folded into per-chunk aggregates, so a year of buckets
+    for thousands of devices is never held as Python row objects.
+    """
+
+    def __init__(self, database, chunk_size=100000):
+        self.db = database
+        self.pool = database.pool
+        self.history = database.history
+        self.chunk_size = chunk_size
+
+    def _arrays(self, cursor, sql, params):
+        """Yield each fetchmany() chunk of an all-integer query as a 2-D int64 array"""
+        np, _ = _modules()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            yield np.array(rows, dtype=np.int64)
+
+    def iter_buckets(self, since, until=None, width=DAY, device_id=None):
+        """Yield (device_ids, bucket_ts, seconds) arrays covering [since, until)
+
+        Tiers match DeviceHistory.presence_seconds: daily rollups, then
+        hourly rollups, then raw intervals past the hourly watermark.
+        Hourly buckets are only built from hourly rollups and intervals,
+        so they reach back as far as hourly detail is kept.
+        """
+        np, _ = _modules()
+        since = int(since)
+        until = int(until if until is not None else time.time())
+        device_filter = ' AND device_id = ?' if device_id is not None else ''
+        extra = (device_id,) if device_id is not None else ()
+
+        with self.pool.read() as cursor:
+            watermarks = {
+                DAY: self.history._watermark(cursor, 'daily') or 0,
+                HOUR: self.history._watermark(cursor, 'hourly') or 0
+            }
+            tiers = (DAY, HOUR) if width == DAY else (HOUR,)
+            position = since
+
+            for tier in tiers:
+                start = _floor(position, tier)
+                end = min(_floor(until, tier), watermarks[tier])
+                if start >= end:
+                    continue
+                for chunk in self._arrays(cursor, f'''
+                    SELECT device_id, bucket_ts, seconds_present
+                    FROM device_presence_rollup
+                    WHERE granularity = ? AND bucket_ts >= ? AND bucket_ts < ?{device_filter}
+                ''', (tier, start, end) + extra):
+                    # Hourly buckets folded into days repeat a (device, day) key;
+                    # every consumer aggregates, so that is harmless
+                    yield chunk[:, 0], chunk[:, 1] - chunk[:, 1] % width, chunk[:, 2]
+                position = end
+
+            if position < until:
+                for chunk in self._arrays(cursor, f'''
+                    SELECT device_id, start_ts, end_ts
+                    FROM device_presence
+                    WHERE end_ts >= ? AND start_ts < ?{device_filter}
+                ''', (position, until) + extra):
+                    lo = np.maximum(chunk[:, 1], position)
+                    hi = np.minimum(chunk[:, 2], until)
+                    yield split_intervals(np, chunk[:, 0], lo, hi, width)
+
+    def devices(self):
+        """Device inventory as a DataFrame indexed by device id"""
+        _, pd = _modules()
+        frames = []
+        with self.pool.read() as cursor:
+            cursor.execute('SELECT id, ip, mac, hostname, first_seen, last_seen, trusted FROM devices')
+            columns = [desc[0] for desc in cursor.description]
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                frames.append(pd.DataFrame.from_records(rows, columns=columns))
+        if not frames:
+            return pd.DataFrame(columns=columns).set_index('id')
+        return pd.concat(frames, ignore_index=True).set_index('id')
+
+    def uptime(self, since, until=None):
+        """Per-device uptime over [since, until), heaviest first
+
+        A device is measured from the later of `since` and its first
+        sighting, so a device added last week is not scored against a year.
+        """
+        np, pd = _modules()
+        since = int(since)
+        until = int(until if until is not None else time.time())
+
+        devices = self.devices()
+        devices = devices[devices['first_seen'] < until]
+        seconds = pd.Series(self.history.presence_seconds(since, until), dtype='int64')
+
+        frame = devices.assign(
+            seconds_present=seconds.reindex(devices.index, fill_value=0).astype('int64')
+        )
+        window = (until - np.maximum(frame['first_seen'], since)).clip(lower=1)
+        frame['uptime_pct'] = (frame['seconds_present'] * 100 / window).clip(upper=100).round(2)
+        frame['first_seen'] = pd.to_datetime(frame['first_seen'], unit='s')
+        frame['last_seen'] = pd.to_datetime(frame['last_seen'], unit='s')
+        return frame.sort_values('uptime_pct', ascending=False)
+
+    def heatmap(self, since, until=None, device_id=None, utc_offset=None):
+        """Hour-of-week presence: 7 weekday rows by 24 hour columns
+
+        Fleet-wide cells hold the average number of devices present in
+        that hour; for one device they hold the fraction of the hour it
+        was present. utc_offset (seconds) defaults to the local zone.
+        """
+        np, pd = _modules()
+        until = int(until if until is not None else time.time())
+        if utc_offset is None:
+            utc_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+
+        def cells(hours):
+            # 1970-01-01 was a Thursday, weekday 3 counting from Monday
+            return ((hours // 24 + 3) % 7) * 24 + hours % 24
+
+        present = np.zeros(168)
+        covered_from = None
+        for _, buckets, seconds in self.iter_buckets(since, until, width=HOUR, device_id=device_id):
+            if not len(buckets):
+                continue
+            present += np.bincount(cells((buckets + utc_offset) // HOUR), weights=seconds, minlength=168)
+            first = int(buckets.min())
+            covered_from = first if covered_from is None else min(covered_from, first)
+
+        # Average over the hours actually covered, not over the whole request
+        # range: hourly detail may have been purged from its start
+        hours = np.zeros(168)
+        if covered_from is not None:
+            slots = np.arange((covered_from + utc_offset) // HOUR, (until + utc_offset - 1) // HOUR + 1)
+            hours = np.bincount(cells(slots), minlength=168).astype(float)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = np.where(hours > 0, present / HOUR / hours, 0.0)
+        return pd.DataFrame(average.reshape(7, 24).round(3), index=list(WEEKDAYS), columns=range(24))
+
+    def churn(self, since, until=None, period='week'):
+        """Active, new, churned and returning devices per day or week
+
+        churned counts devices present in the previous period but not in
+        this one; churn_rate divides that by the previous period's active
+        devices and new_rate divides new devices by this period's.
+        """
+        np, pd = _modules()
+        length = PERIODS[period]
+        start = _floor(int(since), DAY)
+        until = int(until if until is not None else time.time())
+        count = max((until - start + length - 1) // length, 1)
+
+        # Unique (device, period) pairs, deduplicated chunk by chunk
+        keys = []
+        for device_ids, buckets, _ in self.iter_buckets(start, until, width=DAY):
+            slot = (buckets - start) // length
+            inside = (slot >= 0) & (slot < count)
+            keys.append(np.unique(device_ids[inside] * count + slot[inside]))
+        keys = np.unique(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+
+        device_ids, rows = np.unique(keys // count, return_inverse=True)
+        active = np.zeros((len(device_ids), count), dtype=bool)
+        active[rows, keys % count] = True
+
+        previous = np.zeros_like(active)
+        previous[:, 1:] = active[:, :-1]
+        seen_before = np.zeros_like(active)
+        seen_before[:, 1:] = np.logical_or.accumulate(active, axis=1)[:, :-1]
+
+        devices = self.devices()
+        first_slot = (devices['first_seen'].to_numpy(dtype='int64') - start) // length
+        new = np.bincount(first_slot[(first_slot >= 0) & (first_slot < count)], minlength=count)
+
+        frame = pd.DataFrame({
+            'period_start': pd.to_datetime(start + np.arange(count) * length, unit='s'),
+            'active': active.sum(axis=0),
+            'new': new,
+            'churned': (previous & ~active).sum(axis=0),
+            'returned': (active & ~previous & seen_before).sum(axis=0)
+        })
+        prior = frame['active'].shift(1)
+        frame['churn_rate'] = (frame['churned'] / prior.where(prior > 0)).round(4)
+        frame['new_rate'] = (frame['new'] / frame['active'].where(frame['active'] > 0)).round(4)
+        # The first period has nothing to churn from
+        frame.loc[0, ['churned', 'returned']] = 0
+        return frame.set_index('period_start')
+
+    def scan_activity(self, since, until=None, period='day'):
+        """Scans per period with average devices found and success rate"""
+        np, pd = _modules()
+        until = int(until if until is not None else time.time())
+        frames = []
+        with self.pool.read() as cursor:
+            for chunk in self._arrays(cursor, '''
+                SELECT scan_time, COALESCE(devices_found, 0), success
+                FROM scans
+                WHERE scan_time >= ? AND scan_time < ?
+            ''', (int(since), until)):
+                frames.append(chunk)
+
+        data = np.concatenate(frames) if frames else np.zeros((0, 3), dtype=np.int64)
+        scans = pd.DataFrame({
+            'time': pd.to_datetime(data[:, 0], unit='s'),
+            'devices_found': data[:, 1],
+            'success': data[:, 2]
+        })
+        # Weeks start on Monday and are labelled by their first day
+        grouped = scans.set_index('time').resample('D' if period == 'day' else 'W-MON', label='left', closed='left')
+        return pd.DataFrame({
+            'scans': grouped.size(),
+            'avg_devices_found': grouped['devices_found'].mean().round(1),
+            'success_rate': grouped['success'].mean().round(3)
+        })
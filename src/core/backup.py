@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from src.config.constants import LIMITS
+from src.core.migrations import SCHEMA_VERSION
+
+HOUR = 3600
+
+class DatabaseBackup:
+    """Online, compressed backups of the device database
+
+    Pages are copied with the SQLite backup API a few hundred at a time
+    from a pinned WAL snapshot, so scans and monitoring keep writing
+    while a backup runs and the copy is still consistent.
+    """
+
+    def __init__(self, db_path, backup_dir=None, max_files=None, pages_per_step=256,
+                 pause=0.005, logger=None):
+        self.db_path = Path(db_path)
+        self.backup_dir = Path(backup_dir) if backup_dir else self.db_path.parent / 'backups'
+        self.max_files = max_files if max_files is not None else LIMITS['max_backup_files']
+        self.pages_per_step = pages_per_step
+        self.pause = pause
+        self.logger = logger or logging.getLogger(__name__)
+        self.prefix = self.db_path.stem + '_'
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _copy(self, target_path, progress=None):
+        """Backup API copy of the live database into target_path"""
+        source = sqlite3.connect(str(self.db_path), isolation_level=None)
+        target = sqlite3.connect(str(target_path))
+        try:
+            # Holding a read transaction pins one snapshot for every step;
+            # otherwise each commit by another connection restarts the copy
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+            def step(status, remaining, total):
+                if progress is not None:
+                    progress(total - remaining, total)
+
+            source.backup(target, pages=self.pages_per_step, progress=step, sleep=self.pause)
+            source.execute('COMMIT')
+
+            # A standalone file is easier to verify and restore than a WAL pair
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+
+    def create(self, progress=None):
+        """Write a new gzip backup and rotate old ones; returns its path"""
+        with self._lock:
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{self.prefix}{datetime.now().strftime('%Y%m%d_%H%M%S')}.db.gz"
+            path = self.backup_dir / name
+
+            started = time.monotonic()
+            fd, raw = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+            os.close(fd)
+            partial = path.with_name(path.name + '.part')
+            try:
+                self._copy(raw, progress)
+                with open(raw, 'rb') as src, gzip.open(partial, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(partial, path)
+            finally:
+                for leftover in (raw, partial):
+                    try:
+                        os.unlink(leftover)
+                    except FileNotFoundError:
+                        pass
+
+            removed = self.rotate()
+            self.logger.info(
+                f"Database backed up to {path} in {time.monotonic() - started:.1f}s"
+                + (f", {len(removed)} old backups removed" if removed else "")
+            )
+            return path
+
+    def list_backups(self):
+        """Backups in backup_dir, newest first"""
+        if not self.backup_dir.exists():
+            return []
+        # Timestamped names sort chronologically
+        return sorted(self.backup_dir.glob(f'{self.prefix}*.db.gz'), reverse=True)
+
+    def rotate(self):
+        """Delete all but the newest max_files backups"""
+        if not self.max_files:
+            return []
+        removed = self.list_backups()[self.max_files:]
+        for path in removed:
+            path.unlink()
+        return removed
+
+    @contextmanager
+    def _extracted(self, backup_path):
+        """Decompress a backup to a temporary file for the duration of the block"""
+        fd, raw = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            with gzip.open(backup_path, 'rb') as src, open(raw, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            yield raw
+        finally:
+            os.unlink(raw)
+
+    def _check(self, raw):
+        conn = sqlite3.connect(f'file:{raw}?mode=ro', uri=True)
+        try:
+            integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            devices = conn.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
+        finally:
+            conn.close()
+
+        ok = integrity == 'ok' and version <= SCHEMA_VERSION
+        if integrity != 'ok':
+            message = f"integrity check failed: {integrity}"
+        elif version > SCHEMA_VERSION:
+            message = f"schema v{version} is newer than this program (v{SCHEMA_VERSION})"
+        else:
+            message = 'ok'
+        return {'ok': ok, 'message': message, 'schema_version': version, 'devices': devices}
+
+    def verify(self, backup_path):
+        """Decompress and integrity-check a backup; returns a report dict"""
+        try:
+            with self._extracted(backup_path) as raw:
+                return self._check(raw)
+        except (OSError, EOFError, sqlite3.Error) as e:
+            return {'ok': False, 'message': str(e), 'schema_version': None, 'devices': None}
+
+    def restore(self, backup_path, connection):
+        """Verify a backup and copy it over the live database
+
+        `connection` is an open connection to the live database; the copy
+        runs in one step so other connections never see a half-restored
+        file. The caller migrates the schema and drops its caches.
+        """
+        with self._lock:
+            with self._extracted(backup_path) as raw:
+                report = self._check(raw)
+                if not report['ok']:
+                    raise ValueError(f"Backup {backup_path} is not usable: {report['message']}")
+
+                source = sqlite3.connect(raw)
+                try:
+                    source.backup(connection)
+                finally:
+                    source.close()
+
+        self.logger.info(f"Database restored from {backup_path}")
+        return report
+
+    def start(self, interval_hours=24):
+        """Back up every interval_hours in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_hours * HOUR):
+                try:
+                    self.create()
+                except Exception as e:
+                    self.logger.error(f"Scheduled backup failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ACTIVE_WINDOW = 86400
+BUCKET = 3600
+
+def to_epoch(value):
+    """Convert a stored timestamp (epoch, datetime or ISO text) to epoch seconds"""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return 0
+
+class DeviceCache:
+    """Process-level device table mirror kept current by write-through"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.version = 0
+
+        self._devices = {}
+        self._by_ip = {}
+        self._by_mac = defaultdict(set)
+        self._by_status = defaultdict(set)
+        self._trusted = set()
+        self._blocked = set()
+
+        # Device ids per hour of last_seen, so "active in the last 24h"
+        # sums 24 bucket sizes and only checks the devices of the hour the
+        # window starts in, instead of scanning the table
+        self._seen_buckets = defaultdict(set)
+        self._ordered = None
+
+    def load(self, rows):
+        """Replace the cache contents with a full table snapshot"""
+        with self.lock:
+            self._devices.clear()
+            self._by_ip.clear()
+            self._by_mac.clear()
+            self._by_status.clear()
+            self._trusted.clear()
+            self._blocked.clear()
+            self._seen_buckets.clear()
+            for row in rows:
+                self._index(row)
+            self._ordered = None
+            self.loaded = True
+            self.version += 1
+
+    def invalidate(self):
+        """Forget everything; the next read reloads from the database"""
+        with self.lock:
+            self.loaded = False
+            self._ordered = None
+            self.version += 1
+
+    def _index(self, device):
+        device_id = device['id']
+        device['_seen'] = to_epoch(device.get('last_seen'))
+        self._devices[device_id] = device
+        self._by_ip[device['ip']] = device_id
+        if device.get('mac'):
+            self._by_mac[device['mac']].add(device_id)
+        self._by_status[device.get('status') or 'unknown'].add(device_id)
+        if device.get('trusted'):
+            self._trusted.add(device_id)
+        if device.get('is_blocked') or device.get('status') == 'blocked':
+            self._blocked.add(device_id)
+        self._seen_buckets[device['_seen'] // BUCKET].add(device_id)
+
+    def _unindex(self, device):
+        device_id = device['id']
+        self._by_ip.pop(device['ip'], None)
+        if device.get('mac'):
+            ids = self._by_mac.get(device['mac'])
+            if ids:
+                ids.discard(device_id)
+                if not ids:
+                    del self._by_mac[device['mac']]
+        ids = self._by_status.get(device.get('status') or 'unknown')
+        if ids:
+            ids.discard(device_id)
+        self._trusted.discard(device_id)
+        self._blocked.discard(device_id)
+        bucket = device['_seen'] // BUCKET
+        ids = self._seen_buckets.get(bucket)
+        if ids:
+            ids.discard(device_id)
+            if not ids:
+                del self._seen_buckets[bucket]
+
+    def put_many(self, rows):
+        """Write through freshly committed device rows"""
+        with self.lock:
+            if not self.loaded:
+                return
+            for row in rows:
+                old = self._devices.get(row['id'])
+                if old is not None:
+                    self._unindex(old)
+                self._index(dict(row))
+            self._ordered = None
+            self.version += 1
+
+    def remove_many(self, device_ids):
+        """Drop deleted devices"""
+        with self.lock:
+            if not self.loaded:
+                return
+            for device_id in device_ids:
+                device = self._devices.pop(device_id, None)
+                if device is not None:
+                    self._unindex(device)
+            self._ordered = None
+            self.version += 1
+
+    def update(self, ip, **fields):
+        """Apply a column change to the device with this IP"""
+        with self.lock:
+            if not self.loaded:
+                return
+            device_id = self._by_ip.get(ip)
+            if device_id is None:
+                return
+            device = self._devices[device_id]
+            self._unindex(device)
+            device.update(fields)
+            self._index(device)
+            self._ordered = None
+            self.version += 1
+
+    def _public(self, device):
+        return {k: v for k, v in device.items() if k != '_seen'}
+
+    def get_all(self):
+        """All devices ordered by last_seen, newest first"""
+        with self.lock:
+            if self._ordered is None:
+                self._ordered = [
+                    self._public(d) for d in
+                    sorted(self._devices.values(), key=lambda d: (d['_seen'], d['id']), reverse=True)
+                ]
+            return list(self._ordered)
+
+    def get_by_ip(self, ip):
+        with self.lock:
+            device_id = self._by_ip.get(ip)
+            return self._public(self._devices[device_id]) if device_id is not None else None
+
+    def get_by_mac(self, mac):
+        with self.lock:
+            return [self._public(self._devices[i]) for i in self._by_mac.get(mac, ())]
+
+    def get_by_status(self, status):
+        with self.lock:
+            return [self._public(self._devices[i]) for i in self._by_status.get(status, ())]
+
+    def get_trusted(self):
+        with self.lock:
+            return [self._public(self._devices[i]) for i in self._trusted]
+
+    def counts(self, now=None):
+        """Precomputed device counts for menus and dashboards"""
+        now = int(now if now is not None else time.time())
+        with self.lock:
+            since = now - ACTIVE_WINDOW
+            first = since // BUCKET
+            active = sum(
+                1 for i in self._seen_buckets.get(first, ())
+                if self._devices[i]['_seen'] >= since
+            )
+            active += sum(
+                len(self._seen_buckets.get(bucket, ()))
+                for bucket in range(first + 1, now // BUCKET + 1)
+            )
+            return {
+                'total': len(self._devices),
+                'active': active,
+                'trusted': len(self._trusted),
+                'blocked': len(self._blocked),
+                'unknown': len(self._by_status.get('unknown', ())),
+                'by_status': {s: len(ids) for s, ids in self._by_status.items() if ids}
+            }
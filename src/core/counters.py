@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from array import array
+
+class DropCounterSampler:
+    """Packet and byte counters of every blocking rule, sampled into a ring
+
+    Each sample is one bulk read (`reader()` -> {target: (packets,
+    bytes)}), whatever the number of rules or set elements: the kernel
+    dumps all counters in a single call, so the sampling cost does not
+    grow with extra forks or syscalls per rule. Cumulative counters are
+    kept per target in fixed-size arrays of `size` slots (16 bytes per
+    slot), and rates are the difference between two slots, so memory is
+    bounded and nothing is allocated per sample once a target is known.
+    """
+
+    def __init__(self, reader, interval=10, size=60, on_sample=None, logger=None):
+        self.reader = reader
+        self.interval = interval
+        self.size = size
+        # on_sample(sampler) runs after every sample, e.g. for alerts
+        self.on_sample = on_sample
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._times = array('d', [0.0]) * size
+        self._packets = {}
+        self._bytes = {}
+        self._count = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, now=None):
+        """Take one sample; returns the number of targets read"""
+        counters = self.reader()
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            slot = self._count % self.size
+            self._times[slot] = now
+            for target in [t for t in self._packets if t not in counters]:
+                # The rule is gone; its history goes with it
+                del self._packets[target]
+                del self._bytes[target]
+            for target, (packets, byte_count) in counters.items():
+                ring = self._packets.get(target)
+                if ring is None:
+                    # Backfilled, so a new rule's first rate starts from now
+                    self._packets[target] = array('Q', [packets]) * self.size
+                    self._bytes[target] = array('Q', [byte_count]) * self.size
+                else:
+                    ring[slot] = packets
+                    self._bytes[target][slot] = byte_count
+            self._count += 1
+
+        if self.on_sample is not None:
+            self.on_sample(self)
+        return len(counters)
+
+    def _slots(self, window):
+        """(newest, oldest) slots spanning about `window` seconds, or None"""
+        available = min(self._count, self.size) - 1
+        if available < 1:
+            return None
+        steps = available if window is None else max(1, min(available, round(window / self.interval)))
+        newest = (self._count - 1) % self.size
+        return newest, (self._count - 1 - steps) % self.size
+
+    def rates(self, window=None):
+        """{target: (packets/s, bytes/s)} over the last `window` seconds (default: all kept)
+
+        A counter that went backwards (rule recreated) counts as zero.
+        """
+        with self._lock:
+            slots = self._slots(window)
+            if slots is None:
+                return {}
+            newest, oldest = slots
+            elapsed = self._times[newest] - self._times[oldest]
+            if elapsed <= 0:
+                return {}
+            return {
+                target: (
+                    max(0, ring[newest] - ring[oldest]) / elapsed,
+                    max(0, self._bytes[target][newest] - self._bytes[target][oldest]) / elapsed
+                )
+                for target, ring in self._packets.items()
+            }
+
+    def top(self, count=10, window=None):
+        """The `count` targets dropping the most packets (all if None): [(target, pps, bps), ...]"""
+        rates = self.rates(window)
+        ranked = sorted(rates.items(), key=lambda item: item[1][0], reverse=True)
+        return [(target, pps, bps) for target, (pps, bps) in ranked[:count] if pps > 0]
+
+    def totals(self, window=None):
+        """(packets/s, bytes/s) dropped over all targets"""
+        rates = self.rates(window).values()
+        return sum(r[0] for r in rates), sum(r[1] for r in rates)
+
+    def start(self):
+        """Sample every interval seconds in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.sample()
+                except Exception as e:
+                    self.logger.error(f"Firewall counter sample failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-counters', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
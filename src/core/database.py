@@ -4,19 +4,165 @@
 import sqlite3
 import json
 import logging
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 import threading
+import time
+
+from src.core.analytics import PresenceAnalytics
+from src.core.backup import DatabaseBackup
+from src.core.cache import DeviceCache
+from src.core.exporter import StreamingExporter
+from src.core.history import DeviceHistory
+from src.core.importer import DeviceImporter
+from src.core.journal import EventJournal
+from src.core.migrations import migrate
+from src.core.profiler import QueryProfiler
+from src.core.retention import RetentionJob
+from src.core.rule_journal import FirewallRuleJournal
+from src.core.statistics import read_counters, recompute_counters
+from src.core.writer import WriteQueue
+
+FTS_INSERT_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS devices_fts_insert AFTER INSERT ON devices BEGIN
+        INSERT INTO devices_fts (rowid, ip, mac, hostname, vendor, notes)
+        VALUES (new.id, new.ip, new.mac, new.hostname, new.vendor, new.notes);
+    END
+'''
+
+class ConnectionManager:
+    """Per-thread SQLite connections sharing one WAL-mode database"""
+    
+    def __init__(self, db_path, synchronous='NORMAL', cache_size_kb=20000,
+                 mmap_size_mb=256, busy_timeout_ms=5000, profiler=None):
+        self.db_path = str(db_path)
+        # Optional QueryProfiler; every connection opened here reports to it
+        self.profiler = profiler
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.busy_timeout_ms = busy_timeout_ms
+        
+        # Readers never take this lock; it only serializes writers so
+        # that BEGIN IMMEDIATE does not spin on SQLITE_BUSY
+        self.write_lock = threading.RLock()
+        
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        
+        # journal_mode=WAL is persistent, so set it once up front;
+        # auto_vacuum only takes effect on a database with no tables yet
+        conn = self.connection()
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+    
+    def _connect(self):
+        """Open a connection and apply the tuning pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            **(self.profiler.connect_kwargs() if self.profiler else {})
+        )
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size_mb) * 1024 * 1024}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def connection(self):
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                # Drop connections owned by threads that have exited
+                # (scanner pools come and go between scans)
+                alive = []
+                for thread, other in self._connections:
+                    if thread.is_alive():
+                        alive.append((thread, other))
+                    else:
+                        other.close()
+                alive.append((threading.current_thread(), conn))
+                self._connections = alive
+        return conn
+    
+    @contextmanager
+    def read(self):
+        """Cursor for read-only statements; runs concurrently with writers"""
+        cursor = self.connection().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    
+    @contextmanager
+    def transaction(self):
+        """Cursor inside a single write transaction, committed on exit"""
+        with self.write_lock:
+            conn = self.connection()
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                cursor.close()
+    
+    def close_all(self):
+        """Close every connection opened by this manager"""
+        with self._connections_lock:
+            for _, conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
 
 class DeviceDatabase:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, config=None, profiler=None):
         if not db_path:
-            config_dir = Path.home() / '.config' / 'rpt-swi'
-            config_dir.mkdir(parents=True, exist_ok=True)
-            db_path = config_dir / 'devices.db'
+            if config is not None:
+                db_path = Path(config.path).expanduser()
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+            else:
+                config_dir = Path.home() / '.config' / 'rpt-swi'
+                config_dir.mkdir(parents=True, exist_ok=True)
+                db_path = config_dir / 'devices.db'
         
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.config = config
+        self.cache = DeviceCache()
+        
+        # Query profiling is off unless enabled in the config or passed in
+        if profiler is None and config is not None and config.profile_queries:
+            profiler = QueryProfiler(
+                threshold_ms=config.slow_query_ms,
+                log_file=Path(db_path).parent / 'logs' / 'slow_queries.log'
+            )
+        self.profiler = profiler
+        
+        if config is not None:
+            self.pool = ConnectionManager(
+                db_path,
+                synchronous=config.synchronous,
+                cache_size_kb=config.cache_size_kb,
+                mmap_size_mb=config.mmap_size_mb,
+                profiler=profiler
+            )
+        else:
+            self.pool = ConnectionManager(db_path, profiler=profiler)
         
         # Setup logger
         self.logger = logging.getLogger('rpt_swi_db')
@@ -28,6 +174,65 @@ class DeviceDatabase:
             self.logger.addHandler(handler)
         
         self._init_database()
+        
+        # Small fire-and-forget writes (status changes, scan records) are
+        # group-committed by one writer thread instead of the caller's
+        if config is not None:
+            self.writer = WriteQueue(
+                self.pool.transaction,
+                lock=self.pool.write_lock,
+                max_queue=config.writer_queue_size,
+                batch_size=config.writer_batch_size,
+                flush_interval=config.writer_flush_ms / 1000,
+                logger=self.logger
+            )
+        else:
+            self.writer = WriteQueue(self.pool.transaction, lock=self.pool.write_lock, logger=self.logger)
+        
+        # Events ride the same queue, so a burst of them is one commit
+        self.journal = EventJournal(self.writer, self.pool.read)
+        # Saved firewall rules, appended and retired through the same queue
+        self.firewall_rules = FirewallRuleJournal(self.writer, self.pool.read)
+        
+        if config is not None:
+            self.history = DeviceHistory(
+                self,
+                gap_seconds=config.history_gap_seconds,
+                retention_days=config.cleanup_days,
+                hourly_rollup_days=config.hourly_rollup_days,
+                daily_rollup_days=config.daily_rollup_days
+            )
+        else:
+            self.history = DeviceHistory(self)
+        
+        if config is not None:
+            self.retention = RetentionJob(
+                self,
+                cleanup_days=config.cleanup_days,
+                max_history=config.max_history,
+                device_days=config.device_retention_days,
+                batch_size=config.retention_batch_size
+            )
+        else:
+            self.retention = RetentionJob(self)
+        # Also rolls up presence history, so it runs even when cleanup_days = 0
+        self.retention.start()
+        
+        # numpy/pandas are only imported when a report is first asked for
+        self.analytics = PresenceAnalytics(self)
+        
+        if config is not None:
+            self.backup = DatabaseBackup(
+                db_path,
+                pages_per_step=config.backup_pages_per_step,
+                logger=self.logger
+            )
+        else:
+            self.backup = DatabaseBackup(db_path, logger=self.logger)
+        # backup_interval = 0 turns scheduled backups off
+        backup_interval = config.backup_interval if config is not None else 24
+        if backup_interval:
+            self.backup.start(backup_interval)
     
     def log(self, message, level='info'):
         """Log a message"""
@@ -42,119 +247,480 @@ class DeviceDatabase:
     
     def _init_database(self):
         """Initialize database tables"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+        with self.pool.transaction() as cursor:
+            old_version, new_version = migrate(cursor)
+            if old_version != new_version:
+                self.log(f"Migrated database schema v{old_version} -> v{new_version}", "info")
             
-            # Devices table
+            self.fts_enabled = self._init_search_index(cursor)
+        
+        self.log("Database initialized", "info")
+    
+    def _init_search_index(self, cursor):
+        """Create the FTS5 trigram index over device text columns"""
+        try:
+            cursor.execute('SAVEPOINT fts_init')
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'devices_fts'")
+            exists = cursor.fetchone() is not None
+            
+            # Trigram tokens give substring (and so prefix) matching on
+            # IPs, MACs and hostnames; the index stores no copy of the rows
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ip TEXT UNIQUE NOT NULL,
-                    mac TEXT,
-                    hostname TEXT,
-                    vendor TEXT,
-                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'unknown',
-                    trusted BOOLEAN DEFAULT 0
+                CREATE VIRTUAL TABLE IF NOT EXISTS devices_fts USING fts5(
+                    ip, mac, hostname, vendor, notes,
+                    content='devices', content_rowid='id',
+                    tokenize='trigram'
                 )
             ''')
             
-            # Network scans table
+            cursor.execute(FTS_INSERT_TRIGGER)
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS scans (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    devices_found INTEGER,
-                    duration_seconds REAL
-                )
+                CREATE TRIGGER IF NOT EXISTS devices_fts_delete AFTER DELETE ON devices BEGIN
+                    INSERT INTO devices_fts (devices_fts, rowid, ip, mac, hostname, vendor, notes)
+                    VALUES ('delete', old.id, old.ip, old.mac, old.hostname, old.vendor, old.notes);
+                END
+            ''')
+            # Scans rewrite last_seen constantly; only reindex on text changes
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS devices_fts_update AFTER UPDATE ON devices
+                WHEN old.ip IS NOT new.ip OR old.mac IS NOT new.mac
+                  OR old.hostname IS NOT new.hostname OR old.vendor IS NOT new.vendor
+                  OR old.notes IS NOT new.notes
+                BEGIN
+                    INSERT INTO devices_fts (devices_fts, rowid, ip, mac, hostname, vendor, notes)
+                    VALUES ('delete', old.id, old.ip, old.mac, old.hostname, old.vendor, old.notes);
+                    INSERT INTO devices_fts (rowid, ip, mac, hostname, vendor, notes)
+                    VALUES (new.id, new.ip, new.mac, new.hostname, new.vendor, new.notes);
+                END
             ''')
             
-            # Create indexes
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_ip ON devices(ip)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_mac ON devices(mac)')
+            if not exists:
+                cursor.execute("INSERT INTO devices_fts (devices_fts) VALUES ('rebuild')")
             
-            conn.commit()
-            conn.close()
+            cursor.execute('RELEASE fts_init')
+            return True
             
-            self.log("Database initialized", "info")
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5 or older than 3.34 (no trigram)
+            cursor.execute('ROLLBACK TO fts_init')
+            cursor.execute('RELEASE fts_init')
+            self.log(f"Full-text search unavailable, using LIKE: {e}", "warning")
+            return False
+    
+    @contextmanager
+    def deferred_search_index(self, cursor):
+        """Index devices inserted inside the block in one pass, not per row
+        
+        Must run inside a write transaction: the insert trigger is dropped
+        and recreated within it, so other connections never see it missing.
+        """
+        if not self.fts_enabled:
+            yield
+            return
+        
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM devices')
+        last_id = cursor.fetchone()[0]
+        cursor.execute('DROP TRIGGER IF EXISTS devices_fts_insert')
+        yield
+        # AUTOINCREMENT ids only grow, so new rows are exactly id > last_id
+        cursor.execute('''
+            INSERT INTO devices_fts (rowid, ip, mac, hostname, vendor, notes)
+            SELECT id, ip, mac, hostname, vendor, notes FROM devices WHERE id > ?
+        ''', (last_id,))
+        cursor.execute(FTS_INSERT_TRIGGER)
     
     def add_or_update_device(self, device_info):
         """Add or update device information"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if device exists
-            cursor.execute('SELECT id FROM devices WHERE ip = ?', (device_info['ip'],))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Update existing device
-                cursor.execute('''
-                    UPDATE devices SET
-                        mac = COALESCE(?, mac),
-                        hostname = COALESCE(?, hostname),
-                        vendor = COALESCE(?, vendor),
-                        last_seen = ?
-                    WHERE ip = ?
-                ''', (
-                    device_info.get('mac'),
-                    device_info.get('hostname'),
-                    device_info.get('vendor'),
-                    datetime.now(),
-                    device_info['ip']
-                ))
-            else:
-                # Insert new device
-                cursor.execute('''
-                    INSERT INTO devices 
-                    (ip, mac, hostname, vendor, first_seen, last_seen)
+        return self.upsert_devices([device_info])
+    
+    def upsert_devices(self, devices):
+        """Add or update a whole scan's devices in one transaction"""
+        # Last entry wins when a scan reports the same IP twice
+        by_ip = {}
+        for device in devices:
+            if device.get('ip'):
+                by_ip[device['ip']] = device
+        
+        if not by_ip:
+            return {'new': 0, 'updated': 0}
+        
+        now = int(time.time())
+        rows = [
+            (ip, d.get('mac'), d.get('hostname'), d.get('vendor'), now, now)
+            for ip, d in by_ip.items()
+        ]
+        
+        # Hold the writer lock until the cache is updated so concurrent
+        # writers cannot apply their rows to the cache out of order
+        with self.pool.write_lock:
+            with self.pool.transaction() as cursor:
+                ips = list(by_ip)
+                existing = self._device_ids(cursor, ips)
+                
+                cursor.executemany('''
+                    INSERT INTO devices (ip, mac, hostname, vendor, first_seen, last_seen)
                     VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    device_info['ip'],
-                    device_info.get('mac'),
-                    device_info.get('hostname'),
-                    device_info.get('vendor'),
-                    datetime.now(),
-                    datetime.now()
-                ))
-            
-            conn.commit()
-            conn.close()
+                    ON CONFLICT(ip) DO UPDATE SET
+                        mac = COALESCE(excluded.mac, mac),
+                        hostname = COALESCE(excluded.hostname, hostname),
+                        vendor = COALESCE(excluded.vendor, vendor),
+                        last_seen = excluded.last_seen
+                ''', rows)
+                
+                added = self._device_ids(cursor, [ip for ip in ips if ip not in existing])
+                device_ids = list(existing.values()) + list(added.values())
+                self.history.record_sightings(cursor, device_ids, now)
+                
+                changed = self._fetch_devices(cursor, device_ids) if self.cache.loaded else []
             
-            self.log(f"Device {'updated' if existing else 'added'}: {device_info['ip']}", "info")
+            self.cache.put_many(changed)
+        
+
+        if added:
+            self.journal.append_many(
+                {
+                    'event_type': 'device_new',
+                    'source': 'scanner',
+                    'data': {'ip': ip, 'mac': by_ip[ip].get('mac'), 'vendor': by_ip[ip].get('vendor')},
+                    'ts': now
+                }
+                for ip in added
+            )
+        
+        counts = {'new': len(added), 'updated': len(existing)}
+        self.log(f"Saved {len(rows)} devices ({counts['new']} new, {counts['updated']} updated)", "info")
+        return counts
+    
+    def _device_ids(self, cursor, ips, chunk_size=500):
+        """Map each ip already present in the devices table to its id"""
+        ids = {}
+        for i in range(0, len(ips), chunk_size):
+            chunk = ips[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT ip, id FROM devices WHERE ip IN ({placeholders})', chunk)
+            ids.update(cursor.fetchall())
+        return ids
+    
+    def _fetch_devices(self, cursor, device_ids, chunk_size=500):
+        """Read full device rows by id"""
+        devices = []
+        for i in range(0, len(device_ids), chunk_size):
+            chunk = device_ids[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT * FROM devices WHERE id IN ({placeholders})', chunk)
+            columns = [desc[0] for desc in cursor.description]
+            devices.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+        return devices
+    
+    def _ensure_cache(self):
+        """Load the device cache from the table on first use"""
+        if self.cache.loaded:
+            return
+        # Taking the writer lock keeps a concurrent upsert from committing
+        # between this snapshot and the cache becoming visible to it
+        with self.pool.write_lock, self.cache.lock:
+            if self.cache.loaded:
+                return
+            with self.pool.read() as cursor:
+                cursor.execute('SELECT * FROM devices')
+                columns = [desc[0] for desc in cursor.description]
+                self.cache.load(dict(zip(columns, row)) for row in cursor.fetchall())
+    
+    def get_device(self, ip):
+        """Get a single device by IP"""
+        self._ensure_cache()
+        return self.cache.get_by_ip(ip)
     
     def get_all_devices(self):
         """Get all devices"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM devices ORDER BY last_seen DESC')
+        self._ensure_cache()
+        return self.cache.get_all()
+    
+    def get_devices_by_status(self, status):
+        """Get devices with the given status"""
+        self._ensure_cache()
+        return self.cache.get_by_status(status)
+    
+    def get_trusted_devices(self):
+        """Get devices on the whitelist"""
+        self._ensure_cache()
+        return self.cache.get_trusted()
+    
+    def get_flagged_devices(self):
+        """Blocked or whitelisted devices, read from the table
+        
+        Bypasses the cache, so flags written by another process (the
+        standalone src/main.py shares this database) count too.
+        """
+        with self.pool.read() as cursor:
+            cursor.execute('''
+                SELECT ip, mac, is_blocked, trusted FROM devices
+                WHERE is_blocked = 1 OR trusted = 1
+            ''')
             columns = [desc[0] for desc in cursor.description]
-            devices = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
-            conn.close()
-            return devices
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
-    def update_device_status(self, ip, status):
-        """Update device status"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+    def get_device_counts(self):
+        """Get total/active/blocked/trusted device counts"""
+        self._ensure_cache()
+        return self.cache.counts()
+    
+    def _page_filter(self, after, status=None, trusted=None, prefix='d.'):
+        """WHERE clause for a keyset page ordered by (last_seen, id) DESC"""
+        clauses = []
+        params = []
+        if status is not None:
+            clauses.append(f'{prefix}status = ?')
+            params.append(status)
+        if trusted is not None:
+            clauses.append(f'{prefix}trusted = ?')
+            params.append(1 if trusted else 0)
+        if after is not None:
+            clauses.append(f'({prefix}last_seen, {prefix}id) < (?, ?)')
+            params.extend(after)
+        return clauses, params
+    
+    def _page_result(self, cursor, limit):
+        columns = [desc[0] for desc in cursor.description]
+        devices = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        has_more = len(devices) > limit
+        devices = devices[:limit]
+        next_key = (devices[-1]['last_seen'], devices[-1]['id']) if has_more else None
+        return {'devices': devices, 'next': next_key}
+    
+    def list_devices_page(self, after=None, limit=50, status=None, trusted=None):
+        """One page of devices, newest first
+
+        Pass the returned 'next' key as `after` to get the following page;
+        each page is an index range scan, so deep pages cost the same as
+        the first one.
+        """
+        clauses, params = self._page_filter(None, status, trusted)
+        
+        if after is None:
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+            sql = f'''
+                SELECT d.* FROM devices d
+                {where}
+                ORDER BY d.last_seen DESC, d.id DESC
+                LIMIT ?
+            '''
+            params = params + [limit + 1]
+        else:
+            # One scan stamps every device with the same last_seen, so the
+            # ties and the older rows are two separate index seeks instead
+            # of one range that walks all the ties before the cursor
+            ties = ' AND '.join(clauses + ['d.last_seen = ?', 'd.id < ?'])
+            older = ' AND '.join(clauses + ['d.last_seen < ?'])
+            sql = f'''
+                SELECT * FROM (
+                    SELECT d.* FROM devices d WHERE {ties}
+                    ORDER BY d.id DESC LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT d.* FROM devices d WHERE {older}
+                    ORDER BY d.last_seen DESC, d.id DESC LIMIT ?
+                )
+                ORDER BY last_seen DESC, id DESC
+                LIMIT ?
+            '''
+            params = (params + [after[0], after[1], limit + 1]
+                      + params + [after[0], limit + 1, limit + 1])
+        
+        with self.pool.read() as cursor:
+            cursor.execute(sql, params)
+            return self._page_result(cursor, limit)
+    
+    def search_devices(self, query, after=None, limit=50):
+        """Search IP, MAC, hostname, vendor and notes by substring or prefix"""
+        query = (query or '').strip()
+        if not query:
+            return self.list_devices_page(after=after, limit=limit)
+        
+        clauses, params = self._page_filter(after)
+        
+        # Trigram tokens need at least three characters to match
+        if self.fts_enabled and len(query) >= 3:
+            clauses.insert(0, 'devices_fts MATCH ?')
+            params.insert(0, '"' + query.replace('"', '""') + '"')
+            source = 'devices d JOIN devices_fts ON devices_fts.rowid = d.id'
+        else:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            columns = ['d.ip', 'd.mac', 'd.hostname', 'd.vendor', 'd.notes']
+            clauses.insert(0, '(' + ' OR '.join(f"{c} LIKE ? ESCAPE '\\'" for c in columns) + ')')
+            params[0:0] = [pattern] * len(columns)
+            source = 'devices d'
+        
+        with self.pool.read() as cursor:
+            cursor.execute(f'''
+                SELECT d.* FROM {source}
+                WHERE {' AND '.join(clauses)}
+                ORDER BY d.last_seen DESC, d.id DESC
+                LIMIT ?
+            ''', params + [limit + 1])
+            return self._page_result(cursor, limit)
+    
+    def update_device_status(self, ip, status, wait=True):
+        """Update device status
+
+        With wait=False the change is queued and the cache follows once
+        the writer commits it.
+        """
+        blocked = 1 if status == 'blocked' else 0
+        
+        def on_commit(updated):
+            self.cache.update(ip, status=status, is_blocked=blocked)
+            # Logged once committed, so a queued update is not reported early
+            self.log(f"Updated device status: {ip} -> {status}", "info")
+        
+        result = self.writer.execute(
+            'UPDATE devices SET status = ?, is_blocked = ? WHERE ip = ?',
+            (status, blocked, ip),
+            wait=wait,
+            on_commit=on_commit
+        )
+        return result > 0 if wait else result
+    
+    def update_devices_status(self, ips, status, wait=True):
+        """Update the status of many devices in one transaction"""
+        ips = list(dict.fromkeys(ips))
+        return self.writer.call(
+            lambda cursor: self.write_devices_status(cursor, ips, status),
+            wait=wait,
+            on_commit=lambda updated: self.devices_status_committed(ips, status)
+        )
+    
+    def write_devices_status(self, cursor, ips, status):
+        """Set the status of ips inside the caller's writer transaction
+        
+        The caller runs devices_status_committed(ips, status) on commit.
+        """
+        blocked = 1 if status == 'blocked' else 0
+        cursor.executemany(
+            'UPDATE devices SET status = ?, is_blocked = ? WHERE ip = ?',
+            [(status, blocked, ip) for ip in ips]
+        )
+        return cursor.rowcount
+    
+    def devices_status_committed(self, ips, status):
+        """Bring the cache in line with a committed write_devices_status"""
+        blocked = 1 if status == 'blocked' else 0
+        for ip in ips:
+            self.cache.update(ip, status=status, is_blocked=blocked)
+        self.log(f"Updated status of {len(ips)} devices -> {status}", "info")
+    
+    def set_device_trusted(self, ip, trusted=True, wait=True):
+        """Mark a device as trusted or untrusted"""
+        flag = 1 if trusted else 0
+        
+        def on_commit(updated):
+            self.cache.update(ip, trusted=flag)
+            self.log(f"Updated device trust: {ip} -> {'trusted' if trusted else 'untrusted'}", "info")
+        
+        result = self.writer.execute(
+            'UPDATE devices SET trusted = ? WHERE ip = ?',
+            (flag, ip),
+            wait=wait,
+            on_commit=on_commit
+        )
+        return result > 0 if wait else result
+    
+    def add_trusted_device(self, device_info):
+        """Add a device (if unknown) and mark it as trusted"""
+        self.upsert_devices([device_info])
+        return self.set_device_trusted(device_info['ip'], True)
+    
+    def add_scan_record(self, devices_found, duration, interface=None, scan_type=None, wait=False):
+        """Record a finished scan; queued unless wait=True"""
+        return self.writer.execute('''
+            INSERT INTO scans (scan_time, devices_found, duration_seconds, interface, scan_type)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (int(time.time()), devices_found, duration, interface, scan_type), wait=wait)
+    
+    def get_recent_scans(self, limit=10):
+        """Latest scans, newest first"""
+        with self.pool.read() as cursor:
             cursor.execute(
-                'UPDATE devices SET status = ? WHERE ip = ?',
-                (status, ip)
+                'SELECT * FROM scans ORDER BY scan_time DESC, id DESC LIMIT ?',
+                (limit,)
             )
-            
-            conn.commit()
-            conn.close()
-            
-            self.log(f"Updated device status: {ip} -> {status}", "info")
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    def get_statistics(self):
+        """Dashboard counters, read from stats_counters instead of counted"""
+        with self.pool.read() as cursor:
+            stats = read_counters(cursor)
+        stats['active_devices'] = self.get_device_counts()['active']
+        return stats
+    
+    def recompute_statistics(self):
+        """Rebuild the statistics counters from the tables"""
+        with self.pool.transaction() as cursor:
+            stats = recompute_counters(cursor)
+        self.log("Statistics counters recomputed", "info")
+        return stats
+    
+    def add_notification(self, notification, wait=False):
+        """Store a notification; it counts as unread until marked read"""
+        return self.writer.execute('''
+            INSERT INTO notifications (created_at, type, title, message, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            int(notification.get('timestamp') or time.time()),
+            notification.get('type'),
+            notification.get('title'),
+            notification.get('message'),
+            json.dumps(notification, default=str)
+        ), wait=wait)
+    
+    def log_event(self, event_type, data=None, source=None, severity='info', wait=False):
+        """Append an event to the journal; queued unless wait=True"""
+        return self.journal.append(event_type, data, source=source, severity=severity, wait=wait)
+    
+    def mark_notifications_read(self):
+        """Mark every stored notification as read"""
+        return self.writer.execute(
+            'UPDATE notifications SET is_read = 1 WHERE is_read = 0',
+            wait=True
+        )
+    
+    def import_devices(self, path, dry_run=False, report_path=None):
+        """Bulk-load a CSV/JSONL device inventory; see DeviceImporter.run"""
+        return DeviceImporter(self).run(path, dry_run=dry_run, report_path=report_path)
+    
+    def export(self, table, destination, **options):
+        """Stream a table to a file; see StreamingExporter.export for options"""
+        self.writer.flush()
+        count = StreamingExporter(self.pool.read).export(table, destination, **options)
+        self.log(f"Exported {count} {table} rows to {destination}", "info")
+        return count
+    
+    def backup_database(self, progress=None):
+        """Write a compressed online backup; returns its path"""
+        # Queued writes belong in the backup
+        self.writer.flush()
+        return self.backup.create(progress)
+    
+    def restore_database(self, backup_path):
+        """Replace the database contents with a verified backup"""
+        self.writer.flush()
+        with self.pool.write_lock:
+            report = self.backup.restore(backup_path, self.pool.connection())
+            # Older backups are brought up to the current schema
+            with self.pool.transaction() as cursor:
+                old_version, new_version = migrate(cursor)
+            self.cache.invalidate()
+        
+        if old_version != new_version:
+            self.log(f"Migrated restored database v{old_version} -> v{new_version}", "info")
+        return report
     
     def close(self):
         """Close database connection"""
+        self.backup.stop()
+        self.retention.stop()
+        self.writer.close()
+        self.pool.close_all()
         self.log("Database connection closed", "info")
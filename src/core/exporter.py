@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from pathlib import Path
+
+from src.core.journal import decode_payload
+
+# Exportable tables: time column used for since/until, optional extra
+# filter column, and the column rows stream in (an indexed one, so no
+# filter combination makes SQLite sort the whole result in memory)
+TABLES = {
+    'devices': {'time': 'last_seen', 'filter': 'status', 'order': 'last_seen'},
+    'scans': {'time': 'scan_time', 'filter': 'scan_type', 'order': 'scan_time'},
+    'events': {'time': 'event_time', 'filter': 'event_type', 'order': 'event_time'},
+    'firewall_rules': {'time': 'created_at', 'filter': 'rule_type', 'order': 'id'}
+}
+
+FORMATS = ('ndjson', 'csv', 'json')
+COMPRESSIONS = ('gzip', 'zstd')
+
+_SUFFIXES = {
+    '.jsonl': 'ndjson',
+    '.ndjson': 'ndjson',
+    '.csv': 'csv',
+    '.json': 'json'
+}
+
+def detect_format(path):
+    """(format, compression) implied by a file name such as events.jsonl.gz"""
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    compression = None
+    if suffixes and suffixes[-1] in ('.gz', '.zst'):
+        compression = 'gzip' if suffixes.pop() == '.gz' else 'zstd'
+    fmt = _SUFFIXES.get(suffixes[-1]) if suffixes else None
+    return fmt or 'ndjson', compression
+
+def _open_output(path, compression):
+    """Binary file object for path, compressing on the fly"""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd output needs the 'zstandard' package (pip install zstandard)") from None
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+class StreamingExporter:
+    """Writes a table to NDJSON, CSV or JSON one batch of rows at a time
+
+    Rows come from a single read cursor drained with fetchmany(), so the
+    export sees one consistent snapshot and memory stays at one batch
+    however large the table is.
+    """
+
+    def __init__(self, read, batch_size=1000):
+        # read() must return a context manager yielding a cursor
+        self.read = read
+        self.batch_size = batch_size
+
+    def _query(self, table, since=None, until=None, value=None):
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}' (expected one of {', '.join(TABLES)})")
+        spec = TABLES[table]
+
+        where = []
+        params = []
+        if since is not None:
+            where.append(f"{spec['time']} >= ?")
+            params.append(int(since))
+        if until is not None:
+            where.append(f"{spec['time']} < ?")
+            params.append(int(until))
+        if value is not None:
+            where.append(f"{spec['filter']} = ?")
+            params.append(value)
+
+        sql = f'SELECT * FROM {table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return sql + f" ORDER BY {spec['order']}", params
+
+    def _drain(self, cursor):
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def iter_rows(self, table, since=None, until=None, value=None):
+        """Yield rows as dicts; `value` filters on TABLES[table]['filter']"""
+        sql, params = self._query(table, since, until, value)
+        with self.read() as cursor:
+            cursor.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            for row in self._drain(cursor):
+                yield dict(zip(columns, row))
+
+    def export(self, table, destination, fmt=None, compression=None,
+               since=None, until=None, value=None):
+        """Export table to a path; format and compression default from its name
+
+        Returns the number of rows written. The file is written to a
+        temporary name and renamed, so a failed export leaves nothing behind.
+        """
+        destination = Path(destination)
+        detected_fmt, detected_compression = detect_format(destination)
+        fmt = fmt or detected_fmt
+        compression = compression if compression is not None else detected_compression
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'")
+        if compression not in (None,) + COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+
+        partial = destination.with_name(destination.name + '.part')
+        try:
+            with _open_output(partial, compression) as raw:
+                with io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+                    count = self.write(out, table, fmt, since=since, until=until, value=value)
+            partial.replace(destination)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return count
+
+    def write(self, out, table, fmt='ndjson', since=None, until=None, value=None):
+        """Stream rows into an open text file; returns the row count"""
+        sql, params = self._query(table, since, until, value)
+        with self.read() as cursor:
+            cursor.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            rows = self._drain(cursor)
+            if fmt == 'csv':
+                return self._write_csv(out, columns, rows)
+            if fmt == 'json':
+                return self._write_document(out, table, columns, rows)
+            return self._write_lines(out, table, columns, rows)
+
+    def _records(self, table, columns, rows):
+        # Event payloads are nested as objects instead of escaped strings
+        decode = table == 'events'
+        for row in rows:
+            record = dict(zip(columns, row))
+            if decode:
+                record['event_data'] = decode_payload(record['event_data'])
+            yield json.dumps(record, separators=(',', ':'), default=str)
+
+    def _write_csv(self, out, columns, rows):
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    def _write_lines(self, out, table, columns, rows):
+        count = 0
+        for line in self._records(table, columns, rows):
+            out.write(line + '\n')
+            count += 1
+        return count
+
+    def _write_document(self, out, table, columns, rows):
+        # Same document shape as the old in-memory export; the total
+        # follows the rows because it is only known at the end
+        out.write(f'{{"export_time": {json.dumps(datetime.now().isoformat())}, "{table}": [')
+        count = 0
+        for line in self._records(table, columns, rows):
+            out.write((',\n' if count else '\n') + line)
+            count += 1
+        if count:
+            out.write('\n')
+        out.write(f'], "total_{table}": {count}}}\n')
+        return count
@@ -1,58 +1,389 @@
 #!/usr/bin/env python3
 
 import subprocess
-import iptc
-import json
 import time
 from pathlib import Path
 
+from src.core.counters import DropCounterSampler
+from src.core.ipset import IpsetBlocklist, classify
+from src.core.nflog import EVENT_TYPE as BLOCKED_TRAFFIC, NflogListener, nflog_spec
+from src.core.nftables import NftablesBlocklist
+from src.core.rule_index import SET, RuleIndex, parse_iptables_counters, parse_iptables_save, rule_keys
+from src.core.scheduler import EXPIRE, START, BlockScheduler
+from src.core.throttle import DeviceThrottle, normalize_rate, rate_bits
+
+# Saved rule types lifted by an unblock; throttles are lifted separately
+BLOCK_RULES = ('block', 'block_ip')
+
+# A target over the drop alert threshold is reported at most this often
+DROP_ALERT_COOLDOWN = 600
+
+# Rules changed this recently are left alone by the desired-state sync:
+# their journal write may still be on its way
+SYNC_GRACE_SECONDS = 30
+
+def _is_live(rule, now):
+    """Whether a saved rule's [starts_at, expires_at) window contains now"""
+    return (rule.get('starts_at') or 0) <= now and (rule.get('expires_at') or now + 1) > now
+
 class FirewallManager:
-    def __init__(self, database):
+    def __init__(self, database, config=None):
         self.db = database
         self.logger = database.logger
         self.rules_file = Path.home() / '.config' / 'rpt-swi' / 'firewall_rules.json'
+        
+        # Drop rules also copy packets to this NFLOG group (0 = off)
+        self.nflog_group = config.nflog_group if config is not None else 0
+        if self.nflog_group and config.backend == 'nftables':
+            self.logger.error("Blocked traffic logging needs the iptables or ipset backend")
+            self.nflog_group = 0
+        
+        # With the ipset and nftables backends blocked addresses live in
+        # kernel sets/maps behind a fixed number of rules
+        self.blocklist = None
+        if config is not None and config.backend == 'ipset':
+            self.blocklist = IpsetBlocklist(config.chain_name, maxelem=config.ipset_maxelem,
+                                            log_group=self.nflog_group)
+        elif config is not None and config.backend == 'nftables':
+            self.blocklist = NftablesBlocklist(config.nft_table)
+        
+        # Bandwidth limits as an alternative to DROP; set up on first use
+        if config is not None:
+            self.throttle = DeviceThrottle(
+                interface=config.throttle_interface or None,
+                backend='nftables' if config.backend == 'nftables' else 'ipset',
+                table=config.nft_table,
+                rate=config.throttle_rate
+            )
+            self.quarantine_rate = config.quarantine_rate
+        else:
+            self.throttle = DeviceThrottle()
+            self.quarantine_rate = '256kbit'
+        
+        # Blocks made with permanent=False expire after this long
+        self.temporary_block_seconds = config.temporary_block_seconds if config is not None else 3600
+        
+        # Every rule we hold, kept in memory; lookups and status never fork
+        self.index = RuleIndex(self._kernel_rules)
+        self._recent_changes = {}
         self._ensure_iptables_chain()
+        self._import_rules_file()
+        self.restore_saved_rules()
+        # Either just refresh the index or also enforce the saved rules on the kernel
+        enforce = config.enforce_desired_state if config is not None else True
+        self.index.start(
+            config.rule_reconcile_seconds if config is not None else 60,
+            task=self._sync_in_background if enforce else None
+        )
+        
+        # Scheduled starts and expiries, rebuilt from the saved rules
+        self.scheduler = BlockScheduler(self._run_scheduled)
+        self._load_schedule()
+        self.scheduler.start()
+        
+        # Drop counters of every rule, one bulk read per sample
+        self.drop_alert_pps = config.drop_alert_pps if config is not None else 0
+        self._drop_alerts = {}
+        self.counters = DropCounterSampler(
+            self._read_counters,
+            interval=config.counter_sample_seconds if config is not None else 10,
+            size=config.counter_history if config is not None else 60,
+            on_sample=self._check_drop_rates
+        )
+        self.counters.start()
+        
+        # What blocked devices try to reach, aggregated per flow into the events table
+        self.packet_log = None
+        if self.nflog_group:
+            self.packet_log = NflogListener(
+                self.nflog_group,
+                self.db.journal.append_many,
+                flush_interval=config.nflog_flush_seconds,
+                max_flows=config.nflog_max_flows
+            )
+            try:
+                self.packet_log.start()
+            except OSError as e:
+                self.logger.error(f"Failed to open NFLOG group {self.nflog_group}: {str(e)}")
+                self.packet_log = None
+    
+    def _kernel_rules(self):
+        """(chain exists, handles) for the rule index, from one dump per backend"""
+        exists = False
+        handles = []
+        try:
+            output = subprocess.run(
+                ['iptables-save', '-t', 'filter'],
+                capture_output=True, text=True, check=True
+            ).stdout
+            exists, handles = parse_iptables_save(output)
+        except (OSError, subprocess.CalledProcessError):
+            # A set backend only needs iptables for port rules
+            if not self.blocklist:
+                raise
+        
+        if self.blocklist:
+            # The chain holds the set match rules, not per-device rules
+            handles = [h for h in handles if h[0] != 'RPT-SWI']
+            handles += [
+                (SET, classify(entry)[1])
+                for entries in self.blocklist.entries().values()
+                for entry in entries
+            ]
+            exists = True
+        return exists, handles
     
     def _ensure_iptables_chain(self):
         """Ensure RPT-SWI chain exists in iptables"""
-        try:
-            # Check if chain exists
-            subprocess.run(
-                ['iptables', '-L', 'RPT-SWI'],
-                capture_output=True,
-                check=False
-            )
-        except:
-            # Create chain
+        if self.blocklist:
+            self.blocklist.ensure()
+        
+        # The same dump that fills the index tells whether the chain exists
+        self.index.reconcile()
+        if not self.index.chain_exists:
             subprocess.run(['iptables', '-N', 'RPT-SWI'], check=True)
             subprocess.run(['iptables', '-A', 'INPUT', '-j', 'RPT-SWI'], check=True)
-            self.logger.log("Created RPT-SWI iptables chain")
+            self.index.chain_exists = True
+            self.logger.info("Created RPT-SWI iptables chain")
+    
+    def close(self):
+        """Stop the background threads; aggregated blocked traffic is flushed"""
+        if self.packet_log:
+            self.packet_log.stop()
+        self.counters.stop()
+        self.scheduler.stop()
+        self.index.stop()
+    
+    def _import_rules_file(self):
+        """Move rules from the old JSON file into the rule journal, once"""
+        if not self.rules_file.exists():
+            return
+        try:
+            count = self.db.firewall_rules.import_file(self.rules_file)
+            self.rules_file.rename(self.rules_file.with_name(self.rules_file.name + '.imported'))
+            self.logger.info(f"Imported {count} saved firewall rules from {self.rules_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to import saved firewall rules: {str(e)}")
+    
+    def restore_saved_rules(self):
+        """Reapply every saved rule missing from the kernel, in one transaction
+        
+        Rules the kernel still holds are skipped, so this is a no-op after
+        a plain restart and restores everything after a reboot or crash.
+        Throttles are reapplied as one batch too. Returns the number of
+        rules or set entries added.
+        """
+        try:
+            result = self.sync_desired_state(prune=False)
+            if result['added']:
+                self.logger.info(f"Restored {result['added']} saved firewall rules")
+            return result['added']
+            
+        except Exception as e:
+            self.logger.error(f"Failed to restore saved firewall rules: {str(e)}")
+            return 0
+    
+    def _desired_state(self, now=None):
+        """(handles, {target: rate}) the saved rules and device rows call for right now
+        
+        Rules not started yet or already expired are left out. Devices
+        flagged is_blocked are blocked too, since src/main.py records its
+        blocks only there, and whitelisted devices are never blocked or
+        throttled.
+        """
+        now = now if now is not None else time.time()
+        flagged = self.db.get_flagged_devices()
+        trusted = set()
+        for device in flagged:
+            if device['trusted']:
+                trusted.update(value for value in (device.get('ip'), device.get('mac')) if value)
+        
+        handles = []
+        limits = {}
+        for rule in self._load_rules():
+            # Not started yet, or expired while we were down (the scheduler retires those)
+            if not _is_live(rule, now):
+                continue
+            if rule.get('ip') in trusted or (rule.get('mac') and rule.get('mac') in trusted):
+                continue
+            if rule.get('type') == 'throttle':
+                limits[rule['ip']] = rule.get('rate')
+            elif rule.get('type') == 'block_port':
+                handles.append(self._port_handle(rule['port'], rule.get('protocol', 'tcp'), rule.get('direction', 'input')))
+            elif rule.get('ip'):
+                handles.extend(self._address_handles(rule['ip'], rule.get('mac')))
+        for device in flagged:
+            if device['is_blocked'] and not device['trusted'] and device.get('mac') not in trusted:
+                handles.extend(self._address_handles(device['ip'], device.get('mac')))
+        return list(dict.fromkeys(handles)), limits
+    
+    def sync_desired_state(self, prune=True):
+        """Make the kernel match the saved rules, with the fewest changes
+        
+        The desired state (active rules and devices flagged blocked,
+        minus whitelisted devices) is diffed against a fresh kernel dump: missing rules are added and,
+        with prune, duplicate copies and RPT-SWI rules or set entries no
+        saved rule asks for are removed. Port rules in INPUT/OUTPUT are
+        only deduplicated, since other tools may own them. The delta is
+        one kernel transaction, so an in-sync firewall costs one dump,
+        one database read and no writes, and running this every minute
+        is cheap. Throttles are diffed the same way. Returns the counts
+        of rules added and removed, throttles set and lifted.
+        """
+        # Queued rule journal writes first, so the desired state is current
+        self.db.writer.flush()
+        handles, limits = self._desired_state()
+        desired = set(handles)
+        
+        with self.index.write_lock:
+            now = time.time()
+            for key, at in list(self._recent_changes.items()):
+                if now - at >= SYNC_GRACE_SECONDS:
+                    self._recent_changes.pop(key, None)
+            recent = set(self._recent_changes)
+            self.index.reconcile()
+            added = [h for h in handles if not self.index.contains(h) and h not in recent]
+            removed = []
+            if prune:
+                for handle, copies in self.index.snapshot().items():
+                    owned = handle[0] in ('RPT-SWI', SET)
+                    keep = 1 if handle in desired or not owned or handle in recent else 0
+                    removed.extend([handle] * (copies - keep))
+            if added or removed:
+                self._kernel_apply(added, removed)
+                self.index.remove(*removed)
+                self.index.add(*added)
+        
+        result = {'added': len(added), 'removed': len(removed), 'throttled': 0, 'unthrottled': 0}
+        # Only touch tc when there is something to shape or we set it up earlier
+        if limits or self.throttle.ready:
+            current = self.throttle.limits()
+            wanted = {
+                classify(target)[1]: normalize_rate(rate) if rate else self.throttle.rate
+                for target, rate in limits.items()
+            }
+            changed = {
+                target: rate for target, rate in wanted.items()
+                if ('throttle', target) not in recent
+                and (current.get(target) is None or rate_bits(current[target]) != rate_bits(rate))
+            }
+            lifted = [
+                target for target in current
+                if target not in wanted and ('throttle', target) not in recent
+            ] if prune else []
+            if changed or lifted:
+                self.throttle.apply(changed, remove=lifted)
+            result.update(throttled=len(changed), unthrottled=len(lifted))
+        
+        if prune and (result['added'] or result['removed'] or result['throttled'] or result['unthrottled']):
+            self.logger.info(
+                f"Firewall synced to saved rules: {result['added']} added, {result['removed']} removed, "
+                f"{result['throttled']} throttled, {result['unthrottled']} unthrottled"
+            )
+        return result
+    
+    def _sync_in_background(self):
+        try:
+            self.sync_desired_state()
+        except Exception as e:
+            self.logger.error(f"Failed to sync firewall with saved rules: {str(e)}")
     
-    def block_device(self, device_info, permanent=True):
-        """Block a device by IP and MAC"""
+    def _address_handles(self, ip, mac=None):
+        """Index handles of the rules or set entries that block ip (and mac)"""
+        if self.blocklist:
+            return [(SET, classify(value)[1]) for value in (ip, mac) if value]
+        
+        # Same text iptables-save prints, so handles compare equal to a reload
+        kind, entry = classify(ip)
+        source = entry if kind in ('net', 'net6') else f'{entry}/32'
+        handles = [('RPT-SWI', f'-s {source} -j DROP')]
+        if mac:
+            handles.append(('RPT-SWI', f'-s {source} -m mac --mac-source {classify(mac)[1]} -j DROP'))
+        if self.nflog_group:
+            # Inserted last, so it sits above the DROP and sees the packet first
+            handles.append(('RPT-SWI', f'-s {source} {nflog_spec(self.nflog_group)}'))
+        return handles
+    
+    def _port_handle(self, port, protocol='tcp', direction='input'):
+        chain_name = "INPUT" if direction == 'input' else "OUTPUT"
+        return (chain_name, f'-p {protocol} -m {protocol} --dport {port} -j DROP')
+    
+    def _kernel_apply(self, added, removed):
+        """Push one handle delta to the kernel: one set transaction and/or one iptables-restore"""
+        if self.blocklist:
+            add = [spec for chain, spec in added if chain == SET]
+            remove = list(dict.fromkeys(spec for chain, spec in removed if chain == SET))
+            if add or remove:
+                self.blocklist.apply(add=add, remove=remove)
+        self._iptables_restore(
+            [f'-D {chain} {spec}' for chain, spec in removed if chain != SET] +
+            [f'-I {chain} {spec}' for chain, spec in added if chain != SET]
+        )
+    
+    def _change(self, add=(), remove_keys=(), remove=()):
+        """Install handles and delete rules (by index key or exact handle)
+        
+        Handles already present are not added twice, and removals cover
+        every copy the index knows of. The delta goes to the kernel in one
+        transaction and is then recorded in the index. If the kernel
+        rejects it the index was stale: it is reconciled and the delta
+        recomputed once. Returns (added, removed) handles.
+        """
+        with self.index.write_lock:
+            for attempt in (1, 2):
+                added = [h for h in dict.fromkeys(add) if not self.index.contains(h)]
+                removed = self.index.handles(*remove_keys)
+                listed = set(removed)
+                removed += [h for h in dict.fromkeys(remove) if h not in listed and self.index.contains(h)]
+                try:
+                    self._kernel_apply(added, removed)
+                    break
+                except (RuntimeError, subprocess.CalledProcessError):
+                    if attempt == 2:
+                        raise
+                    self.index.reconcile()
+            self.index.remove(*removed)
+            self.index.add(*added)
+            self._mark_changed(*added, *removed)
+            return added, removed
+    
+    def _mark_changed(self, *keys):
+        """Note rule handles or ('throttle', target) keys just changed, for the sync grace period"""
+        now = time.time()
+        for key in keys:
+            self._recent_changes[key] = now
+    
+    def _unblock_keys(self, ip, macs=()):
+        keys = [classify(ip)]
+        # Per-device MAC rules also match on the source IP; set entries don't
+        if self.blocklist:
+            keys += [classify(mac) for mac in macs if mac]
+        return [({'ip6': 'ip', 'net6': 'net'}.get(kind, kind), entry) for kind, entry in keys]
+    
+    def _expiry(self, permanent, expires_at):
+        if expires_at is None and not permanent:
+            expires_at = time.time() + self.temporary_block_seconds
+        return int(expires_at) if expires_at is not None else None
+    
+    def block_device(self, device_info, permanent=True, expires_at=None):
+        """Block a device by IP and MAC
+        
+        With permanent=False the block is lifted after
+        temporary_block_seconds, or at expires_at (epoch seconds) if given.
+        """
         ip = device_info.get('ip')
         mac = device_info.get('mac')
         
         if not ip:
-            self.logger.log("Cannot block device: No IP address", level="ERROR")
+            self.logger.error("Cannot block device: No IP address")
             return False
         
+        expires_at = self._expiry(permanent, expires_at)
         try:
-            # Block by IP
-            rule_ip = iptc.Rule()
-            rule_ip.src = ip
-            rule_ip.target = iptc.Target(rule_ip, "DROP")
-            
-            chain = iptc.Chain(iptc.Table(iptc.Table.FILTER), "RPT-SWI")
-            chain.insert_rule(rule_ip)
-            
-            # Block by MAC if available
-            if mac:
-                rule_mac = iptc.Rule()
-                rule_mac.src = ip
-                rule_mac.add_match('mac', {'mac-source': mac})
-                rule_mac.target = iptc.Target(rule_mac, "DROP")
-                chain.insert_rule(rule_mac)
+            added, _ = self._change(add=self._address_handles(ip, mac))
+            if not added:
+                self.logger.info(f"Device already blocked: {ip}")
+                return True
             
             # Save rule
             self._save_rule({
@@ -60,14 +391,16 @@ class FirewallManager:
                 'ip': ip,
                 'mac': mac,
                 'timestamp': time.time(),
-                'permanent': permanent,
+                'expires_at': expires_at,
+                'permanent': expires_at is None,
                 'device_info': device_info
             })
             
             # Update device status in database
-            self.db.update_device_status(ip, 'blocked')
+            self.db.update_device_status(ip, 'blocked', wait=False)
+            self.db.log_event('device_blocked', {'ip': ip, 'mac': mac}, source='firewall', severity='warning')
             
-            self.logger.log(f"Blocked device: {ip} ({mac or 'No MAC'})")
+            self.logger.info(f"Blocked device: {ip} ({mac or 'No MAC'})")
             
             # Send notification
             notification = {
@@ -80,20 +413,16 @@ class FirewallManager:
             self.db.add_notification(notification)
             
             return True
-            
+        
         except Exception as e:
-            self.logger.log(f"Failed to block device {ip}: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to block device {ip}: {str(e)}")
             return False
     
     def block_ip(self, ip_address, comment=""):
         """Block specific IP address"""
         try:
-            rule = iptc.Rule()
-            rule.src = ip_address
-            rule.target = iptc.Target(rule, "DROP")
-            
-            chain = iptc.Chain(iptc.Table(iptc.Table.FILTER), "RPT-SWI")
-            chain.insert_rule(rule)
+            # CIDR ranges become one network rule or hash:net entry
+            self._change(add=self._address_handles(ip_address))
             
             self._save_rule({
                 'type': 'block_ip',
@@ -102,30 +431,17 @@ class FirewallManager:
                 'timestamp': time.time()
             })
             
-            self.logger.log(f"Blocked IP: {ip_address} - {comment}")
+            self.logger.info(f"Blocked IP: {ip_address} - {comment}")
             return True
-            
+        
         except Exception as e:
-            self.logger.log(f"Failed to block IP {ip_address}: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to block IP {ip_address}: {str(e)}")
             return False
     
     def block_port(self, port, protocol='tcp', direction='input'):
         """Block specific port"""
         try:
-            rule = iptc.Rule()
-            rule.protocol = protocol
-            
-            match = rule.create_match(protocol)
-            if protocol == 'tcp':
-                match.dport = str(port)
-            elif protocol == 'udp':
-                match.dport = str(port)
-            
-            rule.target = iptc.Target(rule, "DROP")
-            
-            chain_name = "INPUT" if direction == 'input' else "OUTPUT"
-            chain = iptc.Chain(iptc.Table(iptc.Table.FILTER), chain_name)
-            chain.insert_rule(rule)
+            self._change(add=[self._port_handle(port, protocol, direction)])
             
             self._save_rule({
                 'type': 'block_port',
@@ -135,11 +451,11 @@ class FirewallManager:
                 'timestamp': time.time()
             })
             
-            self.logger.log(f"Blocked port: {port}/{protocol} ({direction})")
+            self.logger.info(f"Blocked port: {port}/{protocol} ({direction})")
             return True
-            
+        
         except Exception as e:
-            self.logger.log(f"Failed to block port {port}: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to block port {port}: {str(e)}")
             return False
     
     def unblock_device(self, device_info):
@@ -150,73 +466,288 @@ class FirewallManager:
             return False
         
         try:
-            # Remove all rules for this IP
-            table = iptc.Table(iptc.Table.FILTER)
-            chain = iptc.Chain(table, "RPT-SWI")
-            
-            rules_to_remove = []
-            for rule in chain.rules:
-                if rule.src and rule.src.split('/')[0] == ip:
-                    rules_to_remove.append(rule)
-            
-            for rule in rules_to_remove:
-                chain.delete_rule(rule)
+            # The MAC it was blocked with may differ from the current one
+            macs = {r.get('mac') for r in self.db.firewall_rules.active(ips=[ip])}
+            macs.add(device_info.get('mac'))
+            self._change(remove_keys=self._unblock_keys(ip, macs))
             
             # Remove from saved rules
             self._remove_rule(ip)
             
             # Update database
-            self.db.update_device_status(ip, 'allowed')
+            self.db.update_device_status(ip, 'allowed', wait=False)
+            self.db.log_event('device_unblocked', {'ip': ip}, source='firewall')
             
-            self.logger.log(f"Unblocked device: {ip}")
+            self.logger.info(f"Unblocked device: {ip}")
             return True
-            
+        
         except Exception as e:
-            self.logger.log(f"Failed to unblock device {ip}: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to unblock device {ip}: {str(e)}")
             return False
     
     def unblock_ip(self, ip_address):
         """Unblock specific IP"""
         try:
-            table = iptc.Table(iptc.Table.FILTER)
-            chain = iptc.Chain(table, "RPT-SWI")
-            
-            removed = False
-            for rule in chain.rules:
-                if rule.src and rule.src.split('/')[0] == ip_address:
-                    chain.delete_rule(rule)
-                    removed = True
+            _, removed = self._change(remove_keys=self._unblock_keys(ip_address))
             
             if removed:
                 self._remove_rule(ip_address)
-                self.logger.log(f"Unblocked IP: {ip_address}")
-            
-            return removed
+                # A device row still flagged blocked would be blocked again by the next sync
+                self.db.update_device_status(ip_address, 'allowed', wait=False)
+                self.logger.info(f"Unblocked IP: {ip_address}")
             
+            return bool(removed)
+        
         except Exception as e:
-            self.logger.log(f"Failed to unblock IP {ip_address}: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to unblock IP {ip_address}: {str(e)}")
             return False
     
+    def is_blocked(self, ip_address):
+        """Whether a rule drops ip_address, answered from the index"""
+        return self.index.is_blocked(ip_address)
+    
+    def _iptables_restore(self, lines):
+        """Apply rule lines to the filter table as one atomic commit"""
+        if not lines:
+            return
+        script = '*filter\n' + ''.join(line + '\n' for line in lines) + 'COMMIT\n'
+        result = subprocess.run(
+            ['iptables-restore', '--noflush'],
+            input=script, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"iptables-restore failed: {result.stderr.strip()}")
+    
+    def _changed_ips(self, ips, handles):
+        keys = {key for handle in handles for key in rule_keys(*handle)}
+        return [ip for ip in ips if ('ip', classify(ip)[1]) in keys or ('net', classify(ip)[1]) in keys]
+    
+    def _apply_block(self, by_ip):
+        """Add the kernel state for by_ip; returns (changed ips, undo function)"""
+        handles = []
+        for ip, device in by_ip.items():
+            handles.extend(self._address_handles(ip, device.get('mac')))
+        added, _ = self._change(add=handles)
+        # A device whose IP rule existed but whose MAC rule was new still counts
+        new = set(added)
+        changed = [
+            ip for ip in by_ip
+            if any(h in new for h in self._address_handles(ip, by_ip[ip].get('mac')))
+        ]
+        return changed, lambda: self._change(remove=added)
+    
+    def _apply_unblock(self, ips, macs):
+        """Remove the kernel state for ips; returns (changed ips, undo function)"""
+        keys = []
+        for ip in ips:
+            keys.extend(self._unblock_keys(ip))
+        if self.blocklist:
+            keys.extend(('mac', classify(mac)[1]) for mac in macs if mac)
+        _, removed = self._change(remove_keys=keys)
+        return self._changed_ips(ips, removed), lambda: self._change(add=removed)
+    
+    def block_devices(self, devices, permanent=True, expires_at=None):
+        """Block many devices at once; all or nothing
+        
+        The kernel change is one transaction (iptables-restore, ipset
+        restore or nft -f), followed by one database transaction holding
+        both the rule journal append and the device status. If that
+        fails the kernel change is undone. Devices that are already blocked are skipped; returns the
+        IPs that were newly blocked. permanent and expires_at work as in
+        block_device.
+        """
+        by_ip = {device['ip']: device for device in devices if device.get('ip')}
+        if not by_ip:
+            return []
+        expires_at = self._expiry(permanent, expires_at)
+        
+        changed, undo = self._apply_block(by_ip)
+        if not changed:
+            return []
+        
+        now = time.time()
+        rules = [
+            {
+                'type': 'block',
+                'ip': ip,
+                'mac': by_ip[ip].get('mac'),
+                'timestamp': now,
+                'expires_at': expires_at,
+                'permanent': expires_at is None,
+                'device_info': by_ip[ip]
+            }
+            for ip in changed
+        ]
+        
+        def journal(cursor):
+            # IPs that already have a saved block rule are skipped
+            saved = self.db.firewall_rules.insert(cursor, rules)
+            self.db.write_devices_status(cursor, changed, 'blocked')
+            return saved
+        
+        try:
+            saved = self.db.writer.call(
+                journal, wait=True,
+                on_commit=lambda saved: self.db.devices_status_committed(changed, 'blocked')
+            )
+        except Exception:
+            undo()
+            raise
+        
+        if expires_at is not None:
+            self.scheduler.push_many((expires_at, EXPIRE, rule_id) for rule_id in saved)
+        
+        self.db.journal.append_many(
+            {
+                'event_type': 'device_blocked',
+                'source': 'firewall',
+                'severity': 'warning',
+                'data': {'ip': ip, 'mac': by_ip[ip].get('mac')},
+                'ts': now
+            }
+            for ip in changed
+        )
+        # One notification for the batch instead of one per device
+        self.db.add_notification({
+            'type': 'devices_blocked',
+            'title': f'{len(changed)} devices blocked',
+            'ips': changed,
+            'timestamp': now
+        })
+        self.logger.info(f"Blocked {len(changed)} devices")
+        return changed
+    
+    def unblock_devices(self, devices):
+        """Unblock many devices (dicts or IP strings) at once; all or nothing
+        
+        Returns the IPs that had kernel rules or set entries removed.
+        """
+        ips = []
+        macs = set()
+        for device in devices:
+            if isinstance(device, dict):
+                if device.get('ip'):
+                    ips.append(device['ip'])
+                if device.get('mac'):
+                    macs.add(device['mac'])
+            elif device:
+                ips.append(device)
+        ips = list(dict.fromkeys(ips))
+        if not ips:
+            return []
+        
+        # The MAC a device was blocked with may differ from its current one
+        macs.update(r['mac'] for r in self.db.firewall_rules.active(ips=ips) if r.get('mac'))
+        changed, undo = self._apply_unblock(ips, macs)
+        
+        def journal(cursor):
+            self.db.firewall_rules.retire_rows(cursor, ips, rule_types=BLOCK_RULES)
+            self.db.write_devices_status(cursor, ips, 'allowed')
+        
+        try:
+            # The retired rules and the device status commit together
+            self.db.writer.call(
+                journal, wait=True,
+                on_commit=lambda result: self.db.devices_status_committed(ips, 'allowed')
+            )
+        except Exception:
+            undo()
+            raise
+        
+        now = time.time()
+        self.db.journal.append_many(
+            {'event_type': 'device_unblocked', 'source': 'firewall', 'data': {'ip': ip}, 'ts': now}
+            for ip in changed
+        )
+        self.logger.info(f"Unblocked {len(changed)} devices")
+        return changed
+    
     def get_blocked_devices(self):
         """Get list of all blocked devices"""
         try:
-            table = iptc.Table(iptc.Table.FILTER)
-            chain = iptc.Chain(table, "RPT-SWI")
-            
-            blocked = []
-            for rule in chain.rules:
-                if rule.src and rule.target.name == "DROP":
-                    blocked.append({
-                        'ip': rule.src.split('/')[0],
-                        'target': rule.target.name
-                    })
-            
-            return blocked
-            
+            return [
+                {'ip': value, 'target': 'DROP'}
+                for kind in ('ip', 'net')
+                for value in self.index.keys(kind)
+            ]
+        
         except Exception as e:
-            self.logger.log(f"Failed to get blocked devices: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to get blocked devices: {str(e)}")
             return []
     
+    def _read_counters(self):
+        """{target: (packets, bytes)} dropped so far, one dump per backend
+
+        Targets are the blocked IP, network or MAC, or 'port/protocol'.
+        The IP and MAC rules of one device add up under its IP.
+        """
+        counters = {}
+        
+        def count(target, packets, byte_count):
+            total = counters.get(target, (0, 0))
+            counters[target] = (total[0] + packets, total[1] + byte_count)
+        
+        try:
+            output = subprocess.run(
+                ['iptables-save', '-c', '-t', 'filter'],
+                capture_output=True, text=True, check=True
+            ).stdout
+            for handle, packets, byte_count in parse_iptables_counters(output):
+                # With a set backend the chain only holds the set match rules;
+                # NFLOG rules see the same packets as the DROP below them
+                if (self.blocklist and handle[0] == 'RPT-SWI') or '-j NFLOG' in handle[1]:
+                    continue
+                keys = rule_keys(*handle)
+                if keys:
+                    kind, value = keys[0]
+                    count(f'{value[0]}/{value[1]}' if kind == 'port' else value, packets, byte_count)
+        except (OSError, subprocess.CalledProcessError):
+            if not self.blocklist:
+                raise
+        
+        if self.blocklist:
+            for entry, (packets, byte_count) in self.blocklist.counters().items():
+                try:
+                    entry = classify(entry)[1]
+                except ValueError:
+                    pass
+                count(entry, packets, byte_count)
+        return counters
+    
+    def _check_drop_rates(self, sampler):
+        """Notify about targets whose drop rate over the last interval exceeds drop_alert_pps"""
+        if not self.drop_alert_pps:
+            return
+        now = time.time()
+        for target, (pps, bps) in sampler.rates(sampler.interval).items():
+            if pps < self.drop_alert_pps or now - self._drop_alerts.get(target, 0) < DROP_ALERT_COOLDOWN:
+                continue
+            self._drop_alerts[target] = now
+            self.db.log_event('drop_rate_high', {'target': target, 'pps': round(pps, 1)},
+                              source='firewall', severity='warning')
+            self.db.add_notification({
+                'type': 'drop_rate_high',
+                'ip': target,
+                'packets_per_second': round(pps, 1),
+                'bytes_per_second': round(bps, 1),
+                'timestamp': now
+            })
+    
+    def get_drop_rates(self, window=None, count=None):
+        """[(target, packets/s, bytes/s), ...] busiest first, over the last window seconds
+
+        Only targets still sending are listed; empty until two samples were taken.
+        """
+        return self.counters.top(count, window)
+    
+    def get_blocked_traffic(self, count=50):
+        """The newest `count` blocked_traffic events: what blocked devices tried to reach"""
+        # Flows still in memory are written first so the answer is current
+        if self.packet_log:
+            self.packet_log.flush()
+            self.db.writer.flush()
+        return self.db.journal.tail(count, event_types=[BLOCKED_TRAFFIC])
+    
     def get_firewall_status(self):
         """Get comprehensive firewall status"""
         status = {
@@ -227,35 +758,22 @@ class FirewallManager:
         }
         
         try:
-            # Check if chain exists
-            result = subprocess.run(
-                ['iptables', '-L', 'RPT-SWI', '-n'],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode == 0:
-                status['chain_exists'] = True
-                
-                # Parse output
-                lines = result.stdout.strip().split('\n')
-                if len(lines) > 2:
-                    status['total_rules'] = len(lines) - 2
-                    
-                    for line in lines[2:]:
-                        if 'DROP' in line:
-                            parts = line.split()
-                            if len(parts) > 3:
-                                source = parts[3]
-                                if source != '0.0.0.0/0':
-                                    status['blocked_ips'] += 1
+            # Answered from the rule index; the kernel is only read on reconcile
+            status.update(self.index.status())
             
             # Get saved rules
-            saved_rules = self._load_rules()
-            status['saved_rules_count'] = len(saved_rules)
+            status['saved_rules_count'] = self.db.firewall_rules.count()
+            status['scheduled_changes'] = self.scheduler.pending()
             
+            # Sampled in the background; reading them costs nothing here
+            window = self.counters.interval
+            status['dropped_pps'], status['dropped_bps'] = self.counters.totals(window)
+            status['top_dropped'] = self.counters.top(5, window)
+            if self.packet_log:
+                status['packet_log'] = self.packet_log.status()
+        
         except Exception as e:
-            self.logger.log(f"Failed to get firewall status: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to get firewall status: {str(e)}")
         
         return status
     
@@ -272,76 +790,299 @@ class FirewallManager:
             with open(backup_file, 'w') as f:
                 subprocess.run(['iptables-save'], stdout=f, check=True)
             
-            self.logger.log(f"Firewall rules backed up to: {backup_file}")
+            self.logger.info(f"Firewall rules backed up to: {backup_file}")
             return str(backup_file)
             
         except Exception as e:
-            self.logger.log(f"Failed to backup rules: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to backup rules: {str(e)}")
             return None
     
     def restore_rules(self, backup_file):
         """Restore iptables rules from backup"""
         try:
             if not Path(backup_file).exists():
-                self.logger.log(f"Backup file not found: {backup_file}", level="ERROR")
+                self.logger.error(f"Backup file not found: {backup_file}")
                 return False
             
             # Restore rules
             with open(backup_file, 'r') as f:
                 subprocess.run(['iptables-restore'], stdin=f, check=True)
             
-            self.logger.log(f"Firewall rules restored from: {backup_file}")
+            self.logger.info(f"Firewall rules restored from: {backup_file}")
             return True
             
         except Exception as e:
-            self.logger.log(f"Failed to restore rules: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to restore rules: {str(e)}")
             return False
     
     def _save_rule(self, rule_data):
-        """Save rule to file"""
+        """Append a rule to the rule journal; queued and group-committed"""
         try:
-            rules = self._load_rules()
-            rules.append(rule_data)
-            
-            with open(self.rules_file, 'w') as f:
-                json.dump(rules, f, indent=2)
-                
+            if rule_data.get('starts_at') is None and rule_data.get('expires_at') is None:
+                self.db.firewall_rules.append([rule_data])
+                return
+            # The scheduler keys on the rule id, so timed rules wait for the commit
+            for rule_id in self.db.firewall_rules.append([rule_data], wait=True):
+                self._schedule(dict(rule_data, id=rule_id))
         except Exception as e:
-            self.logger.log(f"Failed to save rule: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to save rule: {str(e)}")
     
     def _load_rules(self):
-        """Load rules from file"""
+        """Active saved rules, oldest first"""
         try:
-            if self.rules_file.exists():
-                with open(self.rules_file, 'r') as f:
-                    return json.load(f)
-        except:
-            pass
-        return []
+            return self.db.firewall_rules.active()
+        except Exception as e:
+            self.logger.error(f"Failed to load saved rules: {str(e)}")
+            return []
     
     def _remove_rule(self, ip_address):
-        """Remove rule from file"""
+        """Retire the saved rules for an IP"""
         try:
-            rules = self._load_rules()
-            new_rules = [r for r in rules if r.get('ip') != ip_address]
-            
-            with open(self.rules_file, 'w') as f:
-                json.dump(new_rules, f, indent=2)
-                
+            self.db.firewall_rules.retire([ip_address], rule_types=BLOCK_RULES)
         except Exception as e:
-            self.logger.log(f"Failed to remove rule: {str(e)}", level="ERROR")
+            self.logger.error(f"Failed to remove rule: {str(e)}")
+    
+    def _schedule(self, rule, now=None):
+        now = now if now is not None else time.time()
+        entries = []
+        if rule.get('starts_at') is not None and rule['starts_at'] > now:
+            entries.append((rule['starts_at'], START, rule['id']))
+        if rule.get('expires_at') is not None:
+            entries.append((rule['expires_at'], EXPIRE, rule['id']))
+        self.scheduler.push_many(entries)
+    
+    def _load_schedule(self):
+        """Rebuild the scheduler from the saved timed rules after a restart"""
+        try:
+            now = time.time()
+            rules = self.db.firewall_rules.timed()
+            for rule in rules:
+                self._schedule(rule, now)
+            if rules:
+                self.logger.info(f"Scheduled {self.scheduler.pending()} firewall rule changes")
+        except Exception as e:
+            self.logger.error(f"Failed to load firewall schedule: {str(e)}")
+    
+    def _run_scheduled(self, entries):
+        """Apply a batch of due scheduler entries: one block and one unblock batch"""
+        now = time.time()
+        rules = {rule['id']: rule for rule in self.db.firewall_rules.by_ids({e[2] for e in entries})}
+        starts = {}
+        expired = {}
+        for _, action, rule_id in entries:
+            rule = rules.get(rule_id)
+            # Unblocked or replaced since the entry was queued
+            if rule is None or not rule.get('ip'):
+                continue
+            if action == START and (rule.get('starts_at') or 0) <= now:
+                starts[rule['ip']] = {'ip': rule['ip'], 'mac': rule.get('mac')}
+            elif action == EXPIRE and (rule.get('expires_at') or now + 1) <= now:
+                expired[rule_id] = rule
+        
+        if starts:
+            self._start_rules(starts, now)
+        if expired:
+            self._expire_rules(list(expired.values()), now)
+    
+    def _start_rules(self, by_ip, now):
+        """Apply the kernel state of scheduled rules that just started
+        
+        The saved rule already carries its expiry, so nothing is journaled:
+        a new rule here would outlive the timed one and keep the block.
+        """
+        changed, undo = self._apply_block(by_ip)
+        if not changed:
+            return []
+        try:
+            self.db.update_devices_status(changed, 'blocked')
+        except Exception:
+            undo()
+            raise
+        
+        self.db.journal.append_many(
+            {
+                'event_type': 'device_blocked',
+                'source': 'firewall',
+                'severity': 'warning',
+                'data': {'ip': ip, 'mac': by_ip[ip].get('mac'), 'reason': 'scheduled'},
+                'ts': now
+            }
+            for ip in changed
+        )
+        self.logger.info(f"Scheduled block started for {len(changed)} devices")
+        return changed
+    
+    def _expire_rules(self, rules, now):
+        """Retire expired rules and unblock the IPs no other live block rule still covers
+        
+        A permanent or later block of the same device outlives the timed one.
+        """
+        ids = [rule['id'] for rule in rules]
+        self.db.firewall_rules.set_active(ids, False)
+        
+        ips = list(dict.fromkeys(rule['ip'] for rule in rules))
+        covered = {
+            rule['ip'] for rule in self.db.firewall_rules.active(ips=ips)
+            if rule.get('type') in BLOCK_RULES and _is_live(rule, now)
+        }
+        lift = [ip for ip in ips if ip not in covered]
+        if not lift:
+            return []
+        macs = {rule['mac'] for rule in rules if rule.get('mac') and rule['ip'] in lift}
+        try:
+            changed, _ = self._apply_unblock(lift, macs)
+        except Exception:
+            self.db.firewall_rules.set_active(ids, True)
+            raise
+        
+        self.db.update_devices_status(lift, 'allowed')
+        self.db.journal.append_many(
+            {
+                'event_type': 'device_unblocked',
+                'source': 'firewall',
+                'data': {'ip': ip, 'reason': 'expired'},
+                'ts': now
+            }
+            for ip in changed
+        )
+        self.logger.info(f"Block expired for {len(changed)} devices")
+        return changed
     
     def schedule_block(self, ip_address, start_time, end_time):
-        """Schedule blocking for specific time period"""
-        # Implementation for scheduled blocking
-        pass
+        """Block ip_address from start_time until end_time
+        
+        Times are epoch seconds or datetimes; end_time=None blocks for
+        good once started. A start in the past blocks right away.
+        """
+        def epoch(value):
+            return int(value.timestamp() if hasattr(value, 'timestamp') else value)
+        
+        start = epoch(start_time)
+        end = epoch(end_time) if end_time is not None else None
+        if end is not None and end <= start:
+            self.logger.error(f"Cannot schedule block of {ip_address}: end is before start")
+            return False
+        
+        if start <= time.time():
+            return self.block_device({'ip': ip_address}, permanent=end is None, expires_at=end)
+        
+        self._save_rule({
+            'type': 'block',
+            'ip': ip_address,
+            'timestamp': time.time(),
+            'starts_at': start,
+            'expires_at': end,
+            'permanent': end is None,
+            'device_info': {'ip': ip_address}
+        })
+        self.logger.info(f"Scheduled block of {ip_address} from {time.ctime(start)}"
+                         + (f" until {time.ctime(end)}" if end else ""))
+        return True
     
     def whitelist_device(self, device_info):
         """Add device to whitelist (never block)"""
         self.db.add_trusted_device(device_info)
-        self.logger.log(f"Added to whitelist: {device_info.get('ip')}")
+        # Sync lifts its rules; the device row must not keep saying blocked
+        self.db.update_device_status(device_info['ip'], 'allowed')
+        self.logger.info(f"Added to whitelist: {device_info.get('ip')}")
+    
+    def _throttle_targets(self, devices):
+        """{ip: device dict} for dicts, IP strings and networks"""
+        targets = {}
+        for device in devices:
+            if isinstance(device, dict):
+                if device.get('ip'):
+                    targets[device['ip']] = device
+            elif device:
+                targets[device] = {'ip': device}
+        return targets
     
-    def create_quarantine_zone(self, network):
-        """Create quarantine zone for suspicious devices"""
-        # Advanced feature: Isolate devices in separate network
-        pass
+    def throttle_devices(self, devices, rate=None):
+        """Limit the bandwidth of many devices instead of blocking them
+        
+        devices are dicts, IPs or networks; a network shares one limit.
+        The change is one tc batch and one map update. Returns the
+        targets throttled.
+        """
+        targets = self._throttle_targets(devices)
+        if not targets:
+            return []
+        
+        rate = normalize_rate(rate) if rate else self.throttle.rate
+        self.throttle.apply({ip: rate for ip in targets})
+        self._mark_changed(*(('throttle', classify(ip)[1]) for ip in targets))
+        
+        now = time.time()
+        # A new rate replaces the saved one
+        self.db.firewall_rules.retire(targets, rule_types=('throttle',))
+        self.db.firewall_rules.append([
+            {'type': 'throttle', 'ip': ip, 'mac': device.get('mac'), 'rate': rate, 'timestamp': now}
+            for ip, device in targets.items()
+        ])
+        self.db.update_devices_status(list(targets), 'quarantined', wait=False)
+        self.db.journal.append_many(
+            {
+                'event_type': 'device_throttled',
+                'source': 'firewall',
+                'severity': 'warning',
+                'data': {'ip': ip, 'rate': rate},
+                'ts': now
+            }
+            for ip in targets
+        )
+        self.logger.info(f"Throttled {len(targets)} devices to {rate}")
+        return list(targets)
+    
+    def unthrottle_devices(self, devices):
+        """Lift the bandwidth limits of many devices; returns the targets"""
+        targets = self._throttle_targets(devices)
+        if not targets:
+            return []
+        
+        self.throttle.apply(remove=list(targets))
+        self._mark_changed(*(('throttle', classify(ip)[1]) for ip in targets))
+        self.db.firewall_rules.retire(targets, rule_types=('throttle',))
+        self.db.update_devices_status(list(targets), 'allowed', wait=False)
+        now = time.time()
+        self.db.journal.append_many(
+            {'event_type': 'device_unthrottled', 'source': 'firewall', 'data': {'ip': ip}, 'ts': now}
+            for ip in targets
+        )
+        self.logger.info(f"Removed bandwidth limit of {len(targets)} devices")
+        return list(targets)
+    
+    def throttle_device(self, device_info, rate=None):
+        """Slow a device down instead of blocking it"""
+        try:
+            return bool(self.throttle_devices([device_info], rate))
+        except Exception as e:
+            self.logger.error(f"Failed to throttle device {device_info.get('ip')}: {str(e)}")
+            return False
+    
+    def unthrottle_device(self, device_info):
+        """Remove a device's bandwidth limit"""
+        try:
+            return bool(self.unthrottle_devices([device_info]))
+        except Exception as e:
+            self.logger.error(f"Failed to unthrottle device {device_info.get('ip')}: {str(e)}")
+            return False
+    
+    def get_throttled_devices(self):
+        """{ip or network: rate} for every bandwidth limit in place"""
+        try:
+            return self.throttle.limits()
+        except Exception as e:
+            self.logger.error(f"Failed to get throttled devices: {str(e)}")
+            return {}
+    
+    def create_quarantine_zone(self, network, rate=None):
+        """Create quarantine zone for suspicious devices
+        
+        Everything sent to the network shares one quarantine_rate limit,
+        so its devices stay reachable but slow.
+        """
+        try:
+            return bool(self.throttle_devices([network], rate or self.quarantine_rate))
+        except Exception as e:
+            self.logger.error(f"Failed to create quarantine zone {network}: {str(e)}")
+            return False
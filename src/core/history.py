@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from collections import defaultdict
+
+HOUR = 3600
+DAY = 86400
+
+GRANULARITIES = {
+    'hourly': HOUR,
+    'daily': DAY
+}
+
+def _floor(ts, width):
+    return ts - ts % width
+
+class DeviceHistory:
+    """Device presence intervals with hourly/daily rollups and retention"""
+
+    def __init__(self, database, gap_seconds=900, retention_days=30,
+                 hourly_rollup_days=90, daily_rollup_days=730):
+        self.db = database
+        self.pool = database.pool
+
+        # Two sightings closer than this belong to the same interval
+        self.gap_seconds = gap_seconds
+        self.retention_days = retention_days
+        self.hourly_rollup_days = hourly_rollup_days
+        self.daily_rollup_days = daily_rollup_days
+
+    def record_sightings(self, cursor, device_ids, ts=None):
+        """Extend or open presence intervals; runs inside the caller's transaction"""
+        if not device_ids:
+            return
+
+        ts = int(ts if ts is not None else time.time())
+        device_ids = list(set(device_ids))
+
+        # Latest interval of each device (PK seek per device)
+        latest = {}
+        for i in range(0, len(device_ids), 500):
+            chunk = device_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT device_id, MAX(start_ts), end_ts
+                FROM device_presence
+                WHERE device_id IN ({placeholders})
+                GROUP BY device_id
+            ''', chunk)
+            for device_id, start_ts, end_ts in cursor.fetchall():
+                latest[device_id] = (start_ts, end_ts)
+
+        extend = []
+        create = []
+        for device_id in device_ids:
+            interval = latest.get(device_id)
+            if interval and interval[1] >= ts - self.gap_seconds:
+                if ts > interval[1]:
+                    extend.append((ts, device_id, interval[0]))
+            else:
+                create.append((device_id, ts, ts))
+
+        if extend:
+            cursor.executemany('''
+                UPDATE device_presence SET end_ts = ?, sightings = sightings + 1
+                WHERE device_id = ? AND start_ts = ?
+            ''', extend)
+
+        if create:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO device_presence (device_id, start_ts, end_ts)
+                VALUES (?, ?, ?)
+            ''', create)
+
+    def _watermark(self, cursor, name):
+        cursor.execute('SELECT value FROM history_state WHERE key = ?', (name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _set_watermark(self, cursor, name, value):
+        cursor.execute('''
+            INSERT INTO history_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (name, value))
+
+    def rollup(self, now=None):
+        """Fold closed hours into hourly buckets and closed days into daily buckets"""
+        now = int(now if now is not None else time.time())
+
+        # An interval can only grow forward from (now - gap), so every
+        # hour before that point is final and safe to roll up exactly
+        hourly_until = _floor(now - self.gap_seconds, HOUR)
+
+        with self.pool.transaction() as cursor:
+            hourly_from = self._watermark(cursor, 'hourly')
+            if hourly_from is None:
+                cursor.execute('SELECT MIN(start_ts) FROM device_presence')
+                first = cursor.fetchone()[0]
+                hourly_from = _floor(first, HOUR) if first is not None else hourly_until
+
+            if hourly_from < hourly_until:
+                buckets = defaultdict(int)
+                cursor.execute('''
+                    SELECT device_id, start_ts, end_ts
+                    FROM device_presence
+                    WHERE end_ts >= ? AND start_ts < ?
+                ''', (hourly_from, hourly_until))
+                for device_id, start_ts, end_ts in cursor.fetchall():
+                    lo = max(start_ts, hourly_from)
+                    hi = min(end_ts, hourly_until)
+                    bucket = _floor(lo, HOUR)
+                    while bucket < hi:
+                        buckets[(device_id, bucket)] += min(hi, bucket + HOUR) - max(lo, bucket)
+                        bucket += HOUR
+
+                cursor.executemany('''
+                    INSERT INTO device_presence_rollup
+                    (granularity, device_id, bucket_ts, seconds_present)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(granularity, device_id, bucket_ts) DO UPDATE SET
+                        seconds_present = seconds_present + excluded.seconds_present
+                ''', [
+                    (HOUR, device_id, bucket, seconds)
+                    for (device_id, bucket), seconds in buckets.items()
+                ])
+                self._set_watermark(cursor, 'hourly', hourly_until)
+
+            # Days are built from hourly buckets once all their hours are final
+            daily_until = _floor(hourly_until, DAY)
+            daily_from = self._watermark(cursor, 'daily')
+            if daily_from is None:
+                daily_from = _floor(hourly_from, DAY)
+
+            if daily_from < daily_until:
+                cursor.execute('''
+                    INSERT INTO device_presence_rollup
+                    (granularity, device_id, bucket_ts, seconds_present)
+                    SELECT ?, device_id, bucket_ts - bucket_ts % ?, SUM(seconds_present)
+                    FROM device_presence_rollup
+                    WHERE granularity = ? AND bucket_ts >= ? AND bucket_ts < ?
+                    GROUP BY device_id, bucket_ts - bucket_ts % ?
+                    ON CONFLICT(granularity, device_id, bucket_ts) DO UPDATE SET
+                        seconds_present = seconds_present + excluded.seconds_present
+                ''', (DAY, DAY, HOUR, daily_from, daily_until, DAY))
+                self._set_watermark(cursor, 'daily', daily_until)
+
+    def expired(self, now=None):
+        """Rows past their retention window, for RetentionJob to delete in batches
+
+        Returns {name: (table, key columns, where, params, order by)};
+        every range is an index seek. A window of 0 days keeps everything.
+        """
+        now = int(now if now is not None else time.time())
+        with self.pool.read() as cursor:
+            hourly_wm = self._watermark(cursor, 'hourly') or 0
+
+        ranges = {'intervals': None, 'hourly': None, 'daily': None}
+        if self.retention_days:
+            # Never drop intervals that have not been rolled up yet
+            cutoff = min(now - self.retention_days * DAY, hourly_wm)
+            ranges['intervals'] = (
+                'device_presence', ('device_id', 'start_ts'), 'end_ts < ?', (cutoff,), 'end_ts'
+            )
+        for name, days in (('hourly', self.hourly_rollup_days), ('daily', self.daily_rollup_days)):
+            if days:
+                ranges[name] = (
+                    'device_presence_rollup', ('granularity', 'device_id', 'bucket_ts'),
+                    'granularity = ? AND bucket_ts < ?', (GRANULARITIES[name], now - days * DAY),
+                    'bucket_ts'
+                )
+        return ranges
+
+    def get_intervals(self, device_id, since=None, until=None):
+        """Presence intervals of one device, newest first"""
+        since = since if since is not None else 0
+        until = until if until is not None else int(time.time())
+
+        with self.pool.read() as cursor:
+            cursor.execute('''
+                SELECT start_ts, end_ts, sightings
+                FROM device_presence
+                WHERE device_id = ? AND start_ts <= ? AND end_ts >= ?
+                ORDER BY start_ts DESC
+            ''', (device_id, until, since))
+            return [
+                {'start': start_ts, 'end': end_ts, 'sightings': sightings}
+                for start_ts, end_ts, sightings in cursor.fetchall()
+            ]
+
+    def get_rollups(self, device_id, granularity='daily', since=None, until=None):
+        """Rolled-up buckets of one device, oldest first"""
+        width = GRANULARITIES[granularity]
+        since = since if since is not None else 0
+        until = until if until is not None else int(time.time())
+
+        with self.pool.read() as cursor:
+            cursor.execute('''
+                SELECT bucket_ts, seconds_present
+                FROM device_presence_rollup
+                WHERE granularity = ? AND device_id = ?
+                  AND bucket_ts >= ? AND bucket_ts < ?
+                ORDER BY bucket_ts
+            ''', (width, device_id, since, until))
+            return [
+                {
+                    'bucket': bucket_ts,
+                    'seconds_present': seconds,
+                    'uptime': seconds / width
+                }
+                for bucket_ts, seconds in cursor.fetchall()
+            ]
+
+    def presence_seconds(self, since, until=None, device_id=None):
+        """Seconds present per device over [since, until)
+
+        Days before the daily watermark come from daily buckets, hours
+        before the hourly watermark from hourly buckets and the remainder
+        from raw intervals, so long ranges read few rows. A range starting
+        inside a rolled-up bucket is widened to the whole bucket.
+        """
+        since = int(since)
+        until = int(until if until is not None else time.time())
+        totals = defaultdict(int)
+        device_filter = ' AND device_id = ?' if device_id is not None else ''
+        extra = (device_id,) if device_id is not None else ()
+
+        with self.pool.read() as cursor:
+            daily_wm = self._watermark(cursor, 'daily') or 0
+            hourly_wm = self._watermark(cursor, 'hourly') or 0
+            position = since
+
+            for width, watermark in ((DAY, daily_wm), (HOUR, hourly_wm)):
+                start = _floor(position, width)
+                end = min(_floor(until, width), watermark)
+                if start >= end:
+                    continue
+                cursor.execute(f'''
+                    SELECT device_id, SUM(seconds_present)
+                    FROM device_presence_rollup
+                    WHERE granularity = ? AND bucket_ts >= ? AND bucket_ts < ?{device_filter}
+                    GROUP BY device_id
+                ''', (width, start, end) + extra)
+                for dev, seconds in cursor.fetchall():
+                    totals[dev] += seconds
+                position = end
+
+            if position < until:
+                cursor.execute(f'''
+                    SELECT device_id,
+                           SUM(MIN(end_ts, ?) - MAX(start_ts, ?))
+                    FROM device_presence
+                    WHERE end_ts >= ? AND start_ts < ?{device_filter}
+                    GROUP BY device_id
+                ''', (until, position, position, until) + extra)
+                for dev, seconds in cursor.fetchall():
+                    totals[dev] += max(seconds or 0, 0)
+
+        return dict(totals)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import io
+import json
+import time
+
+from src.utils.mac_vendors import MAC_VENDORS
+from src.utils.validators import NetworkValidators
+
+# CMDB exports name the same fields many ways; first match wins
+FIELD_ALIASES = {
+    'ip': ('ip', 'ip_address', 'ipaddress', 'ipv4', 'address'),
+    'mac': ('mac', 'mac_address', 'macaddress', 'hw_address', 'hwaddr'),
+    'hostname': ('hostname', 'host', 'host_name', 'fqdn', 'name'),
+    'vendor': ('vendor', 'manufacturer', 'make'),
+    'trusted': ('trusted', 'is_trusted', 'whitelisted', 'allowed'),
+    'notes': ('notes', 'note', 'comment', 'comments', 'description')
+}
+
+_TRUE = {'1', 'true', 'yes', 'y', 't', 'on'}
+_FALSE = {'0', 'false', 'no', 'n', 'f', 'off', ''}
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message is the report reason"""
+
+def _resolve_columns(header):
+    """Map our field names to the input's column names"""
+    # "IP Address", "ip-address" and "ip_address" are the same column
+    lowered = {
+        '_'.join(name.strip().lower().replace('-', ' ').split()): name
+        for name in header if name
+    }
+    columns = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                columns[field] = lowered[alias]
+                break
+    return columns
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def normalize_row(raw, columns):
+    """Validated device dict for one input row; raises RowError"""
+    ip = _text(raw.get(columns.get('ip')))
+    if not ip:
+        raise RowError("missing ip")
+    # Canonical text form, so differently written duplicates cannot slip in
+    canonical = NetworkValidators.normalize_ip(ip)
+    if canonical is None:
+        raise RowError(f"invalid ip '{ip}'")
+    ip = canonical
+
+    mac = _text(raw.get(columns.get('mac')))
+    if mac:
+        if not NetworkValidators.validate_mac(mac):
+            raise RowError(f"invalid mac '{mac}'")
+        mac = NetworkValidators.normalize_mac(mac)
+
+    hostname = _text(raw.get(columns.get('hostname')))
+    if hostname:
+        if not NetworkValidators.validate_hostname(hostname):
+            raise RowError(f"invalid hostname '{hostname}'")
+        hostname = hostname.rstrip('.').lower()
+
+    trusted = raw.get(columns.get('trusted'))
+    if isinstance(trusted, bool) or trusted is None:
+        trusted = None if trusted is None else int(trusted)
+    else:
+        flag = str(trusted).strip().lower()
+        if flag in _TRUE:
+            trusted = 1
+        elif flag in _FALSE:
+            trusted = None if flag == '' else 0
+        else:
+            raise RowError(f"invalid trusted value '{trusted}'")
+
+    vendor = _text(raw.get(columns.get('vendor')))
+    if not vendor and mac:
+        vendor = MAC_VENDORS.get(mac[:8])
+
+    return {
+        'ip': ip,
+        'mac': mac,
+        'hostname': hostname,
+        'vendor': vendor,
+        'trusted': trusted,
+        'notes': _text(raw.get(columns.get('notes')))
+    }
+
+def _open_text(path):
+    if str(path).lower().endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+def read_rows(path):
+    """Yield (line_number, raw_dict) from a CSV or JSON Lines file, lazily"""
+    name = str(path).lower().removesuffix('.gz')
+    with _open_text(path) as f:
+        if name.endswith(('.jsonl', '.ndjson')):
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield number, RowError(f"invalid JSON: {e}")
+                    continue
+                yield number, row if isinstance(row, dict) else RowError("not a JSON object")
+        else:
+            reader = csv.DictReader(f)
+            # Line 1 is the header
+            for number, row in enumerate(reader, 2):
+                yield number, row
+
+class DeviceImporter:
+    """Streams a device inventory file into the devices table
+
+    Rows are validated and normalized one at a time and upserted
+    batch_size rows per transaction; rejected rows are collected with
+    their reason. Imported rows fill in fields, they never blank them,
+    and do not count as sightings (last_seen is left alone).
+    """
+
+    UPSERT = '''
+        INSERT INTO devices (ip, mac, hostname, vendor, trusted, notes)
+        VALUES (?, ?, ?, ?, COALESCE(?, 0), ?)
+        ON CONFLICT(ip) DO UPDATE SET
+            mac = COALESCE(excluded.mac, mac),
+            hostname = COALESCE(excluded.hostname, hostname),
+            vendor = COALESCE(excluded.vendor, vendor),
+            trusted = COALESCE(?, trusted),
+            notes = COALESCE(excluded.notes, notes)
+    '''
+
+    TOTAL = "SELECT value FROM stats_counters WHERE name = 'total_devices'"
+
+    def __init__(self, database, batch_size=5000):
+        self.db = database
+        self.pool = database.pool
+        self.batch_size = batch_size
+
+    def _write_batch(self, batch):
+        rows = [
+            (d['ip'], d['mac'], d['hostname'], d['vendor'], d['trusted'], d['notes'], d['trusted'])
+            for d in batch
+        ]
+        with self.pool.write_lock:
+            with self.pool.transaction() as cursor:
+                # The trigger-maintained counter tells inserts from updates
+                cursor.execute(self.TOTAL)
+                before = cursor.fetchone()[0]
+                with self.db.deferred_search_index(cursor):
+                    cursor.executemany(self.UPSERT, rows)
+                cursor.execute(self.TOTAL)
+                added = cursor.fetchone()[0] - before
+            # Cheaper than patching thousands of entries; reloads on next read
+            self.db.cache.invalidate()
+        return added
+
+    def run(self, path, dry_run=False, report_path=None):
+        """Import path; returns counts and where the rejected rows went"""
+        started = time.monotonic()
+        result = {'read': 0, 'new': 0, 'updated': 0, 'rejected': 0, 'report': None}
+        rejected = []
+        seen = {}
+        batch = []
+        columns = None
+
+        for number, raw in read_rows(path):
+            result['read'] += 1
+            try:
+                if isinstance(raw, RowError):
+                    raise raw
+                if columns is None:
+                    columns = _resolve_columns(raw.keys())
+                    if 'ip' not in columns:
+                        raise ValueError(f"{path}: no ip column (expected one of {', '.join(FIELD_ALIASES['ip'])})")
+                device = normalize_row(raw, columns)
+                if device['ip'] in seen:
+                    raise RowError(f"duplicate of line {seen[device['ip']]}")
+            except RowError as e:
+                rejected.append((number, str(e), raw if isinstance(raw, dict) else {}))
+                continue
+
+            seen[device['ip']] = number
+            batch.append(device)
+            if len(batch) >= self.batch_size:
+                if not dry_run:
+                    result['new'] += self._write_batch(batch)
+                batch = []
+
+        if batch and not dry_run:
+            result['new'] += self._write_batch(batch)
+
+        result['rejected'] = len(rejected)
+        result['updated'] = len(seen) - result['new'] if not dry_run else 0
+        if rejected:
+            result['report'] = self.write_report(rejected, report_path or f'{path}.rejected.csv')
+
+        result['seconds'] = round(time.monotonic() - started, 2)
+        if not dry_run:
+            self.db.log_event('inventory_import', dict(result, source=str(path)), source='import')
+        self.db.log(
+            f"Imported {path}: {result['new']} new, {result['updated']} updated, "
+            f"{result['rejected']} rejected in {result['seconds']}s", "info"
+        )
+        return result
+
+    @staticmethod
+    def write_report(rejected, report_path):
+        """CSV of rejected rows: line, reason, then the original fields"""
+        fields = []
+        for _, _, raw in rejected:
+            for key in raw:
+                if key not in fields:
+                    fields.append(key)
+
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'reason'] + fields)
+            for number, reason, raw in rejected:
+                writer.writerow([number, reason] + [raw.get(key, '') for key in fields])
+        return str(report_path)
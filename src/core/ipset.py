@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import logging
+import subprocess
+
+# Set suffix -> (ipset type, family); one set per kind of blocked entry
+SET_TYPES = {
+    'ip': ('hash:ip', 'inet'),
+    'ip6': ('hash:ip', 'inet6'),
+    'net': ('hash:net', 'inet'),
+    'net6': ('hash:net', 'inet6'),
+    'mac': ('hash:mac', None)
+}
+
+def classify(value):
+    """(set suffix, canonical entry) for an IP, CIDR network or MAC address"""
+    value = str(value).strip()
+    if '/' in value:
+        network = ipaddress.ip_network(value, strict=False)
+        if network.num_addresses == 1:
+            return classify(str(network.network_address))
+        return ('net' if network.version == 4 else 'net6'), str(network)
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        digits = ''.join(c for c in value if c.isalnum())
+        if len(digits) != 12 or any(c not in '0123456789abcdefABCDEF' for c in digits):
+            raise ValueError(f"Not an IP, network or MAC address: '{value}'")
+        return 'mac', ':'.join(digits[i:i + 2] for i in range(0, 12, 2)).upper()
+    return ('ip' if address.version == 4 else 'ip6'), str(address)
+
+class IpsetBlocklist:
+    """Block lists kept in kernel hash sets behind a fixed handful of rules
+
+    The RPT-SWI chain holds one `-m set` DROP rule per set whatever the
+    number of blocked addresses, so a packet costs one hash lookup per set
+    instead of a walk over a rule per device. Blocking and unblocking are
+    set add/del operations and never touch the rules.
+    """
+
+    def __init__(self, chain='RPT-SWI', prefix='rpt-swi', maxelem=262144, log_group=None, logger=None):
+        self.chain = chain
+        self.prefix = prefix
+        self.maxelem = maxelem
+        # NFLOG group that also gets every dropped packet, if any
+        self.log_group = log_group
+        self.logger = logger or logging.getLogger(__name__)
+        self._ready = False
+
+    def set_name(self, kind):
+        return f'{self.prefix}-{kind}'
+
+    def _run(self, args, input=None, check=True):
+        return subprocess.run(args, input=input, capture_output=True, text=True, check=check)
+
+    def _rules(self):
+        """(iptables command, rule spec) for every set the chain must reference"""
+        for kind, (_, family) in SET_TYPES.items():
+            match = ['-m', 'set', '--match-set', self.set_name(kind), 'src']
+            specs = [match + ['-j', 'DROP']]
+            if self.log_group:
+                # Inserted after, so it lands above the DROP it mirrors
+                specs.append(match + ['-j', 'NFLOG', '--nflog-group', str(self.log_group)])
+            for spec in specs:
+                if family in ('inet', None):
+                    yield 'iptables', spec
+                if family in ('inet6', None):
+                    yield 'ip6tables', spec
+
+    def ensure(self):
+        """Create the sets, the chain and its match-set rules if missing"""
+        if self._ready:
+            return
+        for kind, (set_type, family) in SET_TYPES.items():
+            # Per-element counters are what the drop sampler reads
+            args = ['ipset', 'create', self.set_name(kind), set_type,
+                    'maxelem', str(self.maxelem), 'counters', '-exist']
+            if family:
+                args[4:4] = ['family', family]
+            self._run(args)
+
+        for command in ('iptables', 'ip6tables'):
+            if self._run([command, '-n', '-L', self.chain], check=False).returncode != 0:
+                self._run([command, '-N', self.chain])
+                self._run([command, '-A', 'INPUT', '-j', self.chain])
+        for command, spec in self._rules():
+            # Set rules go first so per-device rules of the iptables backend never shadow them
+            if self._run([command, '-C', self.chain] + spec, check=False).returncode != 0:
+                self._run([command, '-I', self.chain, '1'] + spec)
+        self._ready = True
+
+    def apply(self, add=(), remove=()):
+        """Add and remove many entries in one `ipset restore` call
+
+        Entries are IPs, CIDR networks or MACs. Adding a present entry or
+        removing a missing one is not an error, so replaying is safe.
+        """
+        self.ensure()
+        lines = []
+        for verb, values in (('add', add), ('del', remove)):
+            for value in values:
+                kind, entry = classify(value)
+                lines.append(f'{verb} {self.set_name(kind)} {entry}')
+        if lines:
+            self._run(['ipset', 'restore', '-exist'], input='\n'.join(lines) + '\n')
+        return len(lines)
+
+    def block(self, *values):
+        return self.apply(add=[v for v in values if v])
+
+    def unblock(self, *values):
+        return self.apply(remove=[v for v in values if v])
+
+    def contains(self, value):
+        """Whether the kernel set for value holds it"""
+        self.ensure()
+        kind, entry = classify(value)
+        return self._run(['ipset', 'test', self.set_name(kind), entry], check=False).returncode == 0
+
+    def entries(self):
+        """Every blocked entry, grouped by set suffix"""
+        self.ensure()
+        result = {kind: [] for kind in SET_TYPES}
+        names = {self.set_name(kind): kind for kind in SET_TYPES}
+        output = self._run(['ipset', 'save']).stdout
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == 'add' and parts[1] in names:
+                result[names[parts[1]]].append(parts[2])
+        return result
+
+    def counters(self):
+        """{entry: (packets, bytes)} for every blocked entry, read in one `ipset save`
+
+        Sets created before counters were enabled report nothing.
+        """
+        self.ensure()
+        names = {self.set_name(kind) for kind in SET_TYPES}
+        counters = {}
+        for line in self._run(['ipset', 'save']).stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == 'add' and parts[1] in names and 'packets' in parts:
+                counters[parts[2]] = (
+                    int(parts[parts.index('packets') + 1]),
+                    int(parts[parts.index('bytes') + 1])
+                )
+        return counters
+
+    def counts(self):
+        """Number of entries per set, from set headers only"""
+        self.ensure()
+        counts = {}
+        for kind in SET_TYPES:
+            output = self._run(['ipset', 'list', self.set_name(kind), '-terse']).stdout
+            for line in output.splitlines():
+                if line.startswith('Number of entries:'):
+                    counts[kind] = int(line.split(':', 1)[1])
+        return counts
+
+    def flush(self):
+        """Unblock everything at once"""
+        self.ensure()
+        for kind in SET_TYPES:
+            self._run(['ipset', 'flush', self.set_name(kind)])
+
+    def destroy(self):
+        """Remove the match-set rules and the sets"""
+        for command, spec in self._rules():
+            self._run([command, '-D', self.chain] + spec, check=False)
+        for kind in SET_TYPES:
+            self._run(['ipset', 'destroy', self.set_name(kind)], check=False)
+        self._ready = False
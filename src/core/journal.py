@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+
+COLUMNS = 'id, event_time, event_type, event_source, event_data, severity'
+
+def encode_payload(data):
+    """Compact JSON for event_data; None stays NULL"""
+    if data is None:
+        return None
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+def decode_payload(raw):
+    """Inverse of encode_payload; rows written as plain text come back as-is"""
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+def _row_to_event(row):
+    event_id, event_time, event_type, source, data, severity = row
+    return {
+        'id': event_id,
+        'event_time': event_time,
+        'event_type': event_type,
+        'source': source,
+        'data': decode_payload(data),
+        'severity': severity
+    }
+
+class EventJournal:
+    """Append-only event log on the events table
+
+    Appends go through the write queue, so a burst of events is
+    group-committed. Readers page by event id (the rowid), which makes
+    tailing an index seek no matter how large the table grows, and
+    follow() wakes as soon as this process commits a new event.
+    """
+
+    def __init__(self, writer, read, batch_size=500):
+        # read() must return a context manager yielding a cursor
+        self.writer = writer
+        self.read = read
+        self.batch_size = batch_size
+
+        self._last_id = 0
+        self._changed = threading.Condition()
+
+    def _committed(self, event_id):
+        with self._changed:
+            if event_id and event_id > self._last_id:
+                self._last_id = event_id
+            self._changed.notify_all()
+
+    def append(self, event_type, data=None, source=None, severity='info', ts=None,
+               wait=False, timeout=None):
+        """Queue one event; with wait=True returns its id once committed"""
+        row = (
+            int(ts if ts is not None else time.time()),
+            event_type, source, encode_payload(data), severity
+        )
+
+        def insert(cursor):
+            cursor.execute('''
+                INSERT INTO events (event_time, event_type, event_source, event_data, severity)
+                VALUES (?, ?, ?, ?, ?)
+            ''', row)
+            return cursor.lastrowid
+
+        return self.writer.call(insert, wait=wait, timeout=timeout, on_commit=self._committed)
+
+    def append_many(self, events, wait=False, timeout=None):
+        """Queue several events (dicts with append()'s arguments) as one write"""
+        now = int(time.time())
+        rows = [
+            (
+                int(event.get('ts') or now),
+                event['event_type'],
+                event.get('source'),
+                encode_payload(event.get('data')),
+                event.get('severity', 'info')
+            )
+            for event in events
+        ]
+        if not rows:
+            return None
+
+        def insert(cursor):
+            cursor.executemany('''
+                INSERT INTO events (event_time, event_type, event_source, event_data, severity)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute('SELECT last_insert_rowid()')
+            return cursor.fetchone()[0]
+
+        return self.writer.call(insert, wait=wait, timeout=timeout, on_commit=self._committed)
+
+    def last_id(self):
+        """Id of the newest committed event (0 for an empty journal)"""
+        with self.read() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM events')
+            return cursor.fetchone()[0]
+
+    def read_after(self, after_id=0, limit=None, event_types=None):
+        """Events with id > after_id, oldest first, at most limit of them"""
+        limit = limit or self.batch_size
+        sql = f'SELECT {COLUMNS} FROM events WHERE id > ?'
+        params = [after_id]
+        if event_types:
+            # Served by idx_events_type_id: one range seek per type
+            event_types = list(event_types)
+            sql += f" AND event_type IN ({','.join('?' * len(event_types))})"
+            params.extend(event_types)
+        sql += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+
+        with self.read() as cursor:
+            cursor.execute(sql, params)
+            return [_row_to_event(row) for row in cursor.fetchall()]
+
+    def tail(self, count=20, event_types=None):
+        """The newest `count` events, oldest first"""
+        sql = f'SELECT {COLUMNS} FROM events'
+        params = []
+        if event_types:
+            event_types = list(event_types)
+            sql += f" WHERE event_type IN ({','.join('?' * len(event_types))})"
+            params.extend(event_types)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(count)
+
+        with self.read() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [_row_to_event(row) for row in reversed(rows)]
+
+    def follow(self, after_id=None, event_types=None, poll_interval=1.0, stop=None):
+        """Yield events as they are committed, starting after after_id
+
+        after_id=None starts at the current end of the journal. Commits
+        from this process wake the reader immediately; writes from other
+        processes are picked up every poll_interval seconds. Pass a
+        threading.Event as stop to end the generator.
+        """
+        position = self.last_id() if after_id is None else after_id
+
+        while stop is None or not stop.is_set():
+            with self._changed:
+                seen = self._last_id
+            events = self.read_after(position, event_types=event_types)
+            if events:
+                position = events[-1]['id']
+                yield from events
+                if len(events) == self.batch_size:
+                    continue
+
+            # Sleep unless something was committed while we were reading;
+            # `seen` also covers commits the type filter skipped
+            with self._changed:
+                if self._last_id <= max(position, seen):
+                    self._changed.wait(poll_interval)
+
+    def wake(self):
+        """Wake every follow() reader, e.g. so it notices its stop event"""
+        with self._changed:
+            self._changed.notify_all()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Versioned schema migrations tracked with PRAGMA user_version
+
+Both the standalone tool (src/main.py) and the core library open the
+same devices.db, so they share this one schema. Each migration is a
+function taking a cursor; migrate() applies the pending ones in order
+inside the caller's transaction and bumps user_version.
+"""
+
+from src.core.statistics import recompute_counters
+
+NOW_EPOCH = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+DEVICES_TABLE = f'''
+    CREATE TABLE {{name}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip TEXT UNIQUE NOT NULL,
+        mac TEXT,
+        hostname TEXT,
+        vendor TEXT,
+        first_seen INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+        last_seen INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+        status TEXT NOT NULL DEFAULT 'unknown',
+        trusted INTEGER NOT NULL DEFAULT 0,
+        is_blocked INTEGER NOT NULL DEFAULT 0,
+        open_ports TEXT,
+        os_guess TEXT,
+        notes TEXT
+    )
+'''
+
+SCANS_TABLE = f'''
+    CREATE TABLE {{name}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_time INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+        scan_type TEXT,
+        interface TEXT,
+        devices_found INTEGER,
+        duration_seconds REAL,
+        success INTEGER NOT NULL DEFAULT 1
+    )
+'''
+
+EVENTS_TABLE = f'''
+    CREATE TABLE {{name}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_time INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+        event_type TEXT,
+        event_source TEXT,
+        event_data TEXT,
+        severity TEXT DEFAULT 'info'
+    )
+'''
+
+FIREWALL_RULES_TABLE = f'''
+    CREATE TABLE {{name}} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_type TEXT,
+        target_ip TEXT,
+        target_mac TEXT,
+        action TEXT,
+        created_at INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+        expires_at INTEGER,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        notes TEXT
+    )
+'''
+
+def _columns(cursor, table):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cursor.fetchall()]
+
+def _epoch(column, required=False, local=False):
+    """SQL converting a legacy TIMESTAMP column to epoch seconds
+
+    Old rows hold either numbers or text. Text from DEFAULT
+    CURRENT_TIMESTAMP is already UTC; text written through the sqlite3
+    datetime adapter (datetime.now()) is local time, which local=True
+    converts with the 'utc' modifier.
+    """
+    modifier = ", 'utc'" if local else ''
+    expr = (
+        f"CASE WHEN typeof({column}) IN ('integer', 'real') THEN CAST({column} AS INTEGER) "
+        f"ELSE CAST(strftime('%s', {column}{modifier}) AS INTEGER) END"
+    )
+    return f'COALESCE({expr}, {NOW_EPOCH})' if required else expr
+
+def _rebuild(cursor, table, create_sql, mapping, timestamps=None, local_times=()):
+    """Create `table` with the target layout, copying any legacy rows
+
+    mapping is {target column: [legacy column names, preferred first]};
+    timestamps is {target column: required} for columns converted to
+    epoch seconds, and local_times names those of them holding local
+    time text. The copy is a single INSERT ... SELECT, and indexes are
+    created afterwards, so large tables are migrated in one pass.
+    """
+    timestamps = timestamps or {}
+    existing = _columns(cursor, table)
+    if not existing:
+        cursor.execute(create_sql.format(name=table))
+        return 0
+
+    targets = []
+    sources = []
+    for target, candidates in mapping.items():
+        source = next((c for c in candidates if c in existing), None)
+        if source is None:
+            if timestamps.get(target):
+                targets.append(target)
+                sources.append(NOW_EPOCH)
+            continue
+        targets.append(target)
+        if target in timestamps:
+            source = _epoch(source, timestamps[target], local=target in local_times)
+        sources.append(source)
+
+    staging = f'{table}_migrated'
+    cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+    cursor.execute(create_sql.format(name=staging))
+    cursor.execute(f'''
+        INSERT INTO {staging} ({', '.join(targets)})
+        SELECT {', '.join(sources)} FROM {table}
+    ''')
+    copied = cursor.rowcount
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO {table}')
+    return copied
+
+def _v1_unified_schema(cursor):
+    """One devices/scans/events/firewall_rules layout with epoch timestamps"""
+    # The search index and its triggers point at the old devices table;
+    # the database layer recreates and rebuilds them after migrating
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'devices_fts_%'")
+    for (trigger,) in cursor.fetchall():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'devices_fts'")
+    if cursor.fetchone():
+        cursor.execute('DROP TABLE devices_fts')
+
+    for index in ('idx_devices_ip', 'idx_devices_mac', 'idx_devices_status',
+                  'idx_devices_last_seen', 'idx_scans_time', 'idx_events_time'):
+        cursor.execute(f'DROP INDEX IF EXISTS {index}')
+
+    _rebuild(cursor, 'devices', DEVICES_TABLE, {
+        'id': ['id'],
+        'ip': ['ip', 'ip_address'],
+        'mac': ['mac', 'mac_address'],
+        'hostname': ['hostname'],
+        'vendor': ['vendor'],
+        'first_seen': ['first_seen', 'last_seen'],
+        'last_seen': ['last_seen', 'first_seen'],
+        'status': ['status'],
+        'trusted': ['trusted', 'is_trusted'],
+        'is_blocked': ['is_blocked'],
+        'open_ports': ['open_ports'],
+        'os_guess': ['os_guess'],
+        'notes': ['notes']
+    }, timestamps={'first_seen': True, 'last_seen': True},
+       # Both programs wrote these with datetime.now()
+       local_times=('first_seen', 'last_seen'))
+
+    # Core databases only tracked blocking through the status column
+    cursor.execute("UPDATE devices SET is_blocked = 1 WHERE status = 'blocked' AND is_blocked = 0")
+    cursor.execute("UPDATE devices SET status = 'unknown' WHERE status IS NULL")
+
+    _rebuild(cursor, 'scans', SCANS_TABLE, {
+        'id': ['id'],
+        'scan_time': ['scan_time'],
+        'scan_type': ['scan_type'],
+        'interface': ['interface'],
+        'devices_found': ['devices_found'],
+        'duration_seconds': ['duration_seconds'],
+        'success': ['success']
+    }, timestamps={'scan_time': True})
+
+    _rebuild(cursor, 'events', EVENTS_TABLE, {
+        'id': ['id'],
+        'event_time': ['event_time'],
+        'event_type': ['event_type'],
+        'event_source': ['event_source'],
+        'event_data': ['event_data'],
+        'severity': ['severity']
+    }, timestamps={'event_time': True})
+
+    _rebuild(cursor, 'firewall_rules', FIREWALL_RULES_TABLE, {
+        'id': ['id'],
+        'rule_type': ['rule_type'],
+        'target_ip': ['target_ip'],
+        'target_mac': ['target_mac'],
+        'action': ['action'],
+        'created_at': ['created_at'],
+        'expires_at': ['expires_at'],
+        'is_active': ['is_active'],
+        'notes': ['notes']
+    }, timestamps={'created_at': True, 'expires_at': False})
+
+    # Presence history (unchanged layout; already epoch based)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_presence (
+            device_id INTEGER NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            sightings INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (device_id, start_ts)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_presence_rollup (
+            granularity INTEGER NOT NULL,
+            device_id INTEGER NOT NULL,
+            bucket_ts INTEGER NOT NULL,
+            seconds_present INTEGER NOT NULL,
+            PRIMARY KEY (granularity, device_id, bucket_ts)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    ''')
+
+    # Indexes follow the queries: listings filtered by status or trust
+    # and ordered by last_seen (the rowid tail gives the keyset order),
+    # blocked-device lookups, MAC lookups and time-ordered scans/events
+    cursor.execute('CREATE INDEX idx_devices_last_seen ON devices(last_seen)')
+    cursor.execute('CREATE INDEX idx_devices_status_seen ON devices(status, last_seen)')
+    cursor.execute('CREATE INDEX idx_devices_trusted_seen ON devices(trusted, last_seen)')
+    cursor.execute('CREATE INDEX idx_devices_blocked ON devices(last_seen) WHERE is_blocked = 1')
+    cursor.execute('CREATE INDEX idx_devices_mac ON devices(mac, last_seen)')
+    cursor.execute('CREATE INDEX idx_scans_time ON scans(scan_time)')
+    cursor.execute('CREATE INDEX idx_events_time ON events(event_time)')
+    cursor.execute('CREATE INDEX idx_events_type_time ON events(event_type, event_time)')
+    cursor.execute('CREATE INDEX idx_firewall_rules_target ON firewall_rules(target_ip) WHERE is_active = 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_presence_end ON device_presence(end_ts)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rollup_bucket
+        ON device_presence_rollup(granularity, bucket_ts)
+    ''')
+
+def _v2_stats_counters(cursor):
+    """Trigger-maintained dashboard counters and a notifications table"""
+    cursor.execute(f'''
+        CREATE TABLE notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at INTEGER NOT NULL DEFAULT ({NOW_EPOCH}),
+            type TEXT,
+            title TEXT,
+            message TEXT,
+            data TEXT,
+            is_read INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_notifications_unread ON notifications(created_at) WHERE is_read = 0')
+
+    cursor.execute('''
+        CREATE TABLE stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    # Seeded from the same queries --recompute-stats uses
+    recompute_counters(cursor)
+
+    # Each trigger is one UPDATE over at most four counter rows, so the
+    # write path pays a few page touches per changed row
+    cursor.execute('''
+        CREATE TRIGGER stats_devices_insert AFTER INSERT ON devices BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'total_devices' THEN 1
+                WHEN 'online_devices' THEN new.status = 'online'
+                WHEN 'blocked_devices' THEN new.is_blocked = 1
+                WHEN 'trusted_devices' THEN new.trusted = 1
+            END
+            WHERE name IN ('total_devices', 'online_devices', 'blocked_devices', 'trusted_devices');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_devices_delete AFTER DELETE ON devices BEGIN
+            UPDATE stats_counters SET value = value - CASE name
+                WHEN 'total_devices' THEN 1
+                WHEN 'online_devices' THEN old.status = 'online'
+                WHEN 'blocked_devices' THEN old.is_blocked = 1
+                WHEN 'trusted_devices' THEN old.trusted = 1
+            END
+            WHERE name IN ('total_devices', 'online_devices', 'blocked_devices', 'trusted_devices');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_devices_update AFTER UPDATE OF status, is_blocked, trusted ON devices
+        WHEN old.status IS NOT new.status OR old.is_blocked IS NOT new.is_blocked
+          OR old.trusted IS NOT new.trusted
+        BEGIN
+            UPDATE stats_counters SET value = value + CASE name
+                WHEN 'online_devices' THEN (new.status = 'online') - (old.status = 'online')
+                WHEN 'blocked_devices' THEN (new.is_blocked = 1) - (old.is_blocked = 1)
+                WHEN 'trusted_devices' THEN (new.trusted = 1) - (old.trusted = 1)
+            END
+            WHERE name IN ('online_devices', 'blocked_devices', 'trusted_devices');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_scans_insert AFTER INSERT ON scans BEGIN
+            UPDATE stats_counters SET value = CASE name
+                WHEN 'total_scans' THEN value + 1
+                ELSE MAX(value, new.scan_time)
+            END
+            WHERE name IN ('total_scans', 'last_scan');
+        END
+    ''')
+    # Only deleting the newest scan moves last_scan (an index seek)
+    cursor.execute('''
+        CREATE TRIGGER stats_scans_delete AFTER DELETE ON scans BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_scans';
+            UPDATE stats_counters
+            SET value = (SELECT COALESCE(MAX(scan_time), 0) FROM scans)
+            WHERE name = 'last_scan' AND value <= old.scan_time;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_notifications_insert AFTER INSERT ON notifications
+        WHEN new.is_read = 0
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'unread_notifications';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_notifications_delete AFTER DELETE ON notifications
+        WHEN old.is_read = 0
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'unread_notifications';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER stats_notifications_update AFTER UPDATE OF is_read ON notifications
+        WHEN (old.is_read = 0) IS NOT (new.is_read = 0)
+        BEGIN
+            UPDATE stats_counters SET value = value + (new.is_read = 0) - (old.is_read = 0)
+            WHERE name = 'unread_notifications';
+        END
+    ''')
+
+def _v3_event_journal(cursor):
+    """Index events by (event_type, id) for the journal's cursor reads"""
+    # Type-filtered tails page by id; ids and event_time grow together,
+    # so this index also serves the old type + time lookups
+    cursor.execute('DROP INDEX IF EXISTS idx_events_type_time')
+    cursor.execute('CREATE INDEX idx_events_type_id ON events(event_type, id)')
+
+def _v4_timed_rules(cursor):
+    """starts_at for scheduled blocks and an index over every timed rule"""
+    cursor.execute('ALTER TABLE firewall_rules ADD COLUMN starts_at INTEGER')
+    # The block scheduler rebuilds its heap from this after a restart
+    # without reading the permanent rules
+    cursor.execute('''
+        CREATE INDEX idx_firewall_rules_timed ON firewall_rules(id)
+        WHERE is_active = 1 AND (starts_at IS NOT NULL OR expires_at IS NOT NULL)
+    ''')
+
+def _v5_read_notifications(cursor):
+    """Index read notifications by age for the retention purge"""
+    cursor.execute('CREATE INDEX idx_notifications_read ON notifications(created_at) WHERE is_read = 1')
+
+# Append only: position + 1 is the user_version a migration brings the database to
+MIGRATIONS = [
+    _v1_unified_schema,
+    _v2_stats_counters,
+    _v3_event_journal,
+    _v4_timed_rules,
+    _v5_read_notifications,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(cursor):
+    cursor.execute('PRAGMA user_version')
+    return cursor.fetchone()[0]
+
+def migrate(cursor):
+    """Apply pending migrations inside the caller's write transaction
+
+    Returns (old_version, new_version). The caller must hold a write
+    transaction (BEGIN IMMEDIATE) so that two processes opening the same
+    database cannot both migrate it.
+    """
+    version = schema_version(cursor)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this program ({SCHEMA_VERSION})"
+        )
+
+    for migration in MIGRATIONS[version:]:
+        migration(cursor)
+
+    if version < SCHEMA_VERSION:
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return version, SCHEMA_VERSION
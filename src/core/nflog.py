@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import errno
+import logging
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# Netlink / nfnetlink_log constants (linux/netfilter/nfnetlink_log.h)
+NETLINK_NETFILTER = 12
+NFNL_SUBSYS_ULOG = 4
+NFULNL_MSG_PACKET = 0
+NFULNL_MSG_CONFIG = 1
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLMSG_ERROR = 0x2
+
+NFULA_PAYLOAD = 9
+NFULA_HWADDR = 8
+NFULA_CFG_CMD = 1
+NFULA_CFG_MODE = 2
+NFULA_CFG_NLBUFSIZ = 3
+NFULA_CFG_TIMEOUT = 4
+NFULA_CFG_QTHRESH = 5
+NFULNL_CFG_CMD_BIND = 1
+NFULNL_CFG_CMD_UNBIND = 2
+NFULNL_CFG_CMD_PF_BIND = 3
+NFULNL_COPY_PACKET = 2
+
+PACKET_TYPE = (NFNL_SUBSYS_ULOG << 8) | NFULNL_MSG_PACKET
+CONFIG_TYPE = (NFNL_SUBSYS_ULOG << 8) | NFULNL_MSG_CONFIG
+
+PROTOCOLS = {1: 'icmp', 6: 'tcp', 17: 'udp', 58: 'icmpv6', 132: 'sctp'}
+
+EVENT_TYPE = 'blocked_traffic'
+
+def nflog_spec(group):
+    """iptables target logging to group, as iptables-save prints it"""
+    return f'-j NFLOG --nflog-group {group}'
+
+def _attr(attr_type, data):
+    length = 4 + len(data)
+    return struct.pack('=HH', length, attr_type) + data + b'\0' * (-length % 4)
+
+def _config_message(group, attrs, family=socket.AF_UNSPEC, seq=0):
+    body = struct.pack('=BBH', family, 0, socket.htons(group)) + b''.join(attrs)
+    return struct.pack('=IHHII', 16 + len(body), CONFIG_TYPE, NLM_F_REQUEST | NLM_F_ACK, seq, 0) + body
+
+def parse_packet(payload):
+    """(src, dst, protocol number, port, size) from the start of an IP packet, or None
+
+    Addresses stay packed bytes. port is the destination port for
+    TCP/UDP/SCTP, the ICMP type for ICMP, else None; size is the
+    packet's real length even when only its headers were copied.
+    """
+    if len(payload) >= 20 and payload[0] >> 4 == 4:
+        offset = (payload[0] & 0x0f) * 4
+        size, fragment = struct.unpack_from('!H2xH', payload, 2)
+        protocol = payload[9]
+        src, dst = bytes(payload[12:16]), bytes(payload[16:20])
+        if fragment & 0x1fff:
+            # Later fragments carry no transport header
+            return src, dst, protocol, None, size
+    elif len(payload) >= 40 and payload[0] >> 4 == 6:
+        offset = 40
+        size = 40 + struct.unpack_from('!H', payload, 4)[0]
+        protocol = payload[6]
+        src, dst = bytes(payload[8:24]), bytes(payload[24:40])
+    else:
+        return None
+
+    port = None
+    if protocol in (6, 17, 132) and len(payload) >= offset + 4:
+        port = struct.unpack_from('!H', payload, offset + 2)[0]
+    elif protocol in (1, 58) and len(payload) > offset:
+        port = payload[offset]
+    return src, dst, protocol, port, size
+
+def _address(packed):
+    return socket.inet_ntop(socket.AF_INET if len(packed) == 4 else socket.AF_INET6, packed)
+
+class NflogListener:
+    """Dropped packets from an NFLOG group, aggregated per flow
+
+    The drop rules also send each packet to nfnetlink_log, which
+    batches up to `queue_threshold` packets (or `queue_timeout`
+    hundredths of a second) into one netlink read and copies only the
+    first `copy_range` bytes, so headers cross into userspace and
+    payloads don't. Each packet then costs a header parse and one
+    ordered-dict update keyed by (source, destination, protocol, port):
+    no log line, no string formatting, no database write. The table
+    holds at most `max_flows` flows; the least recently seen one is
+    evicted (and emitted) when a new flow arrives. Every
+    `flush_interval` seconds the table is handed to sink(events) as one
+    batch of `blocked_traffic` events.
+    """
+
+    def __init__(self, group, sink, flush_interval=10, max_flows=4096, copy_range=128,
+                 queue_threshold=64, queue_timeout=10, buffer_size=1 << 20, logger=None):
+        # sink([event dict, ...]) takes EventJournal.append_many() events
+        self.group = group
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.max_flows = max_flows
+        self.copy_range = copy_range
+        self.queue_threshold = queue_threshold
+        self.queue_timeout = queue_timeout
+        self.buffer_size = buffer_size
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._flows = OrderedDict()
+        self._evicted = []
+        self.packets = 0
+        self.overruns = 0
+
+        self._socket = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Bind a netlink socket to the group; needs CAP_NET_ADMIN"""
+        if self._socket is not None:
+            return
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_NETFILTER)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+            sock.bind((0, 0))
+            # Only needed before Linux 3.17; newer kernels accept and ignore it
+            for family in (socket.AF_INET, socket.AF_INET6):
+                self._configure(sock, [_attr(NFULA_CFG_CMD, bytes([NFULNL_CFG_CMD_PF_BIND]))],
+                                family=family, check=False)
+            self._configure(sock, [_attr(NFULA_CFG_CMD, bytes([NFULNL_CFG_CMD_BIND]))])
+            self._configure(sock, [
+                _attr(NFULA_CFG_MODE, struct.pack('!IBx', self.copy_range, NFULNL_COPY_PACKET)),
+                _attr(NFULA_CFG_QTHRESH, struct.pack('!I', self.queue_threshold)),
+                _attr(NFULA_CFG_TIMEOUT, struct.pack('!I', self.queue_timeout)),
+                _attr(NFULA_CFG_NLBUFSIZ, struct.pack('!I', 65536))
+            ])
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+
+    def _configure(self, sock, attrs, family=socket.AF_UNSPEC, check=True):
+        sock.send(_config_message(self.group, attrs, family))
+        reply = sock.recv(4096)
+        if len(reply) >= 20 and struct.unpack_from('=H', reply, 4)[0] == NLMSG_ERROR:
+            error = -struct.unpack_from('=i', reply, 16)[0]
+            if error and check:
+                raise OSError(error, f"NFLOG group {self.group}: {errno.errorcode.get(error, error)}")
+
+    def close(self):
+        if self._socket is None:
+            return
+        try:
+            self._configure(self._socket, [_attr(NFULA_CFG_CMD, bytes([NFULNL_CFG_CMD_UNBIND]))], check=False)
+        except OSError:
+            pass
+        self._socket.close()
+        self._socket = None
+
+    def record(self, src, dst, protocol, port, size, mac=None, now=None):
+        """Count one packet of a flow; addresses are packed bytes"""
+        now = now if now is not None else time.time()
+        key = (src, dst, protocol, port)
+        with self._lock:
+            self.packets += 1
+            flow = self._flows.get(key)
+            if flow is not None:
+                flow[0] += 1
+                flow[1] += size
+                flow[3] = now
+                self._flows.move_to_end(key)
+                return
+            if len(self._flows) >= self.max_flows:
+                self._evicted.append(self._flows.popitem(last=False))
+            # [packets, bytes, first seen, last seen, mac]
+            self._flows[key] = [1, size, now, now, mac]
+            evicted = len(self._evicted) >= self.max_flows
+        if evicted:
+            # Flow churn is filling memory faster than the flush interval
+            self._emit(self._take(evicted_only=True))
+
+    def handle(self, data, now=None):
+        """Parse one netlink read, which may hold many packet messages; returns how many were counted"""
+        now = now if now is not None else time.time()
+        view = memoryview(data)
+        offset = 0
+        count = 0
+        while offset + 16 <= len(view):
+            length, message_type = struct.unpack_from('=IH', view, offset)
+            if length < 16:
+                break
+            if message_type == PACKET_TYPE:
+                packet = self._parse_message(view[offset + 20:offset + length])
+                if packet is not None:
+                    self.record(*packet, now=now)
+                    count += 1
+            offset += (length + 3) & ~3
+        return count
+
+    def _parse_message(self, attrs):
+        payload = mac = None
+        offset = 0
+        while offset + 4 <= len(attrs):
+            length, attr_type = struct.unpack_from('=HH', attrs, offset)
+            if length < 4:
+                break
+            attr_type &= 0x3fff
+            if attr_type == NFULA_PAYLOAD:
+                payload = attrs[offset + 4:offset + length]
+            elif attr_type == NFULA_HWADDR:
+                mac_length = struct.unpack_from('!H', attrs, offset + 4)[0]
+                mac = bytes(attrs[offset + 8:offset + 8 + min(mac_length, 8)])
+            offset += (length + 3) & ~3
+        if payload is None:
+            return None
+        packet = parse_packet(payload)
+        return None if packet is None else packet + (mac,)
+
+    def _take(self, evicted_only=False):
+        with self._lock:
+            flows = self._evicted
+            self._evicted = []
+            if not evicted_only:
+                flows.extend(self._flows.items())
+                self._flows = OrderedDict()
+        return flows
+
+    def _emit(self, flows):
+        if not flows:
+            return 0
+        events = []
+        for (src, dst, protocol, port), (packets, byte_count, first, last, mac) in flows:
+            events.append({
+                'event_type': EVENT_TYPE,
+                'source': 'firewall',
+                'ts': first,
+                'data': {
+                    'ip': _address(src),
+                    'mac': ':'.join(f'{b:02X}' for b in mac) if mac else None,
+                    'dst': _address(dst),
+                    'protocol': PROTOCOLS.get(protocol, str(protocol)),
+                    'port': port,
+                    'packets': packets,
+                    'bytes': byte_count,
+                    'first_seen': first,
+                    'last_seen': last
+                }
+            })
+        self.sink(events)
+        return len(events)
+
+    def flush(self):
+        """Hand every aggregated flow to the sink; returns the number of events"""
+        return self._emit(self._take())
+
+    def status(self):
+        with self._lock:
+            return {
+                'group': self.group,
+                'flows': len(self._flows),
+                'packets': self.packets,
+                'overruns': self.overruns
+            }
+
+    def start(self):
+        """Open the socket and read it in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.open()
+        self._stop.clear()
+
+        def loop():
+            buffer = bytearray(self.buffer_size)
+            next_flush = time.time() + self.flush_interval
+            while not self._stop.is_set():
+                self._socket.settimeout(max(0.0, min(1.0, next_flush - time.time())))
+                try:
+                    size = self._socket.recv_into(buffer)
+                    self.handle(memoryview(buffer)[:size])
+                except socket.timeout:
+                    pass
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        self.logger.error(f"NFLOG read failed: {e}")
+                        self._stop.wait(1)
+                    else:
+                        # The kernel dropped log messages; the rules still dropped the packets
+                        self.overruns += 1
+                if time.time() >= next_flush:
+                    next_flush = time.time() + self.flush_interval
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        self.logger.error(f"Blocked traffic flush failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-nflog', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
+        self.close()
+        self.flush()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import subprocess
+
+from src.core.ipset import classify
+
+# Map name (the classify() kind) -> (key type, flags, match expression)
+MAPS = {
+    'ip': ('ipv4_addr', None, 'ip saddr'),
+    'net': ('ipv4_addr', 'interval', 'ip saddr'),
+    'ip6': ('ipv6_addr', None, 'ip6 saddr'),
+    'net6': ('ipv6_addr', 'interval', 'ip6 saddr'),
+    'mac': ('ether_addr', None, 'ether saddr')
+}
+
+VERDICTS = ('drop', 'accept')
+
+def _element_key(key):
+    """Text form of a key from `nft -j` output"""
+    if isinstance(key, dict) and 'elem' in key:
+        # Elements of a map with counters come wrapped with their counter
+        return _element_key(key['elem']['val'])
+    if isinstance(key, dict):
+        if 'prefix' in key:
+            return f"{key['prefix']['addr']}/{key['prefix']['len']}"
+        if 'range' in key:
+            return '-'.join(key['range'])
+    return str(key)
+
+def _verdict(value):
+    if isinstance(value, dict) and value:
+        name, target = next(iter(value.items()))
+        return f"{name} {target['target']}" if isinstance(target, dict) else name
+    return str(value)
+
+class NftablesBlocklist:
+    """Block lists in a dedicated nftables table of verdict maps
+
+    Each address family has a map from source address to verdict; the
+    input chain does one map lookup per family, whatever the number of
+    entries. Every change is one `nft -f` script, which the kernel
+    commits as a single transaction: a batch of hundreds of blocks and
+    unblocks is applied entirely or not at all, with no partial state
+    visible to packets in between.
+    """
+
+    def __init__(self, table='rpt_swi', priority=-10, logger=None):
+        self.table = table
+        self.priority = priority
+        self.logger = logger or logging.getLogger(__name__)
+        self._ready = False
+
+    def set_name(self, kind):
+        return kind
+
+    def _run(self, args, input=None, check=True):
+        return subprocess.run(args, input=input, capture_output=True, text=True, check=check)
+
+    def _commit(self, script):
+        """Apply an nft script as one transaction; raises on any error, changing nothing"""
+        result = self._run(['nft', '-f', '-'], input=script, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(f"nft transaction failed: {result.stderr.strip()}")
+
+    def ruleset(self):
+        """The table definition, as one nft script"""
+        lines = [f'table inet {self.table} {{']
+        for name, (key_type, flags, _) in MAPS.items():
+            lines.append(f'    map {name} {{')
+            lines.append(f'        type {key_type} : verdict')
+            if flags:
+                lines.append(f'        flags {flags}')
+            # Every element gets its own packet/byte counter
+            lines.append('        counter')
+            lines.append('    }')
+        lines.append('    chain input {')
+        lines.append(f'        type filter hook input priority {self.priority}; policy accept;')
+        # Exact addresses are looked up before the networks that may contain them
+        for name, (_, _, match) in MAPS.items():
+            lines.append(f'        {match} vmap @{name}')
+        lines.append('    }')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def ensure(self):
+        """Create the table, its maps and the input chain if missing"""
+        if self._ready:
+            return
+        # Redeclaring an existing table would append its rules a second time
+        if self._run(['nft', 'list', 'table', 'inet', self.table], check=False).returncode != 0:
+            self._commit(self.ruleset())
+        self._ready = True
+
+    def verdicts(self):
+        """{map name: {key: verdict}} for every element, read in one listing"""
+        self.ensure()
+        output = self._run(['nft', '-j', 'list', 'table', 'inet', self.table]).stdout
+        result = {name: {} for name in MAPS}
+        for item in json.loads(output).get('nftables', []):
+            nft_map = item.get('map')
+            if not nft_map or nft_map.get('name') not in result:
+                continue
+            for key, value in nft_map.get('elem', []):
+                result[nft_map['name']][_element_key(key)] = _verdict(value)
+        return result
+
+    def counters(self):
+        """{entry: (packets, bytes)} for every drop element, read in one listing"""
+        self.ensure()
+        output = self._run(['nft', '-j', 'list', 'table', 'inet', self.table]).stdout
+        counters = {}
+        for item in json.loads(output).get('nftables', []):
+            nft_map = item.get('map')
+            if not nft_map or nft_map.get('name') not in MAPS:
+                continue
+            for key, value in nft_map.get('elem', []):
+                if _verdict(value) != 'drop' or not isinstance(key, dict) or 'elem' not in key:
+                    continue
+                counter = key['elem'].get('counter') or {}
+                counters[_element_key(key)] = (counter.get('packets', 0), counter.get('bytes', 0))
+        return counters
+
+    def apply(self, add=(), remove=(), verdict='drop'):
+        """Set `verdict` for every entry in add and clear every entry in remove
+
+        The change is diffed against the current maps first, so entries
+        already in the wanted state are skipped and replaying is safe; the
+        rest goes to the kernel as a single transaction. Returns the
+        number of elements changed.
+        """
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown verdict '{verdict}'")
+        current = self.verdicts()
+        deletes = {name: [] for name in MAPS}
+        inserts = {name: [] for name in MAPS}
+
+        for value in remove:
+            kind, key = classify(value)
+            key = key.lower()
+            if key in current[kind]:
+                deletes[kind].append(key)
+                del current[kind][key]
+        for value in add:
+            kind, key = classify(value)
+            key = key.lower()
+            existing = current[kind].get(key)
+            if existing == verdict:
+                continue
+            if existing is not None:
+                deletes[kind].append(key)
+            inserts[kind].append(f'{key} : {verdict}')
+            current[kind][key] = verdict
+
+        lines = []
+        for name, keys in deletes.items():
+            if keys:
+                lines.append(f"delete element inet {self.table} {name} {{ {', '.join(keys)} }}")
+        for name, elements in inserts.items():
+            if elements:
+                lines.append(f"add element inet {self.table} {name} {{ {', '.join(elements)} }}")
+        if lines:
+            self._commit('\n'.join(lines) + '\n')
+        return sum(len(v) for v in inserts.values()) + sum(len(v) for v in deletes.values())
+
+    def block(self, *values):
+        return self.apply(add=[v for v in values if v])
+
+    def unblock(self, *values):
+        return self.apply(remove=[v for v in values if v])
+
+    def contains(self, value):
+        """Whether value has a drop verdict"""
+        kind, key = classify(value)
+        return self.verdicts()[kind].get(key.lower()) == 'drop'
+
+    def entries(self):
+        """Every blocked (drop) entry, grouped by map"""
+        return {
+            name: [key for key, verdict in elements.items() if verdict == 'drop']
+            for name, elements in self.verdicts().items()
+        }
+
+    def counts(self):
+        """Number of elements per map"""
+        return {name: len(elements) for name, elements in self.verdicts().items()}
+
+    def flush(self):
+        """Clear every map in one transaction"""
+        self.ensure()
+        self._commit(''.join(f'flush map inet {self.table} {name}\n' for name in MAPS))
+
+    def destroy(self):
+        """Delete the whole table"""
+        self._run(['nft', 'delete', 'table', 'inet', self.table], check=False)
+        self._ready = False
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+# Literals and IN-lists are folded so one query shape collects all its calls
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+# Statements EXPLAIN QUERY PLAN has something to say about
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def normalize(sql):
+    """Statement shape: literals become ?, IN (?, ?, ...) becomes (?+)"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _PARAM_LIST.sub('(?+)', sql)
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+class _ShapeStats:
+    __slots__ = ('calls', 'statements', 'total', 'max', 'rows', 'samples')
+
+    def __init__(self, max_samples):
+        self.calls = 0
+        self.statements = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        # Recent durations only; enough for a stable p95
+        self.samples = deque(maxlen=max_samples)
+
+class QueryProfiler:
+    """Per-statement-shape timing for SQLite connections
+
+    Connections opened with connect_kwargs() time every execute() and
+    the fetches that drain it, so a SELECT is charged for the rows it
+    returns as well. The trace callback counts the statements each call
+    really ran: one per executemany row plus every trigger body and FTS
+    shadow-table write it set off. Calls slower than threshold_ms go to
+    the slow-query log with their plan.
+    """
+
+    def __init__(self, threshold_ms=100, max_samples=1000, slow_log_size=100,
+                 log_file=None, logger=None):
+        self.threshold = threshold_ms / 1000
+        self.max_samples = max_samples
+        self.slow_queries = deque(maxlen=slow_log_size)
+
+        self.logger = logger or logging.getLogger('rpt_swi_slow_queries')
+        if log_file and not self.logger.handlers:
+            Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            # Keep slow queries out of the console UI
+            self.logger.propagate = False
+
+        self._shapes = {}
+        self._lock = threading.Lock()
+        # Shape of the statement each thread is running, for the trace callback
+        self._current = threading.local()
+        self.started = time.time()
+
+        self._connection_class = type('ProfiledConnection', (ProfiledConnection,), {'profiler': self})
+
+    def connect_kwargs(self):
+        """Extra sqlite3.connect() arguments that route a connection through the profiler"""
+        return {'factory': self._connection_class}
+
+    def attach(self, connection):
+        """Count raw statements on a connection via its trace callback"""
+        connection.set_trace_callback(self._traced)
+
+    def _traced(self, sql):
+        # Called for every statement SQLite starts, triggers included; the
+        # text is the outer statement's, so it is credited to the running call
+        stats = getattr(self._current, 'stats', None)
+        if stats is not None:
+            stats.statements += 1
+
+    def begin(self, sql):
+        """Register a statement about to run; returns its shape"""
+        shape = normalize(sql)
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats(self.max_samples)
+        self._current.stats = stats
+        return shape
+
+    def record(self, connection, shape, sql, params, elapsed, rows):
+        with self._lock:
+            stats = self._shapes[shape]
+            stats.calls += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.rows += max(rows, 0)
+            stats.samples.append(elapsed)
+
+        if elapsed >= self.threshold:
+            self._log_slow(connection, shape, sql, params, elapsed, rows)
+
+    def _log_slow(self, connection, shape, sql, params, elapsed, rows):
+        plan = []
+        if sql.lstrip().upper().startswith(_EXPLAINABLE) and not isinstance(params, list):
+            try:
+                # Base-class execute: the plan lookup itself is not profiled
+                cursor = sqlite3.Connection.execute(connection, f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[3] for row in cursor.fetchall()]
+            except sqlite3.Error as e:
+                plan = [f'(no plan: {e})']
+
+        entry = {
+            'time': time.time(),
+            'shape': shape,
+            'ms': round(elapsed * 1000, 1),
+            'rows': rows,
+            'plan': plan
+        }
+        self.slow_queries.append(entry)
+        self.logger.warning(
+            f"{entry['ms']} ms, {rows} rows: {shape} | plan: {'; '.join(plan) or '-'}"
+        )
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self.slow_queries.clear()
+            self.started = time.time()
+
+    def report(self, limit=None):
+        """Shapes ordered by total time spent, heaviest first"""
+        with self._lock:
+            rows = [
+                {
+                    'shape': shape,
+                    'calls': stats.calls,
+                    'statements': stats.statements,
+                    'total_ms': round(stats.total * 1000, 1),
+                    'avg_ms': round(stats.total * 1000 / stats.calls, 2),
+                    'p95_ms': round(_percentile(stats.samples, 0.95) * 1000, 2),
+                    'max_ms': round(stats.max * 1000, 1),
+                    'rows': stats.rows
+                }
+                for shape, stats in self._shapes.items()
+                if stats.calls
+            ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def format_report(self, limit=20, width=90):
+        """Plain-text summary for --db-profile"""
+        shapes = self.report()
+        rows = shapes[:limit]
+        total = sum(row['total_ms'] for row in shapes) or 1
+        lines = [
+            f"Query profile over {time.time() - self.started:.0f}s "
+            f"({len(shapes)} statement shapes, {len(self.slow_queries)} slow)",
+            f"{'calls':>7} {'stmts':>8} {'total ms':>10} {'%':>5} {'avg':>8} {'p95':>8} {'max':>8} {'rows':>8}  statement"
+        ]
+        for row in rows:
+            shape = row['shape'] if len(row['shape']) <= width else row['shape'][:width - 3] + '...'
+            lines.append(
+                f"{row['calls']:>7} {row['statements']:>8} {row['total_ms']:>10.1f} {row['total_ms'] * 100 / total:>5.1f} "
+                f"{row['avg_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['max_ms']:>8.1f} {row['rows']:>8}  {shape}"
+            )
+
+        if self.slow_queries:
+            lines.append('')
+            lines.append(f'Slowest queries (>= {self.threshold * 1000:.0f} ms):')
+            for entry in sorted(self.slow_queries, key=lambda e: -e['ms'])[:10]:
+                lines.append(f"  {entry['ms']} ms, {entry['rows']} rows: {entry['shape'][:width]}")
+                for step in entry['plan']:
+                    lines.append(f'      {step}')
+        return '\n'.join(lines)
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's time and row count on completion
+
+    A statement is finished when its rows are exhausted, when the cursor
+    runs the next statement or when it is closed; fetch time counts.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._pending = None
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._pending = [self.connection.profiler.begin(sql), sql, params, 0.0, 0]
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        shape, sql, params, elapsed, rows = pending
+        if rows == 0 and self.rowcount > 0:
+            # INSERT/UPDATE/DELETE: rows affected
+            rows = self.rowcount
+        self.connection.profiler.record(self.connection, shape, sql, params, elapsed, rows)
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[3] += time.perf_counter() - started
+
+    def _run(self, fn, *args):
+        try:
+            return self._timed(fn, *args)
+        finally:
+            # Statements traced from here on are not this one's
+            self.connection.profiler._current.stats = None
+
+    def execute(self, sql, params=()):
+        self._begin(sql, params)
+        result = self._run(super().execute, sql, params)
+        if self.description is None:
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._begin(sql, seq_of_params)
+        result = self._run(super().executemany, sql, seq_of_params)
+        self._finish()
+        return result
+
+    def executescript(self, script):
+        self._begin(script, ())
+        result = self._run(super().executescript, script)
+        self._finish()
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[4] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size or self.arraysize)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            if len(rows) < (size or self.arraysize):
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[4] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors, including execute() shortcuts, are profiled"""
+
+    profiler = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler.attach(self)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from src.core.history import GRANULARITIES
+
+DAY = 86400
+
+# Rows that belong to a device and go with it; {ids} is the deleted device ids
+DEVICE_CHILDREN = (
+    'DELETE FROM device_presence WHERE device_id IN ({ids})',
+    # Every granularity spelled out, so each device is a primary key seek
+    'DELETE FROM device_presence_rollup WHERE granularity IN ('
+    + ', '.join(str(width) for width in GRANULARITIES.values())
+    + ') AND device_id IN ({ids})',
+)
+
+class RetentionJob:
+    """Deletes expired rows in small batches and returns the space to the OS
+
+    Every batch is its own short write transaction on an indexed range,
+    and the writer lock is released between batches, so scans and
+    monitoring keep committing while a large purge is in progress.
+    """
+
+    def __init__(self, database, cleanup_days=30, max_history=1000, device_days=180,
+                 batch_size=2000, pause=0.01, vacuum_pages=256):
+        self.db = database
+        self.pool = database.pool
+
+        self.cleanup_days = cleanup_days
+        # Scans kept regardless of age; 0 disables the cap
+        self.max_history = max_history
+        # Untrusted, unblocked devices unseen this long are dropped; 0 keeps all
+        self.device_days = device_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _delete_batches(self, table, where, params, order_by='id', on_batch=None, children=(),
+                        key=('id',)):
+        """Delete matching rows batch_size at a time, oldest first
+
+        children are DELETE statements run in the same transaction with
+        {ids} replaced by the batch's placeholders. key lists the primary
+        key columns; WITHOUT ROWID tables are deleted one key seek per row.
+        """
+        removed = 0
+        while not self._stop.is_set():
+            with self.pool.write_lock:
+                with self.pool.transaction() as cursor:
+                    cursor.execute(
+                        f"SELECT {', '.join(key)} FROM {table} WHERE {where} ORDER BY {order_by} LIMIT ?",
+                        params + (self.batch_size,)
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    if len(key) == 1:
+                        ids = [row[0] for row in rows]
+                        placeholders = ','.join('?' * len(ids))
+                        for statement in children:
+                            cursor.execute(statement.format(ids=placeholders), ids)
+                        cursor.execute(f'DELETE FROM {table} WHERE {key[0]} IN ({placeholders})', ids)
+                    else:
+                        ids = rows
+                        match = ' AND '.join(f'{column} = ?' for column in key)
+                        cursor.executemany(f'DELETE FROM {table} WHERE {match}', rows)
+                if on_batch is not None:
+                    on_batch(ids)
+            removed += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            # Let queued writers in before the next batch
+            time.sleep(self.pause)
+        return removed
+
+    def _scan_cutoff_time(self):
+        """scan_time of the oldest scan inside the max_history newest, or None"""
+        if not self.max_history:
+            return None
+        with self.pool.read() as cursor:
+            cursor.execute(
+                'SELECT scan_time FROM scans ORDER BY scan_time DESC LIMIT 1 OFFSET ?',
+                (self.max_history - 1,)
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _page_stats(self):
+        with self.pool.read() as cursor:
+            cursor.execute('PRAGMA page_size')
+            page_size = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA freelist_count')
+            free = cursor.fetchone()[0]
+        return page_size, page_count, free
+
+    def vacuum(self):
+        """Release free pages in vacuum_pages steps; returns bytes reclaimed"""
+        with self.pool.read() as cursor:
+            cursor.execute('PRAGMA auto_vacuum')
+            mode = cursor.fetchone()[0]
+
+        page_size, before, free = self._page_stats()
+        if mode != 2:
+            # Only databases created with auto_vacuum=INCREMENTAL (or
+            # converted by enable_incremental_vacuum) can shrink online
+            if free:
+                self.db.log(f"{free} free pages kept; incremental vacuum is not enabled", "debug")
+            return 0
+
+        while free and not self._stop.is_set():
+            # executescript steps the pragma to completion; execute() would
+            # free a single page per call
+            with self.pool.write_lock:
+                self.pool.connection().executescript(
+                    f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})'
+                )
+            _, _, remaining = self._page_stats()
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(self.pause)
+
+        _, after, _ = self._page_stats()
+        return max(before - after, 0) * page_size
+
+    def enable_incremental_vacuum(self):
+        """Switch an existing database to auto_vacuum=INCREMENTAL
+
+        This needs one full VACUUM, which rewrites the file and blocks
+        writers while it runs; it is an explicit maintenance step.
+        """
+        with self.pool.write_lock:
+            conn = self.pool.connection()
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        self.db.log("Enabled incremental vacuum", "info")
+
+    def run(self, now=None):
+        """One retention pass; returns rows removed per table and bytes reclaimed
+
+        Presence history is rolled up first, so this is also what keeps
+        the rollups current; cleanup_days = 0 keeps events, scans,
+        notifications and retired rules.
+        """
+        now = int(now if now is not None else time.time())
+        # 0 keeps everything: no row is older than the epoch
+        cutoff = now - self.cleanup_days * DAY if self.cleanup_days else 0
+
+        with self._lock:
+            report = {}
+            report['events'] = self._delete_batches(
+                'events', 'event_time < ?', (cutoff,), order_by='event_time'
+            )
+
+            keep_from = self._scan_cutoff_time()
+            scan_cutoff = cutoff if keep_from is None else max(cutoff, keep_from)
+            report['scans'] = self._delete_batches(
+                'scans', 'scan_time < ?', (scan_cutoff,), order_by='scan_time'
+            )
+
+            # Walks idx_notifications_read in created_at order
+            report['notifications'] = self._delete_batches(
+                'notifications', 'is_read = 1 AND created_at < ?', (cutoff,), order_by='created_at'
+            )
+
+            # Compacts the firewall rule journal: retired rules only
+            report['firewall_rules'] = self._delete_batches(
+                'firewall_rules', 'is_active = 0 AND created_at < ?', (cutoff,)
+            )
+
+            report['devices'] = 0
+            if self.device_days:
+                report['devices'] = self._delete_batches(
+                    'devices', 'last_seen < ? AND trusted = 0 AND is_blocked = 0',
+                    (now - self.device_days * DAY,),
+                    order_by='last_seen',
+                    on_batch=self.db.cache.remove_many,
+                    children=DEVICE_CHILDREN
+                )
+
+            self.db.history.rollup(now)
+            report['history'] = {}
+            for name, expired in self.db.history.expired(now).items():
+                if expired is None:
+                    report['history'][name] = 0
+                    continue
+                table, key, where, params, order_by = expired
+                report['history'][name] = self._delete_batches(table, where, params, order_by=order_by, key=key)
+            report['bytes_reclaimed'] = self.vacuum()
+
+        self.db.log(f"Retention removed {report}", "info")
+        return report
+
+    def start(self, interval=3600):
+        """Run a retention pass every `interval` seconds in the background"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run()
+                except Exception as e:
+                    self.db.log(f"Retention pass failed: {e}", "error")
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background job; an in-flight pass ends after its current batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
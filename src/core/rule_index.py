@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import logging
+import threading
+import time
+from collections import Counter
+
+from src.core.ipset import classify
+
+# Handles are (chain, spec): an iptables rule as iptables-save prints it
+# without '-A CHAIN', or ('set', entry) for an ipset/nftables element
+SET = 'set'
+
+def rule_keys(chain, spec):
+    """Lookup keys of one rule: ('ip', ip), ('net', cidr), ('mac', mac) or ('port', (port, proto, direction))"""
+    if chain == SET:
+        kind, entry = classify(spec)
+        return [({'ip6': 'ip', 'net6': 'net'}.get(kind, kind), entry)]
+
+    parts = spec.split()
+    keys = []
+    if '-s' in parts:
+        source = parts[parts.index('-s') + 1]
+        if source.endswith(('/32', '/128')):
+            keys.append(('ip', source.rsplit('/', 1)[0]))
+        else:
+            keys.append(('net', str(ipaddress.ip_network(source, strict=False))))
+    if '--mac-source' in parts:
+        keys.append(('mac', parts[parts.index('--mac-source') + 1].upper()))
+    if '--dport' in parts and '-p' in parts:
+        direction = 'output' if chain == 'OUTPUT' else 'input'
+        keys.append(('port', (int(parts[parts.index('--dport') + 1]), parts[parts.index('-p') + 1], direction)))
+    return keys
+
+def parse_iptables_save(output, chain='RPT-SWI'):
+    """(chain exists, [(chain, spec), ...]) for our chain and port DROP rules in INPUT/OUTPUT"""
+    exists = False
+    handles = []
+    for line in output.splitlines():
+        if line.startswith(f':{chain} '):
+            exists = True
+        elif line.startswith('-A '):
+            name, _, spec = line[3:].partition(' ')
+            if name == chain:
+                handles.append((name, spec))
+            elif name in ('INPUT', 'OUTPUT') and '--dport' in spec and spec.endswith('-j DROP'):
+                handles.append((name, spec))
+    return exists, handles
+
+def parse_iptables_counters(output, chain='RPT-SWI'):
+    """[((chain, spec), packets, bytes), ...] for the rules parse_iptables_save keeps, from `iptables-save -c`"""
+    counters = []
+    for line in output.splitlines():
+        if not line.startswith('['):
+            continue
+        counts, _, rule = line.partition(' ')
+        if not rule.startswith('-A '):
+            continue
+        name, _, spec = rule[3:].partition(' ')
+        if name == chain or (name in ('INPUT', 'OUTPUT') and '--dport' in spec and spec.endswith('-j DROP')):
+            packets, _, byte_count = counts.strip('[]').partition(':')
+            counters.append(((name, spec), int(packets), int(byte_count)))
+    return counters
+
+class RuleIndex:
+    """Firewall rules held in memory, keyed by IP, network, MAC and port
+
+    The firewall manager records every rule it adds or removes, so
+    lookups, listings and status never touch the kernel. A reconcile
+    (one kernel dump through `loader`) replaces the index with what the
+    kernel really holds and reports the drift, catching rules added or
+    deleted behind our back; start() runs it periodically.
+    """
+
+    def __init__(self, loader, logger=None):
+        # loader() -> (chain exists, [(chain, spec), ...])
+        self.loader = loader
+        self.logger = logger or logging.getLogger(__name__)
+        self.chain_exists = False
+        self.loaded_at = None
+
+        self._lock = threading.Lock()
+        # Held across a kernel change and its index update, and across a
+        # reconcile's dump and swap, so neither can overwrite the other
+        self.write_lock = threading.RLock()
+        self._handles = Counter()
+        self._by_key = {}
+        self._networks = {}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _add(self, handle):
+        self._handles[handle] += 1
+        for key in rule_keys(*handle):
+            self._by_key.setdefault(key, []).append(handle)
+            if key[0] == 'net':
+                self._networks[key[1]] = ipaddress.ip_network(key[1])
+
+    def _discard(self, handle):
+        if not self._handles[handle]:
+            return
+        self._handles[handle] -= 1
+        if not self._handles[handle]:
+            del self._handles[handle]
+        for key in rule_keys(*handle):
+            handles = self._by_key.get(key)
+            if handles and handle in handles:
+                handles.remove(handle)
+                if not handles:
+                    del self._by_key[key]
+                    if key[0] == 'net':
+                        del self._networks[key[1]]
+
+    def add(self, *handles):
+        with self._lock:
+            for handle in handles:
+                self._add(handle)
+
+    def remove(self, *handles):
+        with self._lock:
+            for handle in handles:
+                self._discard(handle)
+
+    def reconcile(self):
+        """Reload from the kernel; returns the handles that had drifted"""
+        with self.write_lock:
+            return self._reconcile()
+
+    def _reconcile(self):
+        exists, handles = self.loader()
+        fresh = Counter(handles)
+        with self._lock:
+            drift = {
+                'added': list((fresh - self._handles).elements()),
+                'removed': list((self._handles - fresh).elements())
+            }
+            self._handles = Counter()
+            self._by_key = {}
+            self._networks = {}
+            for handle in handles:
+                self._add(handle)
+            self.chain_exists = exists
+            first_load = self.loaded_at is None
+            self.loaded_at = time.time()
+
+        if not first_load and (drift['added'] or drift['removed']):
+            self.logger.warning(
+                f"Firewall rules changed outside RPT-SWI: {len(drift['added'])} added, "
+                f"{len(drift['removed'])} removed"
+            )
+        return drift
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            self.reconcile()
+
+    def handles(self, *keys):
+        """Every rule behind any of keys, duplicates included"""
+        self.ensure_loaded()
+        with self._lock:
+            return [handle for key in keys for handle in self._by_key.get(key, ())]
+
+    def snapshot(self):
+        """{handle: copies} for every indexed rule"""
+        self.ensure_loaded()
+        with self._lock:
+            return Counter(self._handles)
+
+    def contains(self, handle):
+        self.ensure_loaded()
+        with self._lock:
+            return handle in self._handles
+
+    def is_blocked(self, ip):
+        """Whether a rule drops this IP, directly or through a blocked network"""
+        self.ensure_loaded()
+        with self._lock:
+            if ('ip', ip) in self._by_key:
+                return True
+            if not self._networks:
+                return False
+            address = ipaddress.ip_address(ip)
+            return any(address in network for network in self._networks.values())
+
+    def keys(self, kind):
+        """Indexed values of one kind: 'ip', 'net', 'mac' or 'port'"""
+        self.ensure_loaded()
+        with self._lock:
+            return [value for key_kind, value in self._by_key if key_kind == kind]
+
+    def status(self):
+        self.ensure_loaded()
+        with self._lock:
+            kinds = Counter(kind for kind, _ in self._by_key)
+            return {
+                'chain_exists': self.chain_exists,
+                'total_rules': sum(self._handles.values()),
+                'blocked_ips': kinds['ip'] + kinds['net'],
+                'blocked_macs': kinds['mac'],
+                'blocked_ports': sorted(value for kind, value in self._by_key if kind == 'port'),
+                'reconciled_at': self.loaded_at
+            }
+
+    def start(self, interval=60, task=None):
+        """Reconcile with the kernel every interval seconds in the background
+
+        task, if given, runs instead of reconcile() and must reload the index itself.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    (task or self.reconcile)()
+                except Exception as e:
+                    self.logger.error(f"Firewall rule reconcile failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-rule-index', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
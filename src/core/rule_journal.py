@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+from src.core.journal import decode_payload, encode_payload
+
+COLUMNS = 'id, rule_type, target_ip, target_mac, created_at, starts_at, expires_at, notes'
+
+# Rule dict keys stored in their own columns; everything else goes to notes
+_COLUMN_KEYS = ('type', 'ip', 'mac', 'timestamp', 'starts_at', 'expires_at', 'id')
+
+def _row_to_rule(row):
+    rule_id, rule_type, ip, mac, created_at, starts_at, expires_at, notes = row
+    rule = decode_payload(notes) or {}
+    if not isinstance(rule, dict):
+        rule = {'notes': rule}
+    rule.update({
+        'id': rule_id,
+        'type': rule_type,
+        'ip': ip,
+        'mac': mac,
+        'timestamp': created_at,
+        'starts_at': starts_at,
+        'expires_at': expires_at
+    })
+    return rule
+
+class FirewallRuleJournal:
+    """Saved firewall rules as an append-only log on the firewall_rules table
+
+    Blocking appends a row and unblocking retires the target's active
+    rows through the partial index on target_ip, so either costs an
+    index seek however many rules are saved, where the old JSON file was
+    parsed and rewritten whole. Writes ride the write queue: a burst of
+    blocks is one group commit (one WAL sync), and a crash loses at most
+    the batch in flight, never the rules already committed. Retired rows
+    are compacted away by the retention job.
+    """
+
+    def __init__(self, writer, read, batch_size=500):
+        # read() must return a context manager yielding a cursor
+        self.writer = writer
+        self.read = read
+        self.batch_size = batch_size
+
+    def insert(self, cursor, rules):
+        """Insert rules, skipping those an active rule of the same type already covers
+
+        Runs inside the caller's writer transaction; returns the new ids.
+
+        A rule is covered when an existing one for the same target starts
+        no later and ends no earlier, so a scheduled future block never
+        hides an immediate one and a short block never hides a longer one.
+        """
+        ids = []
+        now = int(time.time())
+        for rule in rules:
+            ip = rule.get('ip')
+            if ip:
+                starts_at = rule.get('starts_at') or now
+                expires_at = rule.get('expires_at')
+                cursor.execute('''
+                    SELECT 1 FROM firewall_rules
+                    WHERE target_ip = ? AND is_active = 1 AND rule_type = ?
+                      AND COALESCE(starts_at, 0) <= ?
+                      AND (expires_at IS NULL OR (? IS NOT NULL AND expires_at >= ?))
+                ''', (ip, rule.get('type'), starts_at, expires_at, expires_at))
+                if cursor.fetchone():
+                    continue
+            notes = {k: v for k, v in rule.items() if k not in _COLUMN_KEYS}
+            cursor.execute('''
+                INSERT INTO firewall_rules
+                    (rule_type, target_ip, target_mac, action, created_at, starts_at, expires_at, notes)
+                VALUES (?, ?, ?, 'DROP', ?, ?, ?, ?)
+            ''', (
+                rule.get('type'),
+                ip,
+                rule.get('mac'),
+                int(rule.get('timestamp') or time.time()),
+                rule.get('starts_at'),
+                rule.get('expires_at'),
+                encode_payload(notes or None)
+            ))
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def append(self, rules, wait=False, timeout=None):
+        """Queue rules (dicts as the firewall manager saves them); with wait=True returns their ids"""
+        rules = list(rules)
+        if not rules:
+            return [] if wait else None
+        return self.writer.call(lambda cursor: self.insert(cursor, rules), wait=wait, timeout=timeout)
+
+    def retire(self, ips, rule_types=None, wait=False, timeout=None):
+        """Deactivate the active rules targeting ips, of rule_types only if given
+
+        With wait=True returns the ids retired.
+        """
+        ips = list(dict.fromkeys(ips))
+        if not ips:
+            return [] if wait else None
+        return self.writer.call(lambda cursor: self.retire_rows(cursor, ips, rule_types),
+                                wait=wait, timeout=timeout)
+
+    def retire_rows(self, cursor, ips, rule_types=None):
+        """retire() inside the caller's writer transaction; returns the ids retired"""
+        type_filter = ''
+        if rule_types:
+            rule_types = list(rule_types)
+            type_filter = f" AND rule_type IN ({','.join('?' * len(rule_types))})"
+        ids = []
+        for start in range(0, len(ips), self.batch_size):
+            chunk = list(ips[start:start + self.batch_size])
+            cursor.execute(f'''
+                SELECT id FROM firewall_rules
+                WHERE is_active = 1 AND target_ip IN ({','.join('?' * len(chunk))}){type_filter}
+            ''', chunk + (rule_types or []))
+            ids.extend(row[0] for row in cursor.fetchall())
+        cursor.executemany('UPDATE firewall_rules SET is_active = 0 WHERE id = ?', [(i,) for i in ids])
+        return ids
+
+    def set_active(self, ids, active, wait=True, timeout=None):
+        """Flip rules by id; used to undo an append or a retire"""
+        return self.writer.executemany(
+            'UPDATE firewall_rules SET is_active = ? WHERE id = ?',
+            [(1 if active else 0, rule_id) for rule_id in ids],
+            wait=wait, timeout=timeout
+        )
+
+    def active(self, ips=None):
+        """Active rules, oldest first; only those targeting ips if given"""
+        with self.read() as cursor:
+            if ips is None:
+                cursor.execute(f'SELECT {COLUMNS} FROM firewall_rules WHERE is_active = 1 ORDER BY id')
+                return [_row_to_rule(row) for row in cursor.fetchall()]
+
+            ips = list(dict.fromkeys(ips))
+            rules = []
+            for start in range(0, len(ips), self.batch_size):
+                chunk = ips[start:start + self.batch_size]
+                cursor.execute(f'''
+                    SELECT {COLUMNS} FROM firewall_rules
+                    WHERE is_active = 1 AND target_ip IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                rules.extend(_row_to_rule(row) for row in cursor.fetchall())
+            return sorted(rules, key=lambda rule: rule['id'])
+
+    def by_ids(self, ids):
+        """Active rules with the given ids"""
+        ids = list(ids)
+        rules = []
+        with self.read() as cursor:
+            for start in range(0, len(ids), self.batch_size):
+                chunk = ids[start:start + self.batch_size]
+                cursor.execute(f'''
+                    SELECT {COLUMNS} FROM firewall_rules
+                    WHERE is_active = 1 AND id IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                rules.extend(_row_to_rule(row) for row in cursor.fetchall())
+        return rules
+
+    def timed(self):
+        """Active rules with a start or expiry time, read through idx_firewall_rules_timed"""
+        with self.read() as cursor:
+            cursor.execute(f'''
+                SELECT {COLUMNS} FROM firewall_rules
+                WHERE is_active = 1 AND (starts_at IS NOT NULL OR expires_at IS NOT NULL)
+            ''')
+            return [_row_to_rule(row) for row in cursor.fetchall()]
+
+    def count(self):
+        """Number of active rules"""
+        with self.read() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM firewall_rules WHERE is_active = 1')
+            return cursor.fetchone()[0]
+
+    def import_file(self, path):
+        """Append the rules of a legacy firewall_rules.json; returns how many were new"""
+        with open(path, 'r') as f:
+            rules = json.load(f)
+        return len(self.append([r for r in rules if isinstance(r, dict)], wait=True))
@@ -9,7 +9,6 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import netifaces
 import scapy.all as scapy
-import pandas as pd
 
 class NetworkScanner:
     def __init__(self, database):
@@ -78,16 +77,16 @@ class NetworkScanner:
             except:
                 pass
             
-            self.logger.log(f"Retrieved network info for {len(info['interfaces'])} interfaces")
+            self.logger.info(f"Retrieved network info for {len(info['interfaces'])} interfaces")
             
         except Exception as e:
-            self.logger.log(f"Error getting network info: {str(e)}", level="ERROR")
+            self.logger.error(f"Error getting network info: {str(e)}")
         
         return info
     
     def scan_network(self, interface=None, timeout=30):
         """Scan network using multiple methods"""
-        self.logger.log(f"Starting network scan (timeout: {timeout}s)")
+        self.logger.info(f"Starting network scan (timeout: {timeout}s)")
         
         devices = []
         scan_id = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -117,14 +116,13 @@ class NetworkScanner:
                     try:
                         enriched_devices.append(future.result())
                     except Exception as e:
-                        self.logger.log(f"Error enriching device: {str(e)}")
+                        self.logger.info(f"Error enriching device: {str(e)}")
             
             # Remove duplicates
             unique_devices = self._remove_duplicates(enriched_devices)
             
             # Update database
-            for device in unique_devices:
-                self.db.add_or_update_device(device)
+            self.db.upsert_devices(unique_devices)
             
             self.active_scans[scan_id].update({
                 'status': 'completed',
@@ -132,12 +130,12 @@ class NetworkScanner:
                 'end_time': datetime.now()
             })
             
-            self.logger.log(f"Scan completed: Found {len(unique_devices)} unique devices")
+            self.logger.info(f"Scan completed: Found {len(unique_devices)} unique devices")
             
             return unique_devices
             
         except Exception as e:
-            self.logger.log(f"Scan failed: {str(e)}", level="ERROR")
+            self.logger.error(f"Scan failed: {str(e)}")
             self.active_scans[scan_id]['status'] = 'failed'
             self.active_scans[scan_id]['error'] = str(e)
             return []
@@ -187,7 +185,7 @@ class NetworkScanner:
                 devices.append(device)
                 
         except Exception as e:
-            self.logger.log(f"ARP scan error: {str(e)}")
+            self.logger.info(f"ARP scan error: {str(e)}")
         
         return devices
     
@@ -247,9 +245,9 @@ class NetworkScanner:
                     devices.append(device)
                     
         except subprocess.TimeoutExpired:
-            self.logger.log("Nmap scan timeout")
+            self.logger.info("Nmap scan timeout")
         except Exception as e:
-            self.logger.log(f"Nmap scan error: {str(e)}")
+            self.logger.info(f"Nmap scan error: {str(e)}")
         
         return devices
     
@@ -307,7 +305,7 @@ class NetworkScanner:
                         devices.append(device)
                         
         except Exception as e:
-            self.logger.log(f"ICMP scan error: {str(e)}")
+            self.logger.info(f"ICMP scan error: {str(e)}")
         
         return devices
     
@@ -357,7 +355,7 @@ class NetworkScanner:
                 pass
             
         except Exception as e:
-            self.logger.log(f"Error enriching device {device['ip']}: {str(e)}")
+            self.logger.info(f"Error enriching device {device['ip']}: {str(e)}")
         
         return device
     
@@ -405,7 +403,7 @@ class NetworkScanner:
         """Continuous network monitoring"""
         import time
         
-        self.logger.log(f"Starting continuous monitoring (interval: {interval}s)")
+        self.logger.info(f"Starting continuous monitoring (interval: {interval}s)")
         
         known_devices = set()
         
@@ -418,22 +416,22 @@ class NetworkScanner:
                 new_devices = current_ips - known_devices
                 if new_devices:
                     new_device_list = [d for d in current_devices if d['ip'] in new_devices]
-                    self.logger.log(f"New devices detected: {len(new_devices)}")
+                    self.logger.info(f"New devices detected: {len(new_devices)}")
                     # Send notification
                     # self.notifier.send_new_device_alert(new_device_list)
                 
                 # Detect disappeared devices
                 disappeared_devices = known_devices - current_ips
                 if disappeared_devices:
-                    self.logger.log(f"Devices disappeared: {len(disappeared_devices)}")
+                    self.logger.info(f"Devices disappeared: {len(disappeared_devices)}")
                 
                 known_devices = current_ips
                 
                 time.sleep(interval)
                 
             except KeyboardInterrupt:
-                self.logger.log("Continuous monitoring stopped")
+                self.logger.info("Continuous monitoring stopped")
                 break
             except Exception as e:
-                self.logger.log(f"Monitoring error: {str(e)}", level="ERROR")
+                self.logger.error(f"Monitoring error: {str(e)}")
                 time.sleep(60)
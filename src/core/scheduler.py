@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import threading
+import time
+
+START = 'start'
+EXPIRE = 'expire'
+
+class BlockScheduler:
+    """Pending block starts and expiries on a min-heap, run by one thread
+
+    push() is O(log n) and wakes the thread only when the new deadline is
+    earlier than the one it sleeps on. The thread sleeps until the
+    earliest deadline, pops everything due (up to batch_size) and hands
+    it to handler(entries) in one call, so a thousand rules expiring in
+    the same second cost one firewall transaction. Nothing is ever
+    scanned: a rule unblocked early keeps its entry, and the handler
+    skips rules that are no longer active when their entry comes up.
+    """
+
+    def __init__(self, handler, logger=None, batch_size=1000, retry_delay=60):
+        # handler([(when, action, rule_id), ...]) applies one due batch
+        self.handler = handler
+        self.logger = logger or logging.getLogger(__name__)
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self._heap = []
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def push(self, when, action, rule_id):
+        self.push_many([(when, action, rule_id)])
+
+    def push_many(self, entries):
+        """Queue (when, action, rule_id) entries; action is START or EXPIRE"""
+        with self._changed:
+            earliest = self._heap[0][0] if self._heap else None
+            for when, action, rule_id in entries:
+                heapq.heappush(self._heap, (int(when), action, rule_id))
+            if self._heap and (earliest is None or self._heap[0][0] < earliest):
+                self._changed.notify()
+
+    def pending(self):
+        with self._changed:
+            return len(self._heap)
+
+    def next_deadline(self):
+        with self._changed:
+            return self._heap[0][0] if self._heap else None
+
+    def _due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap))
+        return due
+
+    def run_due(self, now=None):
+        """Apply every entry due by now in the caller's thread; returns how many ran"""
+        now = now if now is not None else time.time()
+        count = 0
+        while True:
+            with self._changed:
+                due = self._due(now)
+            if not due:
+                return count
+            self.handler(due)
+            count += len(due)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                with self._changed:
+                    due = self._due(time.time())
+                    if not due:
+                        timeout = self._heap[0][0] - time.time() if self._heap else None
+                        self._changed.wait(timeout)
+                        continue
+                try:
+                    self.handler(due)
+                except Exception as e:
+                    self.logger.error(f"Scheduled firewall changes failed: {e}")
+                    # Keep the batch; the rules are still active in the database
+                    retry = int(time.time() + self.retry_delay)
+                    self.push_many((retry, action, rule_id) for _, action, rule_id in due)
+
+        self._thread = threading.Thread(target=loop, name='rpt-swi-block-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Counters kept in stats_counters by triggers (see migrations v2), and
+# the aggregate each one is rebuilt from
+COUNTER_QUERIES = {
+    'total_devices': 'SELECT COUNT(*) FROM devices',
+    'online_devices': "SELECT COUNT(*) FROM devices WHERE status = 'online'",
+    'blocked_devices': 'SELECT COUNT(*) FROM devices WHERE is_blocked = 1',
+    'trusted_devices': 'SELECT COUNT(*) FROM devices WHERE trusted = 1',
+    'total_scans': 'SELECT COUNT(*) FROM scans',
+    'last_scan': 'SELECT COALESCE(MAX(scan_time), 0) FROM scans',
+    'unread_notifications': 'SELECT COUNT(*) FROM notifications WHERE is_read = 0'
+}
+
+def read_counters(cursor):
+    """All counters in one primary-key scan of a handful of rows"""
+    cursor.execute('SELECT name, value FROM stats_counters')
+    counters = {name: 0 for name in COUNTER_QUERIES}
+    counters.update(cursor.fetchall())
+    return counters
+
+def recompute_counters(cursor):
+    """Rebuild every counter from the tables; runs in the caller's transaction"""
+    counters = {}
+    for name, query in COUNTER_QUERIES.items():
+        cursor.execute(query)
+        counters[name] = cursor.fetchone()[0]
+
+    cursor.execute('DELETE FROM stats_counters')
+    cursor.executemany(
+        'INSERT INTO stats_counters (name, value) VALUES (?, ?)',
+        list(counters.items())
+    )
+    return counters
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import itertools
+import json
+import logging
+import re
+import subprocess
+
+from src.core.ipset import classify
+
+# Major number of our HTB root qdisc; slot N is class 1:N
+HANDLE = 1
+MAX_SLOT = 0xfffe
+
+RATE_PATTERN = re.compile(r'^\d+(\.\d+)?([kmgt]?bit|[kmgt]?bps)$')
+
+def normalize_rate(rate):
+    """tc rate text for rate; plain numbers are kbit/s"""
+    if isinstance(rate, (int, float)):
+        return f'{rate:g}kbit'
+    text = str(rate).strip().lower()
+    if text.isdigit():
+        return f'{text}kbit'
+    if not RATE_PATTERN.match(text):
+        raise ValueError(f"Invalid rate '{rate}' (use e.g. 512kbit, 2mbit)")
+    return text
+
+def rate_bits(rate):
+    """Bits per second of a tc rate ('1mbit', '1Mbit', '125kbps'); tc units are powers of 1000"""
+    match = re.match(r'^(\d+(?:\.\d+)?)([kmgt]?)(bit|bps)$', normalize_rate(rate))
+    value, prefix, unit = match.groups()
+    bits = float(value) * 1000 ** ' kmgt'.index(prefix or ' ')
+    return round(bits * 8 if unit == 'bps' else bits)
+
+def _target(value):
+    kind, entry = classify(value)
+    if kind not in ('ip', 'net'):
+        raise ValueError(f"Only IPv4 addresses and networks can be throttled: '{value}'")
+    return entry
+
+class DeviceThrottle:
+    """Per-device bandwidth limits as an alternative to DROP
+
+    Each throttled address or network gets its own HTB class on the
+    interface's root qdisc. One rule sets the packet priority from a
+    kernel map keyed by destination address (an ipset with skbinfo, or
+    an nftables map), and HTB takes a priority naming one of its classes
+    as that class without consulting any filter. A packet therefore
+    costs one map lookup and one class hash lookup whatever the number
+    of limited devices; throttling more devices only adds map elements
+    and classes. Shaping applies to traffic this host sends
+    or forwards to the device. Changes are batched: one `tc -batch` and
+    one map update per call.
+
+    The HTB qdisc takes over the interface root. It only replaces the
+    kernel's default root qdisc (handle 0:); if something else already
+    sits there (fq_codel or cake set up by hand, another shaper) ensure()
+    refuses rather than overwrite it, and destroy() deletes only our own
+    qdisc, which brings the kernel default back.
+
+    With netns set every command runs inside that network namespace,
+    so the whole setup can be exercised on a veth pair.
+    """
+
+    def __init__(self, interface=None, backend='ipset', table='rpt_swi', set_name='rpt-swi-throttle',
+                 rate='1mbit', maxelem=65536, netns=None, logger=None):
+        self.interface = interface
+        self.backend = backend
+        self.table = f'{table}_throttle'
+        self.set_name = set_name
+        self.rate = normalize_rate(rate)
+        self.maxelem = maxelem
+        self.netns = netns
+        self.logger = logger or logging.getLogger(__name__)
+        self._ready = False
+
+    @property
+    def ready(self):
+        """Whether the qdisc and class map were set up by this process"""
+        return self._ready
+
+    def _run(self, args, input=None, check=True):
+        if self.netns:
+            args = ['ip', 'netns', 'exec', self.netns] + args
+        return subprocess.run(args, input=input, capture_output=True, text=True, check=check)
+
+    def _interface(self):
+        if not self.interface:
+            # The interface of the default route
+            output = self._run(['ip', '-o', 'route', 'show', 'default']).stdout.split()
+            if 'dev' not in output:
+                raise RuntimeError("No default route; set the throttle interface")
+            self.interface = output[output.index('dev') + 1]
+        return self.interface
+
+    def _classid(self, slot):
+        return f'{HANDLE}:{slot:x}'
+
+    def _slot(self, classid):
+        if isinstance(classid, int):
+            return classid & 0xffff
+        major, _, minor = str(classid).partition(':')
+        return int(minor, 16) if minor else int(major) & 0xffff
+
+    def _root_qdisc(self, interface):
+        """(kind, handle) of the interface's root qdisc, or None"""
+        for line in self._run(['tc', 'qdisc', 'show', 'dev', interface]).stdout.splitlines():
+            parts = line.split()
+            if len(parts) > 3 and parts[0] == 'qdisc' and parts[3] == 'root':
+                return parts[1], parts[2]
+        return None
+
+    def ensure(self):
+        """Create the HTB qdisc, the class map and its rule if missing
+
+        Raises RuntimeError if the interface has a root qdisc that is
+        neither ours nor the kernel default.
+        """
+        if self._ready:
+            return
+        interface = self._interface()
+
+        root = self._root_qdisc(interface)
+        if root != ('htb', f'{HANDLE}:'):
+            if root is not None and root[1] != '0:':
+                raise RuntimeError(
+                    f"{interface} already has a {root[0]} root qdisc (handle {root[1]}); "
+                    "remove it or throttle on another interface"
+                )
+            # Unclassified traffic is sent unshaped (HTB default 0)
+            self._run(['tc', 'qdisc', 'replace', 'dev', interface, 'root', 'handle', f'{HANDLE}:', 'htb'])
+
+        if self.backend == 'nftables':
+            if self._run(['nft', 'list', 'table', 'inet', self.table], check=False).returncode != 0:
+                script = (
+                    f'table inet {self.table} {{\n'
+                    f'    map classes {{\n'
+                    f'        type ipv4_addr : classid\n'
+                    f'        flags interval\n'
+                    f'    }}\n'
+                    f'    chain postrouting {{\n'
+                    f'        type filter hook postrouting priority mangle; policy accept;\n'
+                    f'        meta priority set ip daddr map @classes\n'
+                    f'    }}\n'
+                    f'}}\n'
+                )
+                self._commit(['nft', '-f', '-'], script)
+        else:
+            self._run(['ipset', 'create', self.set_name, 'hash:net', 'family', 'inet', 'skbinfo',
+                       'maxelem', str(self.maxelem), '-exist'])
+            rule = ['POSTROUTING', '-j', 'SET', '--map-set', self.set_name, 'dst', '--map-prio']
+            if self._run(['iptables', '-t', 'mangle', '-C'] + rule, check=False).returncode != 0:
+                self._run(['iptables', '-t', 'mangle', '-A'] + rule)
+        self._ready = True
+
+    def _commit(self, args, script):
+        """Feed a batch script to a command; raises on any error"""
+        result = self._run(args, input=script, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(f"{args[0]} batch failed: {result.stderr.strip()}")
+
+    def _slots(self):
+        """{target: slot} read from the class map"""
+        slots = {}
+        if self.backend == 'nftables':
+            output = self._run(['nft', '-j', 'list', 'map', 'inet', self.table, 'classes']).stdout
+            for item in json.loads(output).get('nftables', []):
+                for key, value in (item.get('map') or {}).get('elem', []):
+                    if isinstance(key, dict) and 'prefix' in key:
+                        key = f"{key['prefix']['addr']}/{key['prefix']['len']}"
+                    slots[_target(key)] = self._slot(value)
+        else:
+            for line in self._run(['ipset', 'save', self.set_name]).stdout.splitlines():
+                parts = line.split()
+                if len(parts) >= 5 and parts[0] == 'add' and 'skbprio' in parts:
+                    slots[_target(parts[2])] = self._slot(parts[parts.index('skbprio') + 1])
+        return slots
+
+    def _map_script(self, add=(), remove=()):
+        """(command, script) updating the class map; add holds (target, slot) pairs"""
+        if self.backend == 'nftables':
+            lines = []
+            if remove:
+                lines.append(f"delete element inet {self.table} classes {{ {', '.join(remove)} }}")
+            if add:
+                elements = ', '.join(f'{target} : {self._classid(slot)}' for target, slot in add)
+                lines.append(f'add element inet {self.table} classes {{ {elements} }}')
+            return ['nft', '-f', '-'], '\n'.join(lines) + '\n'
+        lines = [f'del {self.set_name} {target}' for target in remove]
+        lines += [f'add {self.set_name} {target} skbprio {self._classid(slot)}' for target, slot in add]
+        return ['ipset', 'restore', '-exist'], '\n'.join(lines) + '\n'
+
+    def apply(self, limits=None, remove=()):
+        """Set {target: rate} limits (rate None = default) and lift those in remove
+
+        Targets are IPv4 addresses or networks. A target already limited
+        keeps its class and only has its rate changed. Returns the
+        number of targets changed.
+        """
+        self.ensure()
+        interface = self._interface()
+        limits = {_target(t): normalize_rate(r) if r else self.rate for t, r in (limits or {}).items()}
+        current = self._slots()
+
+        dropped = [t for t in dict.fromkeys(_target(t) for t in remove) if t in current and t not in limits]
+        used = set(current.values())
+        free = (s for s in itertools.count(1) if s not in used)
+        batch = []
+        added = []
+        for target in dropped:
+            batch.append(f'class del dev {interface} classid {self._classid(current.pop(target))}')
+        for target, rate in limits.items():
+            slot = current.get(target)
+            if slot is None:
+                slot = next(free)
+                if slot > MAX_SLOT:
+                    raise RuntimeError("No free throttle classes left")
+                current[target] = slot
+                added.append((target, slot))
+            batch.append(f'class replace dev {interface} parent {HANDLE}: classid {self._classid(slot)} '
+                         f'htb rate {rate} ceil {rate}')
+
+        # Unmap before deleting classes and create classes before mapping,
+        # so no packet is ever steered to a missing class
+        if dropped:
+            self._commit(*self._map_script(remove=dropped))
+        if batch:
+            self._commit(['tc', '-batch', '-'], '\n'.join(batch) + '\n')
+        if added:
+            self._commit(*self._map_script(add=added))
+        return len(dropped) + len(limits)
+
+    def throttle(self, *targets, rate=None):
+        return self.apply({target: rate for target in targets if target})
+
+    def unthrottle(self, *targets):
+        return self.apply(remove=[target for target in targets if target])
+
+    def limits(self):
+        """{target: rate} for everything currently throttled"""
+        self.ensure()
+        rates = {}
+        for line in self._run(['tc', 'class', 'show', 'dev', self._interface()]).stdout.splitlines():
+            parts = line.split()
+            if len(parts) > 2 and parts[:2] == ['class', 'htb'] and 'rate' in parts:
+                major, _, minor = parts[2].partition(':')
+                if major == str(HANDLE):
+                    rates[int(minor, 16)] = parts[parts.index('rate') + 1]
+        return {target: rates.get(slot) for target, slot in self._slots().items()}
+
+    def destroy(self):
+        """Remove our qdisc, the map and its rule; the kernel default root qdisc comes back"""
+        interface = self._interface()
+        if self._root_qdisc(interface) == ('htb', f'{HANDLE}:'):
+            self._run(['tc', 'qdisc', 'del', 'dev', interface, 'root', 'handle', f'{HANDLE}:'], check=False)
+        if self.backend == 'nftables':
+            self._run(['nft', 'delete', 'table', 'inet', self.table], check=False)
+        else:
+            self._run(['iptables', '-t', 'mangle', '-D', 'POSTROUTING', '-j', 'SET',
+                       '--map-set', self.set_name, 'dst', '--map-prio'], check=False)
+            self._run(['ipset', 'destroy', self.set_name], check=False)
+        self._ready = False
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import nullcontext
+
+_STOP = object()
+
+class WriteTicket:
+    """Completion handle of one queued write"""
+
+    __slots__ = ('_event', 'result', 'error')
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def _finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the write is committed; re-raise its error if it failed"""
+        if not self._event.wait(timeout):
+            raise TimeoutError("Queued write was not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class WriteQueue:
+    """Single writer thread that group-commits queued statements
+
+    Callers enqueue and return immediately (fire-and-forget) or pass
+    wait=True to block until their write is committed. The writer takes
+    whatever is queued, up to batch_size or flush_interval seconds worth,
+    and commits it as one transaction; a full queue blocks the producer.
+    """
+
+    def __init__(self, transaction, lock=None, max_queue=10000, batch_size=500,
+                 flush_interval=0.02, put_timeout=None, logger=None,
+                 name='rpt-swi-writer'):
+        # transaction() must return a context manager yielding a cursor
+        # and committing on exit; it is only ever entered by the writer
+        self.transaction = transaction
+        self.lock = lock
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.name = name
+
+        self.stats = {'writes': 0, 'batches': 0, 'failed': 0, 'largest_batch': 0}
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                # Drain pending writes even when the owner never calls close()
+                atexit.register(self.close)
+
+    def _submit(self, op, on_commit, wait, timeout):
+        if self._closed:
+            raise RuntimeError("Write queue is closed")
+        if self._thread is None:
+            self._start()
+
+        ticket = WriteTicket()
+        try:
+            self._queue.put((op, on_commit, ticket), timeout=self.put_timeout)
+        except queue.Full:
+            raise RuntimeError("Write queue is full") from None
+
+        if wait:
+            return ticket.wait(timeout)
+        return ticket
+
+    def execute(self, sql, params=(), wait=False, timeout=None, on_commit=None):
+        """Queue one statement; the result is its rowcount"""
+        return self._submit(
+            lambda cursor: cursor.execute(sql, params).rowcount,
+            on_commit, wait, timeout
+        )
+
+    def executemany(self, sql, rows, wait=False, timeout=None, on_commit=None):
+        """Queue one statement for many parameter rows"""
+        rows = list(rows)
+        return self._submit(
+            lambda cursor: cursor.executemany(sql, rows).rowcount,
+            on_commit, wait, timeout
+        )
+
+    def call(self, fn, wait=False, timeout=None, on_commit=None):
+        """Queue fn(cursor); its return value is the ticket's result
+
+        on_commit(result) runs on the writer thread after the batch is
+        committed, still under the writer lock.
+        """
+        return self._submit(fn, on_commit, wait, timeout)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is committed"""
+        if self._thread is None or self._closed:
+            return
+        self._submit(lambda cursor: None, None, True, timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """Commit what is queued and stop the writer thread"""
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with self.lock if self.lock is not None else nullcontext():
+                with self.transaction() as cursor:
+                    for op, on_commit, ticket in batch:
+                        # A failing write only rolls back itself, not the batch
+                        cursor.execute('SAVEPOINT queued_write')
+                        try:
+                            result = op(cursor)
+                        except Exception as e:
+                            cursor.execute('ROLLBACK TO queued_write')
+                            cursor.execute('RELEASE queued_write')
+                            outcomes.append((on_commit, ticket, None, e))
+                        else:
+                            cursor.execute('RELEASE queued_write')
+                            outcomes.append((on_commit, ticket, result, None))
+
+                for on_commit, ticket, result, error in outcomes:
+                    if error is None and on_commit is not None:
+                        try:
+                            on_commit(result)
+                        except Exception as e:
+                            self.logger.error(f"Write commit hook failed: {e}")
+        except Exception as e:
+            self.logger.error(f"Write batch of {len(batch)} failed: {e}")
+            self.stats['failed'] += len(batch)
+            for _, _, ticket in batch:
+                ticket._finish(error=e)
+            return
+
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(batch)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+
+        for _, ticket, result, error in outcomes:
+            if error is not None:
+                self.stats['failed'] += 1
+                self.logger.error(f"Queued write failed: {error}")
+            ticket._finish(result, error)
@@ -21,6 +21,17 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 import logging
+from contextlib import contextmanager
+
+from src.core.backup import DatabaseBackup
+from src.core.exporter import StreamingExporter, TABLES as EXPORT_TABLES
+from src.core.ipset import IpsetBlocklist
+from src.core.nftables import NftablesBlocklist
+from src.core.journal import EventJournal
+from src.core.migrations import migrate
+from src.core.profiler import QueryProfiler
+from src.core.statistics import read_counters, recompute_counters
+from src.core.writer import WriteQueue
 
 # ==================== COLORS & UI ====================
 class Colors:
@@ -80,7 +91,7 @@ class Banner:
 class DeviceDatabase:
     """مدیریت پایگاه داده دستگاه‌ها"""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, profiler: Optional[QueryProfiler] = None):
         """مقداردهی اولیه پایگاه داده"""
         if db_path is None:
             config_dir = Path.home() / '.config' / 'rpt-swi'
@@ -89,137 +100,99 @@ class DeviceDatabase:
         
         self.db_path = db_path
         self.connection = None
+        # با --db-profile همه اتصال‌ها زمان پرس‌وجوها را گزارش می‌کنند
+        self.profiler = profiler
+        self._connect_kwargs = profiler.connect_kwargs() if profiler else {}
         self._init_database()
+        
+        # رویدادها و گزارش اسکن‌ها در صف نوشته می‌شوند و یک نخ جداگانه
+        # آن‌ها را دسته‌ای commit می‌کند تا اسکن و فایروال منتظر دیسک نمانند
+        self._writer_connection = None
+        self.writer = WriteQueue(self._writer_transaction)
+        self.journal = EventJournal(self.writer, self._read_cursor)
+        self.backup = DatabaseBackup(db_path)
     
     def _init_database(self):
         """ایجاد جداول پایگاه داده"""
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            self.connection = sqlite3.connect(self.db_path, **self._connect_kwargs)
             cursor = self.connection.cursor()
             
-            # جدول دستگاه‌ها
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS devices (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ip_address TEXT UNIQUE NOT NULL,
-                    mac_address TEXT,
-                    hostname TEXT,
-                    vendor TEXT,
-                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'unknown',
-                    is_trusted INTEGER DEFAULT 0,
-                    is_blocked INTEGER DEFAULT 0,
-                    open_ports TEXT,
-                    os_guess TEXT,
-                    notes TEXT
-                )
-            ''')
-            
-            # جدول اسکن‌ها
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS scans (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    scan_type TEXT,
-                    interface TEXT,
-                    devices_found INTEGER,
-                    duration_seconds REAL,
-                    success INTEGER DEFAULT 1
-                )
-            ''')
-            
-            # جدول رویدادها
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    event_type TEXT,
-                    event_source TEXT,
-                    event_data TEXT,
-                    severity TEXT DEFAULT 'info'
-                )
-            ''')
-            
-            # جدول قوانین فایروال
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS firewall_rules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    rule_type TEXT,
-                    target_ip TEXT,
-                    target_mac TEXT,
-                    action TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    is_active INTEGER DEFAULT 1,
-                    notes TEXT
-                )
-            ''')
+            # حالت WAL: خواندن در نخ اصلی با نخ نویسنده تداخل ندارد
+            # auto_vacuum فقط روی پایگاه داده خالی اعمال می‌شود
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
             
-            # ایجاد ایندکس‌ها
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_ip ON devices(ip_address)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_mac ON devices(mac_address)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_status ON devices(status)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_time ON scans(scan_time)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_time ON events(event_time)')
+            # ساخت یا ارتقای جداول تا آخرین نسخه طرح مشترک (src/core/migrations.py)
+            cursor.execute('BEGIN IMMEDIATE')
+            old_version, new_version = migrate(cursor)
+            if old_version != new_version:
+                print(f"{Colors.CYAN}Database schema upgraded: v{old_version} -> v{new_version}{Colors.END}")
             
             self.connection.commit()
             
-        except sqlite3.Error as e:
+        except (sqlite3.Error, RuntimeError) as e:
+            if self.connection and self.connection.in_transaction:
+                self.connection.rollback()
             print(f"{Colors.RED}Database error: {e}{Colors.END}")
             raise
     
     def add_device(self, device: Dict) -> bool:
         """افزودن یا به‌روزرسانی دستگاه"""
+        return self.upsert_devices([device]) is not None
+    
+    def upsert_devices(self, devices: List[Dict]) -> Optional[Dict[str, int]]:
+        """افزودن یا به‌روزرسانی دستگاه‌های یک اسکن در یک تراکنش"""
+        # در صورت تکرار یک IP، آخرین مورد معتبر است
+        by_ip = {}
+        for device in devices:
+            if device.get('ip'):
+                by_ip[device['ip']] = device
+        
+        if not by_ip:
+            return {'new': 0, 'updated': 0}
+        
+        now = int(time.time())
+        rows = [
+            (ip, d.get('mac'), d.get('hostname'), d.get('vendor'), now, now)
+            for ip, d in by_ip.items()
+        ]
+        
         try:
             cursor = self.connection.cursor()
             
-            # بررسی وجود دستگاه
-            cursor.execute(
-                "SELECT id FROM devices WHERE ip_address = ? OR mac_address = ?",
-                (device.get('ip'), device.get('mac'))
-            )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # به‌روزرسانی دستگاه موجود
-                cursor.execute('''
-                    UPDATE devices SET
-                        mac_address = COALESCE(?, mac_address),
-                        hostname = COALESCE(?, hostname),
-                        vendor = COALESCE(?, vendor),
-                        last_seen = ?,
-                        status = 'online'
-                    WHERE ip_address = ? OR mac_address = ?
-                ''', (
-                    device.get('mac'),
-                    device.get('hostname'),
-                    device.get('vendor'),
-                    datetime.now(),
-                    device.get('ip'),
-                    device.get('mac')
-                ))
-            else:
-                # افزودن دستگاه جدید
-                cursor.execute('''
-                    INSERT INTO devices 
-                    (ip_address, mac_address, hostname, vendor, first_seen, last_seen, status)
-                    VALUES (?, ?, ?, ?, ?, ?, 'online')
-                ''', (
-                    device.get('ip'),
-                    device.get('mac'),
-                    device.get('hostname'),
-                    device.get('vendor'),
-                    datetime.now(),
-                    datetime.now()
-                ))
+            # شمارش دستگاه‌های موجود با ایندکس یکتای ip
+            ips = list(by_ip)
+            existing = 0
+            for i in range(0, len(ips), 500):
+                chunk = ips[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM devices WHERE ip IN ({placeholders})",
+                    chunk
+                )
+                existing += cursor.fetchone()[0]
+            
+            cursor.executemany('''
+                INSERT INTO devices
+                (ip, mac, hostname, vendor, first_seen, last_seen, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'online')
+                ON CONFLICT(ip) DO UPDATE SET
+                    mac = COALESCE(excluded.mac, mac),
+                    hostname = COALESCE(excluded.hostname, hostname),
+                    vendor = COALESCE(excluded.vendor, vendor),
+                    last_seen = excluded.last_seen,
+                    status = 'online'
+            ''', rows)
             
             self.connection.commit()
-            return True
+            return {'new': len(rows) - existing, 'updated': existing}
             
         except sqlite3.Error as e:
-            print(f"{Colors.RED}Error adding device: {e}{Colors.END}")
-            return False
+            self.connection.rollback()
+            print(f"{Colors.RED}Error adding devices: {e}{Colors.END}")
+            return None
     
     def get_devices(self, status: str = None, trusted: bool = None) -> List[Dict]:
         """دریافت لیست دستگاه‌ها"""
@@ -234,7 +207,7 @@ class DeviceDatabase:
                 params.append(status)
             
             if trusted is not None:
-                query += " AND is_trusted = ?"
+                query += " AND trusted = ?"
                 params.append(1 if trusted else 0)
             
             query += " ORDER BY last_seen DESC"
@@ -254,25 +227,123 @@ class DeviceDatabase:
             print(f"{Colors.RED}Error getting devices: {e}{Colors.END}")
             return []
     
-    def log_event(self, event_type: str, source: str, data: str, severity: str = "info"):
-        """ثبت رویداد در پایگاه داده"""
+    def get_statistics(self) -> Dict[str, int]:
+        """شمارنده‌های آماری (با تریگر به‌روز می‌شوند، بدون شمارش جدول‌ها)"""
         try:
-            cursor = self.connection.cursor()
-            
-            cursor.execute('''
-                INSERT INTO events (event_type, event_source, event_data, severity)
-                VALUES (?, ?, ?, ?)
-            ''', (event_type, source, data, severity))
+            return read_counters(self.connection.cursor())
+        except sqlite3.Error as e:
+            print(f"{Colors.RED}Error reading statistics: {e}{Colors.END}")
+            return {}
+    
+    def recompute_statistics(self) -> Dict[str, int]:
+        """ساخت دوباره شمارنده‌ها از روی جدول‌ها"""
+        # نوشتن‌های در صف ابتدا ثبت شوند
+        self.writer.flush()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            stats = recompute_counters(cursor)
+            self.connection.commit()
+            return stats
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            print(f"{Colors.RED}Error recomputing statistics: {e}{Colors.END}")
+            return {}
+    
+    def export(self, table: str, destination: str, **options) -> Optional[int]:
+        """خروجی جریانی یک جدول در فایل (NDJSON، CSV یا JSON، با فشرده‌سازی اختیاری)"""
+        try:
+            self.writer.flush()
+            return StreamingExporter(self._read_cursor).export(table, destination, **options)
+        except (sqlite3.Error, OSError, ValueError, RuntimeError) as e:
+            print(f"{Colors.RED}Export failed: {e}{Colors.END}")
+            return None
+    
+    def backup_database(self) -> Optional[Path]:
+        """پشتیبان فشرده از پایگاه داده بدون متوقف کردن نوشتن‌ها"""
+        try:
+            self.writer.flush()
+            return self.backup.create()
+        except (sqlite3.Error, OSError) as e:
+            print(f"{Colors.RED}Backup failed: {e}{Colors.END}")
+            return None
+    
+    def restore_database(self, backup_path: str) -> Optional[Dict]:
+        """بازیابی پایگاه داده از یک پشتیبان بررسی‌شده"""
+        try:
+            self.writer.flush()
+            report = self.backup.restore(backup_path, self.connection)
             
+            # پشتیبان‌های قدیمی‌تر به آخرین نسخه طرح ارتقا داده می‌شوند
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            migrate(cursor)
             self.connection.commit()
+            return report
+        except (sqlite3.Error, OSError, ValueError, RuntimeError) as e:
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            print(f"{Colors.RED}Restore failed: {e}{Colors.END}")
+            return None
+    
+    @contextmanager
+    def _read_cursor(self):
+        """مکان‌نما برای خواندن روی اتصال اصلی"""
+        cursor = self.connection.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    
+    @contextmanager
+    def _writer_transaction(self):
+        """تراکنش روی اتصال اختصاصی نخ نویسنده"""
+        if self._writer_connection is None:
+            self._writer_connection = sqlite3.connect(
+                self.db_path, isolation_level=None, check_same_thread=False,
+                **self._connect_kwargs
+            )
+            self._writer_connection.execute('PRAGMA synchronous=NORMAL')
+        
+        cursor = self._writer_connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            self._writer_connection.rollback()
+            raise
+        else:
+            self._writer_connection.commit()
+        finally:
+            cursor.close()
+    
+    def set_device_blocked(self, ip: str, mac: str = None, blocked: bool = True) -> int:
+        """ثبت وضعیت مسدود بودن دستگاه از طریق صف نوشتن"""
+        # روی اتصال اصلی تراکنش باز نمی‌ماند که نخ نویسنده را قفل کند
+        return self.writer.execute(
+            "UPDATE devices SET is_blocked = ? WHERE ip = ? OR mac = ?",
+            (1 if blocked else 0, ip, mac),
+            wait=True
+        )
+    
+    def log_event(self, event_type: str, source: str, data: Any, severity: str = "info",
+                  wait: bool = False) -> bool:
+        """ثبت رویداد در دفترچه رویدادها (بدون انتظار، مگر با wait=True)"""
+        try:
+            # داده به صورت JSON فشرده ذخیره می‌شود (src/core/journal.py)
+            self.journal.append(event_type, data, source=source, severity=severity, wait=wait)
             return True
             
-        except sqlite3.Error as e:
+        except (sqlite3.Error, RuntimeError) as e:
             print(f"{Colors.RED}Error logging event: {e}{Colors.END}")
             return False
     
     def close(self):
         """بستن اتصال به پایگاه داده"""
+        # ابتدا صف نوشتن تخلیه می‌شود
+        self.writer.close()
+        if self._writer_connection:
+            self._writer_connection.close()
         if self.connection:
             self.connection.close()
 
@@ -367,8 +438,7 @@ class NetworkScanner:
                     device['vendor'] = self._get_vendor_from_mac(device['mac'])
             
             # ذخیره در پایگاه داده
-            for device in devices:
-                self.db.add_device(device)
+            self.db.upsert_devices(devices)
             
             # ثبت اسکن
             duration = time.time() - start_time
@@ -532,14 +602,10 @@ class NetworkScanner:
     def _log_scan(self, scan_type: str, devices_found: int, duration: float, interface: str):
         """ثبت اطلاعات اسکن در پایگاه داده"""
         try:
-            cursor = self.db.connection.cursor()
-            
-            cursor.execute('''
-                INSERT INTO scans (scan_type, interface, devices_found, duration_seconds)
-                VALUES (?, ?, ?, ?)
-            ''', (scan_type, interface, devices_found, duration))
-            
-            self.db.connection.commit()
+            self.db.writer.execute('''
+                INSERT INTO scans (scan_time, scan_type, interface, devices_found, duration_seconds)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (int(time.time()), scan_type, interface, devices_found, duration))
             
         except Exception as e:
             print(f"{Colors.YELLOW}Failed to log scan: {e}{Colors.END}")
@@ -548,14 +614,26 @@ class NetworkScanner:
 class FirewallManager:
     """مدیریت فایروال"""
     
-    def __init__(self, database: DeviceDatabase):
+    def __init__(self, database: DeviceDatabase, backend: str = "iptables"):
         self.db = database
         self.chain_name = "RPT-SWI"
+        # در حالت ipset/nftables آدرس‌ها در مجموعه‌ها/نگاشت‌های کرنل نگه داشته
+        # می‌شوند و تعداد قوانین با تعداد دستگاه‌ها زیاد نمی‌شود
+        self.blocklist = None
+        if backend == "ipset":
+            self.blocklist = IpsetBlocklist(self.chain_name)
+        elif backend == "nftables":
+            self.blocklist = NftablesBlocklist()
         self._ensure_chain_exists()
     
     def _ensure_chain_exists(self):
         """اطمینان از وجود زنجیره فایروال"""
         try:
+            if self.blocklist:
+                self.blocklist.ensure()
+                return
+            
+
             # بررسی وجود زنجیره
             result = subprocess.run(['iptables', '-L', self.chain_name, '-n'],
                                   capture_output=True,
@@ -570,31 +648,35 @@ class FirewallManager:
         except Exception as e:
             Colors.print(f"⚠ Firewall chain error: {e}", Colors.YELLOW)
     
+    def _rule_specs(self, ip_address: str, mac_address: str = None) -> List[List[str]]:
+        """مشخصات قوانین DROP یک دستگاه"""
+        specs = [['-s', ip_address, '-j', 'DROP']]
+        if mac_address:
+            # همان قانونی که src/core/firewall.py می‌سازد، تا همگام‌سازی آن را حذف نکند
+            specs.append(['-s', ip_address, '-m', 'mac', '--mac-source', mac_address.upper(), '-j', 'DROP'])
+        return specs
+    
     def block_device(self, ip_address: str, mac_address: str = None, comment: str = "") -> bool:
         """مسدودسازی دستگاه"""
         try:
-            # مسدودسازی با IP
-            cmd = ['iptables', '-A', self.chain_name, '-s', ip_address, '-j', 'DROP']
-            subprocess.run(cmd, check=True)
-            
-            # مسدودسازی با MAC اگر موجود باشد
-            if mac_address:
-                cmd = ['iptables', '-A', self.chain_name, '-m', 'mac',
-                      '--mac-source', mac_address, '-j', 'DROP']
-                subprocess.run(cmd, check=True)
+            if self.blocklist:
+                self.blocklist.block(ip_address, mac_address)
+            else:
+                # مسدودسازی با IP و در صورت وجود با MAC؛ قانون تکراری اضافه نمی‌شود
+                for spec in self._rule_specs(ip_address, mac_address):
+                    exists = subprocess.run(['iptables', '-C', self.chain_name] + spec,
+                                            stderr=subprocess.DEVNULL).returncode == 0
+                    if not exists:
+                        subprocess.run(['iptables', '-A', self.chain_name] + spec, check=True)
             
             # به‌روزرسانی وضعیت در پایگاه داده
-            cursor = self.db.connection.cursor()
-            cursor.execute(
-                "UPDATE devices SET is_blocked = 1 WHERE ip_address = ? OR mac_address = ?",
-                (ip_address, mac_address)
-            )
+            self.db.set_device_blocked(ip_address, mac_address, True)
             
             # ثبت رویداد
             self.db.log_event(
                 "device_blocked",
                 "firewall",
-                json.dumps({'ip': ip_address, 'mac': mac_address, 'comment': comment}),
+                {'ip': ip_address, 'mac': mac_address, 'comment': comment},
                 "warning"
             )
             
@@ -608,28 +690,23 @@ class FirewallManager:
     def unblock_device(self, ip_address: str, mac_address: str = None) -> bool:
         """آزادسازی دستگاه"""
         try:
-            # حذف قوانین IP
-            subprocess.run(['iptables', '-D', self.chain_name, '-s', ip_address, '-j', 'DROP'],
-                         stderr=subprocess.DEVNULL)
-            
-            # حذف قوانین MAC
-            if mac_address:
-                subprocess.run(['iptables', '-D', self.chain_name, '-m', 'mac',
-                              '--mac-source', mac_address, '-j', 'DROP'],
-                             stderr=subprocess.DEVNULL)
+            if self.blocklist:
+                self.blocklist.unblock(ip_address, mac_address)
+            else:
+                # حذف همه نسخه‌های قوانین IP و MAC، نه فقط اولین نسخه
+                for spec in self._rule_specs(ip_address, mac_address):
+                    while subprocess.run(['iptables', '-D', self.chain_name] + spec,
+                                         stderr=subprocess.DEVNULL).returncode == 0:
+                        pass
             
             # به‌روزرسانی وضعیت در پایگاه داده
-            cursor = self.db.connection.cursor()
-            cursor.execute(
-                "UPDATE devices SET is_blocked = 0 WHERE ip_address = ? OR mac_address = ?",
-                (ip_address, mac_address)
-            )
+            self.db.set_device_blocked(ip_address, mac_address, False)
             
             # ثبت رویداد
             self.db.log_event(
                 "device_unblocked",
                 "firewall",
-                json.dumps({'ip': ip_address, 'mac': mac_address}),
+                {'ip': ip_address, 'mac': mac_address},
                 "info"
             )
             
@@ -666,6 +743,14 @@ class FirewallManager:
         }
         
         try:
+            if self.blocklist:
+                # شمارش از سربرگ مجموعه‌ها، بدون فهرست کردن قوانین
+                counts = self.blocklist.counts()
+                status['chain_exists'] = True
+                status['total_rules'] = sum(counts.values())
+                status['blocked_ips'] = sum(n for kind, n in counts.items() if kind != 'mac')
+                return status
+            
             # بررسی وجود زنجیره
             result = subprocess.run(['iptables', '-L', self.chain_name, '-n'],
                                   capture_output=True,
@@ -708,8 +793,8 @@ class DisplayManager:
         print("-"*85)
         
         for i, device in enumerate(devices, 1):
-            ip = device.get('ip_address', device.get('ip', 'Unknown'))
-            mac = device.get('mac_address', device.get('mac', 'Unknown'))
+            ip = device.get('ip') or 'Unknown'
+            mac = device.get('mac') or 'Unknown'
             hostname = device.get('hostname', 'Unknown')
             vendor = device.get('vendor', 'Unknown')[:20]
             
@@ -718,7 +803,7 @@ class DisplayManager:
                 status = f"{Colors.GREEN}[YOU]{Colors.END}"
             elif device.get('is_blocked'):
                 status = f"{Colors.RED}[BLOCKED]{Colors.END}"
-            elif device.get('is_trusted'):
+            elif device.get('trusted'):
                 status = f"{Colors.BLUE}[TRUSTED]{Colors.END}"
             else:
                 status = ""
@@ -778,11 +863,11 @@ class DisplayManager:
 class RPTswiApplication:
     """کلاس اصلی برنامه"""
     
-    def __init__(self):
+    def __init__(self, profiler: Optional[QueryProfiler] = None, firewall_backend: str = "iptables"):
         """مقداردهی اولیه برنامه"""
-        self.db = DeviceDatabase()
+        self.db = DeviceDatabase(profiler=profiler)
         self.scanner = NetworkScanner(self.db)
-        self.firewall = FirewallManager(self.db)
+        self.firewall = FirewallManager(self.db, firewall_backend)
         self.display = DisplayManager()
         self.running = True
         
@@ -890,7 +975,7 @@ class RPTswiApplication:
         elif choice == "3":
             filtered_devices = [d for d in devices if d.get('is_blocked')]
         elif choice == "4":
-            filtered_devices = [d for d in devices if d.get('is_trusted')]
+            filtered_devices = [d for d in devices if d.get('trusted')]
         elif choice == "5":
             return
         else:
@@ -915,8 +1000,8 @@ class RPTswiApplication:
                     if 0 <= num < len(filtered_devices):
                         device = filtered_devices[num]
                         self.firewall.block_device(
-                            device.get('ip_address', device.get('ip')),
-                            device.get('mac_address', device.get('mac')),
+                            device.get('ip'),
+                            device.get('mac'),
                             "Manual block"
                         )
                 except:
@@ -929,11 +1014,11 @@ class RPTswiApplication:
                         device = filtered_devices[num]
                         cursor = self.db.connection.cursor()
                         cursor.execute(
-                            "UPDATE devices SET is_trusted = 1 WHERE ip_address = ?",
-                            (device.get('ip_address', device.get('ip')),)
+                            "UPDATE devices SET trusted = 1 WHERE ip = ?",
+                            (device.get('ip'),)
                         )
                         self.db.connection.commit()
-                        Colors.print(f"✅ Device marked as trusted: {device.get('ip_address')}", Colors.GREEN)
+                        Colors.print(f"✅ Device marked as trusted: {device.get('ip')}", Colors.GREEN)
                 except:
                     Colors.print("❌ Invalid device number!", Colors.RED)
         
@@ -981,15 +1066,15 @@ class RPTswiApplication:
                 if blocked:
                     print("\nBlocked devices:")
                     for i, device in enumerate(blocked, 1):
-                        print(f"{i}. {device.get('ip_address')} ({device.get('mac_address', 'No MAC')})")
+                        print(f"{i}. {device.get('ip')} ({device.get('mac') or 'No MAC'})")
                     
                     try:
                         num = int(input("\nEnter device number to unblock: ").strip()) - 1
                         if 0 <= num < len(blocked):
                             device = blocked[num]
                             self.firewall.unblock_device(
-                                device.get('ip_address'),
-                                device.get('mac_address')
+                                device.get('ip'),
+                                device.get('mac')
                             )
                     except:
                         Colors.print("❌ Invalid selection!", Colors.RED)
@@ -1011,42 +1096,23 @@ class RPTswiApplication:
     def show_statistics(self):
         """نمایش آمار برنامه"""
         try:
-            cursor = self.db.connection.cursor()
-            
-            # شمارش دستگاه‌ها
-            cursor.execute("SELECT COUNT(*) FROM devices")
-            total_devices = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM devices WHERE status = 'online'")
-            online_devices = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM devices WHERE is_blocked = 1")
-            blocked_devices = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM devices WHERE is_trusted = 1")
-            trusted_devices = cursor.fetchone()[0]
-            
-            # شمارش اسکن‌ها
-            cursor.execute("SELECT COUNT(*) FROM scans")
-            total_scans = cursor.fetchone()[0]
-            
-            # آخرین اسکن
-            cursor.execute("SELECT MAX(scan_time) FROM scans")
-            last_scan = cursor.fetchone()[0]
+            stats = self.db.get_statistics()
             
             print("\n" + "="*60)
             print(f"{'STATISTICS':^60}")
             print("="*60)
             
             print(f"\n{Colors.BOLD}Device Statistics:{Colors.END}")
-            print(f"  Total Devices: {total_devices}")
-            print(f"  Online Devices: {online_devices}")
-            print(f"  Blocked Devices: {blocked_devices}")
-            print(f"  Trusted Devices: {trusted_devices}")
+            print(f"  Total Devices: {stats.get('total_devices', 0)}")
+            print(f"  Online Devices: {stats.get('online_devices', 0)}")
+            print(f"  Blocked Devices: {stats.get('blocked_devices', 0)}")
+            print(f"  Trusted Devices: {stats.get('trusted_devices', 0)}")
             
             print(f"\n{Colors.BOLD}Scan Statistics:{Colors.END}")
-            print(f"  Total Scans: {total_scans}")
-            print(f"  Last Scan: {last_scan or 'Never'}")
+            print(f"  Total Scans: {stats.get('total_scans', 0)}")
+            last_scan = stats.get('last_scan')
+            last_scan = datetime.fromtimestamp(last_scan).strftime('%Y-%m-%d %H:%M:%S') if last_scan else 'Never'
+            print(f"  Last Scan: {last_scan}")
             
             print(f"\n{Colors.BOLD}Firewall Statistics:{Colors.END}")
             status = self.firewall.get_firewall_status()
@@ -1094,6 +1160,26 @@ class RPTswiApplication:
                     cursor.execute("DELETE FROM events")
                     self.db.connection.commit()
                     Colors.print("✅ Database cleared", Colors.GREEN)
+            
+            elif db_choice == "2":
+                path = self.db.backup_database()
+                if path:
+                    Colors.print(f"✅ Database backed up to: {path}", Colors.GREEN)
+            
+            elif db_choice == "3":
+                backups = self.db.backup.list_backups()
+                if not backups:
+                    Colors.print("No backups found", Colors.YELLOW)
+                else:
+                    for i, path in enumerate(backups, 1):
+                        print(f"{i}. {path.name}")
+                    pick = input(f"\n{Colors.BOLD}Restore which backup? {Colors.END}").strip()
+                    if pick.isdigit() and 1 <= int(pick) <= len(backups):
+                        confirm = input("Current data will be replaced. Continue? (yes/no): ").lower()
+                        if confirm == 'yes':
+                            report = self.db.restore_database(backups[int(pick) - 1])
+                            if report:
+                                Colors.print(f"✅ Restored {report['devices']} devices", Colors.GREEN)
                     
         elif choice == "2":
             print("\nFirewall Settings:")
@@ -1155,20 +1241,19 @@ class RPTswiApplication:
         
         choice = input(f"\n{Colors.BOLD}Select (1-5): {Colors.END}").strip()
         
-        if choice == "1":
-            devices = self.db.get_devices()
-            filename = f"devices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            
-            data = {
-                'export_time': datetime.now().isoformat(),
-                'total_devices': len(devices),
-                'devices': devices
-            }
-            
-            with open(filename, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-            
-            Colors.print(f"✅ Devices exported to: {filename}", Colors.GREEN)
+        # ردیف‌ها دسته‌به‌دسته نوشته می‌شوند و حافظه با اندازه جدول رشد نمی‌کند
+        targets = {
+            "1": ('devices', 'json'),
+            "2": ('devices', 'csv'),
+            "3": ('scans', 'csv'),
+            "4": ('events', 'jsonl.gz')
+        }
+        if choice in targets:
+            table, extension = targets[choice]
+            filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+            count = self.db.export(table, filename)
+            if count is not None:
+                Colors.print(f"✅ {count} {table} rows exported to: {filename}", Colors.GREEN)
         
         input(f"\n{Colors.BOLD}Press Enter to continue...{Colors.END}")
     
@@ -1235,11 +1320,16 @@ def parse_arguments():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  sudo python3 main.py              # Start interactive mode
-  sudo python3 main.py --scan       # Quick network scan
-  sudo python3 main.py --block 192.168.1.100  # Block an IP
-  sudo python3 main.py --list       # List all devices
-  sudo python3 main.py --stats      # Show statistics
+  sudo python3 -m src.main          # Start interactive mode
+  sudo python3 -m src.main --scan   # Quick network scan
+  sudo python3 -m src.main --block 192.168.1.100  # Block an IP
+  sudo python3 -m src.main --list   # List all devices
+  sudo python3 -m src.main --stats  # Show statistics
+  sudo python3 -m src.main --recompute-stats  # Rebuild statistics counters
+  sudo python3 -m src.main --backup # Back up the database
+  sudo python3 -m src.main --restore FILE  # Verify and restore a backup
+  sudo python3 -m src.main --list --db-profile  # Print a query profile on exit
+  sudo python3 -m src.main --export events.jsonl.gz --export-table events --since 2024-01-01
         """
     )
     
@@ -1255,10 +1345,33 @@ Examples:
                        help='List all discovered devices')
     parser.add_argument('--stats', action='store_true',
                        help='Show program statistics')
+    parser.add_argument('--recompute-stats', action='store_true',
+                       help='Rebuild statistics counters from the database')
+    parser.add_argument('--backup', action='store_true',
+                       help='Create a compressed database backup')
+    parser.add_argument('--verify-backup', metavar='FILE',
+                       help='Check a database backup without restoring it')
+    parser.add_argument('--restore', metavar='FILE',
+                       help='Verify a database backup and restore it')
+    parser.add_argument('--db-profile', action='store_true',
+                       help='Time database queries and print a profile on exit')
+    parser.add_argument('--slow-query-ms', type=int, default=100, metavar='MS',
+                       help='Log queries slower than this with their query plan (default: 100)')
+    parser.add_argument('--firewall-backend', choices=['iptables', 'ipset', 'nftables'], default='iptables',
+                       help='How blocks are applied: a rule per device, ipset hash sets or '
+                            'nftables verdict maps (default: iptables)')
     parser.add_argument('--info', '-i', action='store_true',
                        help='Show network information')
     parser.add_argument('--export', '-e', metavar='FILE',
-                       help='Export data to JSON file')
+                       help='Export data; format from the name (.json, .jsonl, .csv, optional .gz/.zst)')
+    parser.add_argument('--export-table', choices=list(EXPORT_TABLES), default='devices',
+                       help='Table to export (default: devices)')
+    parser.add_argument('--export-filter', metavar='VALUE',
+                       help='Only rows with this status / scan type / event type / rule type')
+    parser.add_argument('--since', metavar='YYYY-MM-DD',
+                       help='Only export rows from this date on')
+    parser.add_argument('--until', metavar='YYYY-MM-DD',
+                       help='Only export rows before this date')
     parser.add_argument('--test', '-t', action='store_true',
                        help='Run diagnostic tests')
     parser.add_argument('--version', '-v', action='store_true',
@@ -1279,11 +1392,19 @@ def main():
     # بررسی دسترسی root
     if os.geteuid() != 0:
         print(f"{Colors.RED}❌ Error: This program must be run as root!{Colors.END}")
-        print(f"{Colors.YELLOW}💡 Please run: sudo python3 main.py{Colors.END}")
+        print(f"{Colors.YELLOW}💡 Please run: sudo python3 -m src.main{Colors.END}")
         sys.exit(1)
     
+    # پروفایل پرس‌وجوها؛ پرس‌وجوهای کند در logs/slow_queries.log ثبت می‌شوند
+    profiler = None
+    if args.db_profile:
+        profiler = QueryProfiler(
+            threshold_ms=args.slow_query_ms,
+            log_file=Path.home() / '.config' / 'rpt-swi' / 'logs' / 'slow_queries.log'
+        )
+    
     # ایجاد نمونه برنامه
-    app = RPTswiApplication()
+    app = RPTswiApplication(profiler, args.firewall_backend)
     
     try:
         # پردازش آرگومان‌های خط فرمان
@@ -1304,18 +1425,40 @@ def main():
         elif args.stats:
             app.show_statistics()
             
+        elif args.recompute_stats:
+            stats = app.db.recompute_statistics()
+            for name, value in stats.items():
+                print(f"  {name}: {value}")
+            Colors.print("✅ Statistics counters rebuilt", Colors.GREEN)
+            
+        elif args.backup:
+            path = app.db.backup_database()
+            if path:
+                Colors.print(f"✅ Database backed up to: {path}", Colors.GREEN)
+            
+        elif args.verify_backup:
+            report = app.db.backup.verify(args.verify_backup)
+            if report['ok']:
+                Colors.print(f"✅ Backup OK: schema v{report['schema_version']}, "
+                             f"{report['devices']} devices", Colors.GREEN)
+            else:
+                Colors.print(f"❌ Backup unusable: {report['message']}", Colors.RED)
+            
+        elif args.restore:
+            report = app.db.restore_database(args.restore)
+            if report:
+                Colors.print(f"✅ Restored {report['devices']} devices from {args.restore}", Colors.GREEN)
+            
         elif args.info:
             app.display.show_network_info(app.scanner.my_info)
             
         elif args.export:
-            devices = app.db.get_devices()
-            data = {
-                'export_time': datetime.now().isoformat(),
-                'devices': devices
-            }
-            with open(args.export, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-            Colors.print(f"✅ Data exported to: {args.export}", Colors.GREEN)
+            since = datetime.strptime(args.since, '%Y-%m-%d').timestamp() if args.since else None
+            until = datetime.strptime(args.until, '%Y-%m-%d').timestamp() if args.until else None
+            count = app.db.export(args.export_table, args.export, since=since, until=until,
+                                  value=args.export_filter)
+            if count is not None:
+                Colors.print(f"✅ {count} {args.export_table} rows exported to: {args.export}", Colors.GREEN)
             
         elif args.test:
             app.run_tests()
@@ -1330,6 +1473,9 @@ def main():
     except Exception as e:
         Colors.print(f"\n❌ Fatal error: {e}", Colors.RED)
         sys.exit(1)
+    finally:
+        if profiler:
+            print("\n" + profiler.format_report())
 
 if __name__ == "__main__":
     main()
@@ -8,6 +8,8 @@ import readline  # برای تاریخچه دستورات
 from tabulate import tabulate
 from colorama import init, Fore, Back, Style
 
+from src.utils.helpers import format_bytes, format_timestamp
+
 init(autoreset=True)
 
 class CLIInterface:
@@ -334,7 +336,7 @@ class CLIInterface:
                 device.get('mac', 'N/A'),
                 device.get('hostname', 'Unknown')[:20],
                 device.get('vendor', 'Unknown')[:25],
-                device.get('last_seen', 'N/A'),
+                format_timestamp(device.get('last_seen')),
                 status
             ]
             table_data.append(row)
@@ -360,24 +362,23 @@ class CLIInterface:
             self.clear_screen()
             self.display_header("DEVICE MANAGEMENT")
             
-            # دریافت دستگاه‌ها از دیتابیس
-            devices = self.db.get_all_devices()
+            # شمارش‌ها از کش دستگاه‌ها خوانده می‌شوند، نه با اسکن جدول
+            counts = self.db.get_device_counts()
             
-            if not devices:
+            if not counts['total']:
                 print(f"{self.COLORS['warning']}No devices in database{self.COLORS['reset']}")
                 print("Please scan the network first.")
                 input("\nPress Enter to continue...")
                 break
             
-            print(f"{self.COLORS['info']}Total devices: {len(devices)}{self.COLORS['reset']}\n")
+            print(f"{self.COLORS['info']}Total devices: {counts['total']}{self.COLORS['reset']}\n")
             
             # نمایش خلاصه
             summary = [
-                ["Active", sum(1 for d in devices if 'last_seen' in d and 
-                              (datetime.now() - datetime.fromisoformat(d['last_seen'])).days < 1)],
-                ["Blocked", sum(1 for d in devices if d.get('status') == 'blocked')],
-                ["Trusted", sum(1 for d in devices if d.get('trusted'))],
-                ["Unknown", sum(1 for d in devices if d.get('status') == 'unknown')]
+                ["Active", counts['active']],
+                ["Blocked", counts['blocked']],
+                ["Trusted", counts['trusted']],
+                ["Unknown", counts['unknown']]
             ]
             
             print(tabulate(summary, 
@@ -405,7 +406,7 @@ class CLIInterface:
             if choice == "0":
                 break
             elif choice == "1":
-                self.view_all_devices(devices)
+                self.view_all_devices()
             elif choice == "2":
                 self.search_device()
             elif choice == "3":
@@ -451,6 +452,7 @@ class CLIInterface:
                 ["6", "Backup/Restore", "Backup/restore rules"],
                 ["7", "Schedule Block", "Schedule blocking"],
                 ["8", "Advanced Rules", "Custom iptables rules"],
+                ["9", "Throttle Device", "Limit bandwidth instead of blocking"],
                 ["0", "Back", "Return to main menu"]
             ]
             
@@ -458,7 +460,7 @@ class CLIInterface:
                           headers=["Option", "Action", "Description"],
                           tablefmt="grid"))
             
-            choice = input(f"\n{self.COLORS['info']}Enter choice (0-8): {self.COLORS['reset']}").strip()
+            choice = input(f"\n{self.COLORS['info']}Enter choice (0-9): {self.COLORS['reset']}").strip()
             
             if choice == "0":
                 break
@@ -478,6 +480,8 @@ class CLIInterface:
                 self.schedule_block_ui()
             elif choice == "8":
                 self.advanced_rules_ui()
+            elif choice == "9":
+                self.throttle_device_ui()
             else:
                 print(f"{self.COLORS['error']}Invalid choice!{self.COLORS['reset']}")
                 time.sleep(1)
@@ -505,12 +509,12 @@ class CLIInterface:
             if choice.lower() == 'all':
                 confirm = input(f"{self.COLORS['warning']}Block ALL devices? (y/n): {self.COLORS['reset']}").lower()
                 if confirm == 'y':
-                    blocked_count = 0
-                    for device in devices:
-                        if not device.get('trusted') and device.get('status') != 'blocked':
-                            if self.firewall.block_device(device):
-                                blocked_count += 1
-                    print(f"{self.COLORS['success']}Blocked {blocked_count} devices{self.COLORS['reset']}")
+                    # یک تراکنش برای همه، به جای یک تغییر جدول به ازای هر دستگاه
+                    blocked = self.firewall.block_devices([
+                        device for device in devices
+                        if not device.get('trusted') and device.get('status') != 'blocked'
+                    ])
+                    print(f"{self.COLORS['success']}Blocked {len(blocked)} devices{self.COLORS['reset']}")
             elif choice.isdigit():
                 idx = int(choice) - 1
                 if 0 <= idx < len(devices):
@@ -639,8 +643,12 @@ class CLIInterface:
                     ["Chain Status", "Active" if fw_stats.get('chain_exists') else "Inactive"],
                     ["Total Rules", fw_stats.get('total_rules', 0)],
                     ["Blocked IPs", fw_stats.get('blocked_ips', 0)],
-                    ["Saved Rules", fw_stats.get('saved_rules_count', 0)]
+                    ["Saved Rules", fw_stats.get('saved_rules_count', 0)],
+                    ["Dropped pkts/s", f"{fw_stats.get('dropped_pps', 0):.1f}"]
                 ]
+                # پرترافیک‌ترین دستگاه‌های مسدود
+                for target, pps, bps in fw_stats.get('top_dropped', []):
+                    firewall_stats.append([f"  {target}", f"{pps:.1f} pkts/s, {bps / 1024:.1f} KB/s"])
                 print(tabulate(firewall_stats, tablefmt="grid"))
             
             # آخرین اسکن‌ها
@@ -649,10 +657,9 @@ class CLIInterface:
                 print(f"\n{self.COLORS['header']}Recent Scans:{self.COLORS['reset']}")
                 scan_data = []
                 for scan in recent_scans:
-                    scan_time = datetime.fromisoformat(scan['scan_time']) if 'scan_time' in scan else 'N/A'
                     scan_data.append([
                         scan.get('id'),
-                        scan_time.strftime('%Y-%m-%d %H:%M') if scan_time != 'N/A' else 'N/A',
+                        format_timestamp(scan.get('scan_time')),
                         scan.get('devices_found', 0),
                         scan.get('duration_seconds', 0),
                         scan.get('scan_type', 'Unknown')
@@ -665,7 +672,11 @@ class CLIInterface:
         except Exception as e:
             print(f"{self.COLORS['error']}Error loading statistics: {str(e)}{self.COLORS['reset']}")
         
-        input("\nPress Enter to continue...")
+        # شمارنده‌ها با تریگر به‌روز می‌شوند؛ در صورت ناهمخوانی از نو ساخته شوند
+        choice = input("\nPress R to recompute counters, Enter to continue: ").strip().lower()
+        if choice == 'r':
+            self.db.recompute_statistics()
+            self.show_statistics()
     
     def display_header(self, title):
         """نمایش هدر"""
@@ -701,14 +712,69 @@ class CLIInterface:
         print(f"{self.COLORS['info']}Email: EbiRom1996@gmail.com{self.COLORS['reset']}\n")
         return False
     
-    # متدهای دیگر (خلاصه شده)
-    def view_all_devices(self, devices):
-        # مشاهده همه دستگاه‌ها
-        pass
+    def _page_devices(self, title, fetch_page, page_size=20):
+        """نمایش صفحه‌به‌صفحه دستگاه‌ها با کلید ادامه (keyset)"""
+        after = None
+        page = 1
+        
+        while True:
+            result = fetch_page(after, page_size)
+            devices = result['devices']
+            
+            self.clear_screen()
+            self.display_header(f"{title} - PAGE {page}")
+            
+            if not devices:
+                print(f"{self.COLORS['warning']}No devices found{self.COLORS['reset']}")
+                input("\nPress Enter to continue...")
+                return
+            
+            table_data = []
+            for i, device in enumerate(devices, (page - 1) * page_size + 1):
+                table_data.append([
+                    i,
+                    device.get('ip', 'N/A'),
+                    device.get('mac') or 'N/A',
+                    (device.get('hostname') or 'Unknown')[:20],
+                    (device.get('vendor') or 'Unknown')[:25],
+                    format_timestamp(device.get('last_seen')),
+                    device.get('status', 'unknown')
+                ])
+            
+            print(tabulate(table_data,
+                          headers=["#", "IP Address", "MAC Address", "Hostname", "Vendor", "Last Seen", "Status"],
+                          tablefmt="simple"))
+            
+            if result['next'] is None:
+                input("\nEnd of list. Press Enter to continue...")
+                return
+            
+            choice = input(f"\n{self.COLORS['info']}Enter for next page, 'q' to quit: {self.COLORS['reset']}").strip().lower()
+            if choice == 'q':
+                return
+            
+            after = result['next']
+            page += 1
+    
+    def view_all_devices(self):
+        """مشاهده همه دستگاه‌ها"""
+        self._page_devices(
+            "ALL DEVICES",
+            lambda after, limit: self.db.list_devices_page(after=after, limit=limit)
+        )
     
     def search_device(self):
-        # جستجوی دستگاه
-        pass
+        """جستجوی دستگاه بر اساس IP/MAC/نام میزبان/سازنده/یادداشت"""
+        query = input(f"{self.COLORS['info']}Search (IP, MAC, hostname, vendor, notes): {self.COLORS['reset']}").strip()
+        if not query:
+            return
+        
+        self._page_devices(
+            f"SEARCH: {query[:30]}",
+            lambda after, limit: self.db.search_devices(query, after=after, limit=limit)
+        )
+    
+    # متدهای دیگر (خلاصه شده)
     
     def manage_trusted_devices(self):
         # مدیریت دستگاه‌های معتمد
@@ -719,16 +785,145 @@ class CLIInterface:
         pass
     
     def view_device_history(self):
-        # مشاهده تاریخچه دستگاه
-        pass
+        """نمایش تاریخچه حضور یک دستگاه"""
+        self.clear_screen()
+        self.display_header("DEVICE HISTORY")
+        
+        ip = input(f"{self.COLORS['info']}Enter device IP: {self.COLORS['reset']}").strip()
+        device = self.db.get_device(ip) if ip else None
+        
+        if not device:
+            print(f"{self.COLORS['error']}Device not found!{self.COLORS['reset']}")
+            input("\nPress Enter to continue...")
+            return
+        
+        now = int(time.time())
+        history = self.db.history
+        
+        # بازه‌های حضور هفت روز اخیر
+        intervals = history.get_intervals(device['id'], since=now - 7 * 86400)
+        print(f"\n{self.COLORS['header']}Presence (last 7 days):{self.COLORS['reset']}")
+        if intervals:
+            interval_data = []
+            for interval in intervals[:20]:
+                interval_data.append([
+                    datetime.fromtimestamp(interval['start']).strftime('%Y-%m-%d %H:%M'),
+                    datetime.fromtimestamp(interval['end']).strftime('%Y-%m-%d %H:%M'),
+                    f"{(interval['end'] - interval['start']) / 60:.0f} min",
+                    interval['sightings']
+                ])
+            print(tabulate(interval_data,
+                          headers=["From", "To", "Duration", "Sightings"],
+                          tablefmt="simple"))
+        else:
+            print("  No sightings recorded")
+        
+        # درصد حضور روزانه در ۳۰ روز اخیر
+        rollups = history.get_rollups(device['id'], 'daily', since=now - 30 * 86400)
+        if rollups:
+            print(f"\n{self.COLORS['header']}Daily uptime (last 30 days):{self.COLORS['reset']}")
+            uptime_data = [
+                [datetime.fromtimestamp(r['bucket']).strftime('%Y-%m-%d'), f"{r['uptime'] * 100:.1f}%"]
+                for r in rollups
+            ]
+            print(tabulate(uptime_data, headers=["Day", "Uptime"], tablefmt="simple"))
+        
+        input("\nPress Enter to continue...")
     
     def cleanup_database(self):
-        # پاک‌سازی دیتابیس
-        pass
+        """پاک‌سازی رکوردهای منقضی‌شده"""
+        self.clear_screen()
+        self.display_header("CLEANUP DATABASE")
+        
+        retention = self.db.retention
+        print(f"{self.COLORS['info']}Events, scans and read notifications older than "
+              f"{retention.cleanup_days} days will be removed{self.COLORS['reset']}")
+        if retention.device_days:
+            print(f"{self.COLORS['info']}Untrusted devices unseen for "
+                  f"{retention.device_days} days will be removed{self.COLORS['reset']}")
+        
+        confirm = input(f"\n{self.COLORS['warning']}Continue? (y/n): {self.COLORS['reset']}").strip().lower()
+        if confirm != 'y':
+            return
+        
+        try:
+            # حذف در دسته‌های کوچک انجام می‌شود و اسکن‌ها در این مدت متوقف نمی‌شوند
+            report = retention.run()
+            history = report['history']
+            rows = [
+                ["Events", report['events']],
+                ["Scans", report['scans']],
+                ["Notifications", report['notifications']],
+                ["Devices", report['devices']],
+                ["Presence intervals", history['intervals']],
+                ["Presence rollups", history['hourly'] + history['daily']],
+                ["Space reclaimed", format_bytes(report['bytes_reclaimed'])]
+            ]
+            print(tabulate(rows, headers=["Removed", "Count"], tablefmt="simple"))
+        except Exception as e:
+            print(f"{self.COLORS['error']}Cleanup failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
     
     def import_export_menu(self):
-        # منوی واردکردن/صادرکردن
-        pass
+        """منوی واردکردن/صادرکردن"""
+        self.clear_screen()
+        self.display_header("IMPORT / EXPORT")
+        
+        print(f"{self.COLORS['menu']}1. Export table   2. Import devices   0. Back{self.COLORS['reset']}")
+        choice = input(f"\n{self.COLORS['info']}Enter choice: {self.COLORS['reset']}").strip()
+        if choice == "1":
+            self.export_table_ui()
+        elif choice == "2":
+            self.import_devices_ui()
+    
+    def export_table_ui(self):
+        """خروجی جریانی یک جدول با فیلتر وضعیت/نوع و بازه زمانی"""
+        tables = ['devices', 'scans', 'events', 'firewall_rules']
+        table = input(f"Table ({'/'.join(tables)}) [devices]: ").strip() or 'devices'
+        if table not in tables:
+            print(f"{self.COLORS['error']}Unknown table{self.COLORS['reset']}")
+            input("\nPress Enter to continue...")
+            return
+        
+        default_name = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz"
+        filename = input(f"File (.jsonl/.csv/.json, add .gz or .zst to compress) [{default_name}]: ").strip() or default_name
+        value = input("Filter by status / type (empty for all): ").strip() or None
+        days = input("Only the last N days (empty for all): ").strip()
+        
+        try:
+            since = time.time() - int(days) * 86400 if days else None
+            # ردیف‌ها دسته‌به‌دسته نوشته می‌شوند؛ حافظه به اندازه جدول وابسته نیست
+            count = self.db.export(table, filename, since=since, value=value)
+            print(f"{self.COLORS['success']}Exported {count} rows to {filename}{self.COLORS['reset']}")
+        except Exception as e:
+            print(f"{self.COLORS['error']}Export failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
+    
+    def import_devices_ui(self):
+        """واردکردن فهرست دستگاه‌ها از CSV/JSONL با گزارش ردیف‌های ردشده"""
+        filename = input("Inventory file (.csv/.jsonl, optionally .gz): ").strip()
+        if not filename:
+            return
+        dry_run = input("Validate only, without writing? (y/n) [n]: ").strip().lower() == 'y'
+        
+        try:
+            result = self.db.import_devices(filename, dry_run=dry_run)
+            rows = [
+                ['Rows read', result['read']],
+                ['New devices', result['new']],
+                ['Updated devices', result['updated']],
+                ['Rejected', result['rejected']],
+                ['Seconds', result['seconds']]
+            ]
+            print(tabulate(rows, tablefmt="grid"))
+            if result['report']:
+                print(f"{self.COLORS['warning']}Rejected rows written to {result['report']}{self.COLORS['reset']}")
+        except Exception as e:
+            print(f"{self.COLORS['error']}Import failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
     
     def block_ip_ui(self):
         # رابط کاربری مسدودسازی IP
@@ -751,16 +946,84 @@ class CLIInterface:
         pass
     
     def schedule_block_ui(self):
-        # زمان‌بندی مسدودسازی
-        pass
+        """زمان‌بندی مسدودسازی یک IP برای بازه‌ای مشخص"""
+        ip = input(f"{self.COLORS['info']}IP address: {self.COLORS['reset']}").strip()
+        if not ip:
+            return
+        
+        start_in = input("Start in N minutes [0]: ").strip()
+        duration = input("Duration in minutes (empty for permanent): ").strip()
+        
+        try:
+            start = time.time() + int(start_in or 0) * 60
+            end = start + int(duration) * 60 if duration else None
+            if self.firewall.schedule_block(ip, start, end):
+                print(f"{self.COLORS['success']}Block of {ip} scheduled{self.COLORS['reset']}")
+            else:
+                print(f"{self.COLORS['error']}Could not schedule the block{self.COLORS['reset']}")
+        except ValueError:
+            print(f"{self.COLORS['error']}Minutes must be whole numbers{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
+    
+    def throttle_device_ui(self):
+        """محدودسازی پهنای باند یک دستگاه یا شبکه به جای مسدودسازی"""
+        limits = self.firewall.get_throttled_devices()
+        if limits:
+            print(tabulate(sorted(limits.items()), headers=["Target", "Rate"], tablefmt="simple"))
+        
+        target = input(f"\n{self.COLORS['info']}IP or network (prefix with - to remove the limit): {self.COLORS['reset']}").strip()
+        if not target:
+            return
+        
+        try:
+            if target.startswith('-'):
+                self.firewall.unthrottle_devices([target[1:].strip()])
+                print(f"{self.COLORS['success']}Limit removed{self.COLORS['reset']}")
+            else:
+                rate = input("Rate, e.g. 512kbit or 2mbit [default]: ").strip() or None
+                self.firewall.throttle_devices([target], rate)
+                print(f"{self.COLORS['success']}{target} throttled{self.COLORS['reset']}")
+        except Exception as e:
+            print(f"{self.COLORS['error']}Throttle failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
     
     def advanced_rules_ui(self):
         # قوانین پیشرفته
         pass
     
     def reports_menu(self):
-        # منوی گزارشات
-        pass
+        """گزارش‌های حضور دستگاه‌ها روی تاریخچه"""
+        self.clear_screen()
+        self.display_header("REPORTS")
+        
+        print(f"{self.COLORS['menu']}1. Device uptime   2. Hour-of-week heatmap   3. Churn and new devices   4. Scan activity   0. Back{self.COLORS['reset']}")
+        choice = input(f"\n{self.COLORS['info']}Enter choice: {self.COLORS['reset']}").strip()
+        if choice not in ("1", "2", "3", "4"):
+            return
+        
+        days = input("Days of history [30]: ").strip()
+        since = time.time() - (int(days) if days.isdigit() else 30) * 86400
+        analytics = self.db.analytics
+        
+        try:
+            if choice == "1":
+                frame = analytics.uptime(since)
+                print(tabulate(frame[['ip', 'hostname', 'first_seen', 'last_seen', 'uptime_pct']].head(50),
+                               headers="keys", tablefmt="simple"))
+            elif choice == "2":
+                # میانگین تعداد دستگاه‌های حاضر در هر ساعت از هفته
+                print(tabulate(analytics.heatmap(since), headers="keys", tablefmt="simple", floatfmt=".0f"))
+            elif choice == "3":
+                period = 'day' if days.isdigit() and int(days) <= 31 else 'week'
+                print(tabulate(analytics.churn(since, period=period), headers="keys", tablefmt="simple"))
+            else:
+                print(tabulate(analytics.scan_activity(since), headers="keys", tablefmt="simple"))
+        except Exception as e:
+            print(f"{self.COLORS['error']}Report failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
     
     def settings_menu(self):
         # منوی تنظیمات
@@ -775,8 +1038,52 @@ class CLIInterface:
         pass
     
     def create_backup(self):
-        # ایجاد پشتیبان
-        pass
+        """پشتیبان‌گیری و بازیابی پایگاه داده"""
+        self.clear_screen()
+        self.display_header("DATABASE BACKUP")
+        
+        backup = self.db.backup
+        backups = backup.list_backups()
+        if backups:
+            rows = [
+                [i, path.name, format_bytes(path.stat().st_size)]
+                for i, path in enumerate(backups, 1)
+            ]
+            print(tabulate(rows, headers=["#", "Backup", "Size"], tablefmt="simple"))
+        else:
+            print(f"{self.COLORS['info']}No backups in {backup.backup_dir}{self.COLORS['reset']}")
+        
+        print(f"\n{self.COLORS['menu']}1. Create backup   2. Verify backup   3. Restore backup   0. Back{self.COLORS['reset']}")
+        choice = input(f"\n{self.COLORS['info']}Enter choice: {self.COLORS['reset']}").strip()
+        
+        try:
+            if choice == "1":
+                # کپی مرحله‌ای است و اسکن‌ها در این مدت ادامه می‌یابند
+                def progress(done, total):
+                    print(f"\r  Copied {done}/{total} pages", end="")
+                path = self.db.backup_database(progress)
+                print(f"\n{self.COLORS['success']}Backup written to {path}{self.COLORS['reset']}")
+            
+            elif choice in ("2", "3"):
+                pick = input("Backup number: ").strip()
+                if not pick.isdigit() or not 1 <= int(pick) <= len(backups):
+                    print(f"{self.COLORS['error']}Invalid backup number{self.COLORS['reset']}")
+                else:
+                    path = backups[int(pick) - 1]
+                    if choice == "2":
+                        report = backup.verify(path)
+                        color = self.COLORS['success'] if report['ok'] else self.COLORS['error']
+                        print(f"{color}{path.name}: {report['message']} "
+                              f"(schema v{report['schema_version']}, {report['devices']} devices){self.COLORS['reset']}")
+                    else:
+                        confirm = input(f"{self.COLORS['warning']}Current data will be replaced. Continue? (y/n): {self.COLORS['reset']}").strip().lower()
+                        if confirm == 'y':
+                            report = self.db.restore_database(path)
+                            print(f"{self.COLORS['success']}Restored {report['devices']} devices from {path.name}{self.COLORS['reset']}")
+        except Exception as e:
+            print(f"\n{self.COLORS['error']}Backup operation failed: {str(e)}{self.COLORS['reset']}")
+        
+        input("\nPress Enter to continue...")
     
     def check_updates(self):
         # بررسی بروزرسانی
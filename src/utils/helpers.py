@@ -121,6 +121,14 @@ def human_readable_time(seconds):
         days = seconds / 86400
         return f"{days:.1f} days"
 
+def format_timestamp(value, fmt='%Y-%m-%d %H:%M'):
+    """نمایش زمان ذخیره‌شده (ثانیه epoch) به وقت محلی"""
+    if value is None or value == '':
+        return 'N/A'
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).strftime(fmt)
+    return str(value)
+
 def progress_bar(iteration, total, prefix='', suffix='', length=50, fill='█'):
     """نمایش نوار پیشرفت"""
     percent = f"{100 * (iteration / float(total)):.1f}"
@@ -168,6 +168,14 @@ class NetworkValidators:
         except ValueError:
             return None
     
+    @staticmethod
+    def normalize_ip(ip_str: str) -> Optional[str]:
+        """شکل استاندارد آدرس IP، یا None اگر معتبر نباشد"""
+        try:
+            return str(ipaddress.ip_address(ip_str.strip()))
+        except (ValueError, AttributeError):
+            return None
+    
     @staticmethod
     def normalize_mac(mac_str: str) -> str:
         """نرمال‌سازی آدرس MAC به فرمت استاندارد"""
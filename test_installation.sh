@@ -48,7 +48,7 @@ Test the program
 
 echo -n "Program test: "
 if [ -f src/main.py ]; then
-timeout 5 python3 src/main.py --test 2>&1 | grep -q "DIAGNOSTIC TESTS" && echo "✅ Working" || echo "⚠ Issues"
+timeout 5 python3 -m src.main --test 2>&1 | grep -q "DIAGNOSTIC TESTS" && echo "✅ Working" || echo "⚠ Issues"
 else
 echo "❌ main.py not found"
 fi
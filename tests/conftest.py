@@ -0,0 +1,70 @@
+import subprocess
+
+import pytest
+
+from src.core import firewall
+from src.core.database import DeviceDatabase
+
+class FakeKernel:
+    """iptables-save / iptables-restore --noflush / iptables -N|-A on in-memory chains"""
+
+    def __init__(self):
+        self.chains = {'INPUT': [], 'OUTPUT': []}
+        self.fail_restore = False
+
+    def run(self, args, input=None, capture_output=False, text=False, check=False, **kwargs):
+        def result(code=0, out='', err=''):
+            if check and code:
+                raise subprocess.CalledProcessError(code, args, out, err)
+            return subprocess.CompletedProcess(args, code, out, err)
+
+        if args[0] == 'iptables-save':
+            counters = '[0:0] ' if '-c' in args else ''
+            out = ''.join(f':{chain} ACCEPT [0:0]\n' for chain in self.chains)
+            for chain, rules in self.chains.items():
+                out += ''.join(f'{counters}-A {chain} {rule}\n' for rule in rules)
+            return result(out=out)
+        if args[0] == 'iptables-restore':
+            if self.fail_restore:
+                return result(1, err='fake failure')
+            chains = {chain: list(rules) for chain, rules in self.chains.items()}
+            for line in input.splitlines():
+                if line in ('*filter', 'COMMIT'):
+                    continue
+                op, chain, spec = line.split(' ', 2)
+                if chain not in chains or (op == '-D' and spec not in chains[chain]):
+                    return result(1, err=f'Bad rule: {line}')
+                if op == '-D':
+                    chains[chain].remove(spec)
+                elif op == '-I':
+                    chains[chain].insert(0, spec)
+                else:
+                    chains[chain].append(spec)
+            self.chains = chains
+            return result()
+        if args[:2] == ['iptables', '-N']:
+            self.chains[args[2]] = []
+            return result()
+        if args[:2] == ['iptables', '-A']:
+            self.chains[args[2]].append(' '.join(args[3:]))
+            return result()
+        raise AssertionError(f'unexpected command: {args}')
+
+@pytest.fixture
+def kernel(monkeypatch):
+    fake = FakeKernel()
+    monkeypatch.setattr(firewall.subprocess, 'run', fake.run)
+    return fake
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    database = DeviceDatabase(tmp_path / 'rpt-swi.db')
+    yield database
+    database.close()
+
+@pytest.fixture
+def fw(db, kernel):
+    manager = firewall.FirewallManager(db)
+    yield manager
+    manager.close()
@@ -0,0 +1,18 @@
+from src.config.settings import DatabaseConfig
+from src.core.database import DeviceDatabase
+
+def test_database_schedules_backups(db):
+    assert db.backup._thread is not None and db.backup._thread.is_alive()
+
+def test_backup_interval_zero_disables_the_schedule(tmp_path):
+    database = DeviceDatabase(tmp_path / 'rpt-swi.db', DatabaseConfig(backup_interval=0))
+    try:
+        assert database.backup._thread is None
+    finally:
+        database.close()
+
+def test_close_stops_scheduled_backups(tmp_path):
+    database = DeviceDatabase(tmp_path / 'rpt-swi.db')
+    thread = database.backup._thread
+    database.close()
+    assert not thread.is_alive()
@@ -0,0 +1,24 @@
+from src.core.cache import ACTIVE_WINDOW, BUCKET, DeviceCache
+
+def test_active_counts_exactly_the_last_24_hours():
+    now = 100 * BUCKET + 1800
+    cache = DeviceCache()
+    cache.load([
+        {'id': 1, 'ip': '10.0.0.1', 'last_seen': now},
+        # Same hour as the window start, on either side of it
+        {'id': 2, 'ip': '10.0.0.2', 'last_seen': now - ACTIVE_WINDOW + 60},
+        {'id': 3, 'ip': '10.0.0.3', 'last_seen': now - ACTIVE_WINDOW - 60},
+        {'id': 4, 'ip': '10.0.0.4', 'last_seen': now - ACTIVE_WINDOW - BUCKET}
+    ])
+
+    assert cache.counts(now)['active'] == 2
+
+def test_active_follows_last_seen_updates():
+    now = 100 * BUCKET
+    cache = DeviceCache()
+    cache.load([{'id': 1, 'ip': '10.0.0.1', 'last_seen': now - 2 * ACTIVE_WINDOW}])
+    assert cache.counts(now)['active'] == 0
+
+    cache.put_many([{'id': 1, 'ip': '10.0.0.1', 'last_seen': now}])
+
+    assert cache.counts(now)['active'] == 1
@@ -0,0 +1,55 @@
+from src.core.counters import DropCounterSampler
+
+class Reader:
+    def __init__(self):
+        self.counters = {}
+
+    def __call__(self):
+        return dict(self.counters)
+
+def test_rates_after_the_ring_wraps():
+    reader = Reader()
+    sampler = DropCounterSampler(reader, interval=10, size=4)
+    # 10 packets and 1000 bytes per second, well past one trip round the ring
+    for step in range(11):
+        reader.counters = {'10.0.0.1': (step * 100, step * 10000)}
+        sampler.sample(now=step * 10)
+
+    assert sampler.rates() == {'10.0.0.1': (10.0, 1000.0)}
+    assert sampler.rates(window=10) == {'10.0.0.1': (10.0, 1000.0)}
+    assert sampler.totals() == (10.0, 1000.0)
+
+def test_counter_reset_counts_as_zero():
+    reader = Reader()
+    sampler = DropCounterSampler(reader, interval=10, size=4)
+    for step, packets in enumerate([100, 200, 300, 5, 105, 205]):
+        reader.counters = {'10.0.0.1': (packets, packets)}
+        sampler.sample(now=step * 10)
+
+    # The window spanning the reset reports nothing rather than a huge negative rate
+    assert sampler.rates(window=30)['10.0.0.1'] == (0, 0)
+    assert sampler.rates(window=10)['10.0.0.1'] == (10.0, 10.0)
+
+def test_new_and_removed_targets():
+    reader = Reader()
+    sampler = DropCounterSampler(reader, interval=10, size=4)
+    assert sampler.rates() == {}
+
+    reader.counters = {'a': (0, 0)}
+    sampler.sample(now=0)
+    reader.counters = {'a': (50, 500), 'b': (1000, 1000)}
+    sampler.sample(now=10)
+    # b is backfilled, so its first rate is zero rather than 1000 packets at once
+    assert sampler.rates() == {'a': (5.0, 50.0), 'b': (0.0, 0.0)}
+    assert sampler.top() == [('a', 5.0, 50.0)]
+
+    reader.counters = {'b': (1100, 1100)}
+    sampler.sample(now=20)
+    assert set(sampler.rates()) == {'b'}
+
+def test_on_sample_runs_after_each_sample():
+    seen = []
+    sampler = DropCounterSampler(lambda: {'a': (1, 1)}, on_sample=seen.append)
+
+    assert sampler.sample(now=0) == 1
+    assert seen == [sampler]
@@ -0,0 +1,119 @@
+import threading
+import time
+
+def test_queued_status_update_is_logged_once_committed(db, monkeypatch):
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', ('10.0.0.1', 0, 0))
+    messages = []
+    monkeypatch.setattr(db, 'log', lambda message, level='info': messages.append(message))
+    release = threading.Event()
+    db.writer.call(lambda cursor: release.wait(5))
+
+    db.update_device_status('10.0.0.1', 'blocked', wait=False)
+    assert messages == []
+
+    release.set()
+    db.writer.flush()
+    assert messages == ['Updated device status: 10.0.0.1 -> blocked']
+
+def test_each_thread_gets_its_own_wal_connection(db):
+    main = db.pool.connection()
+    assert db.pool.connection() is main
+    assert main.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.pool.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+
+def test_upsert_counts_new_and_updated_devices(db):
+    assert db.upsert_devices([{'ip': '10.0.0.1'}, {'ip': '10.0.0.2', 'hostname': 'nas'}]) == {'new': 2, 'updated': 0}
+
+    # The same IP twice in one scan is one device; the last report wins
+    counts = db.upsert_devices([
+        {'ip': '10.0.0.2'}, {'ip': '10.0.0.3', 'hostname': 'a'}, {'ip': '10.0.0.3', 'hostname': 'b'}
+    ])
+
+    assert counts == {'new': 1, 'updated': 1}
+    assert db.get_device('10.0.0.2')['hostname'] == 'nas'
+    assert db.get_device('10.0.0.3')['hostname'] == 'b'
+    assert db.get_device_counts()['total'] == 3
+
+def _scan(db, count, last_seen):
+    with db.pool.transaction() as cursor:
+        cursor.executemany(
+            'INSERT INTO devices (ip, hostname, first_seen, last_seen) VALUES (?, ?, ?, ?)',
+            [(f'10.0.1.{i}', f'host-{i}', last_seen, last_seen) for i in range(count)]
+        )
+
+def test_keyset_pages_cover_ties_exactly_once(db):
+    # One scan stamps many devices with the same last_seen
+    _scan(db, 5, 100)
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', ('10.0.2.1', 50, 50))
+
+    seen = []
+    after = None
+    while True:
+        page = db.list_devices_page(after=after, limit=2)
+        seen.extend(d['ip'] for d in page['devices'])
+        after = page['next']
+        if after is None:
+            break
+
+    assert len(seen) == len(set(seen)) == 6
+    assert seen[-1] == '10.0.2.1'
+
+def test_search_uses_fts_and_falls_back_to_like(db):
+    _scan(db, 12, 100)
+    assert db.fts_enabled
+
+    hits = db.search_devices('host-1')['devices']
+    assert sorted(d['hostname'] for d in hits) == ['host-1', 'host-10', 'host-11']
+
+    # Too short for trigrams: LIKE, with wildcards in the query escaped
+    assert sorted(d['hostname'] for d in db.search_devices('-1')['devices']) == ['host-1', 'host-10', 'host-11']
+    assert db.search_devices('_%')['devices'] == []
+
+    db.fts_enabled = False
+    assert sorted(d['hostname'] for d in db.search_devices('host-1')['devices']) == ['host-1', 'host-10', 'host-11']
+
+    first = db.search_devices('host', limit=5)
+    second = db.search_devices('host', after=first['next'], limit=10)
+    assert len(first['devices']) == 5 and len(second['devices']) == 7 and second['next'] is None
+
+def test_journal_pages_by_id_and_follow_wakes_on_commit(db):
+    start = db.journal.last_id()
+    for n in range(5):
+        db.log_event('device_seen' if n % 2 else 'device_blocked', {'n': n})
+    db.writer.flush()
+
+    page = db.journal.read_after(start, limit=2)
+    assert [e['data']['n'] for e in page] == [0, 1]
+    rest = db.journal.read_after(page[-1]['id'])
+    assert [e['data']['n'] for e in rest] == [2, 3, 4]
+    blocked = db.journal.read_after(start, event_types=['device_blocked'])
+    assert [e['data']['n'] for e in blocked] == [0, 2, 4]
+    assert [e['data']['n'] for e in db.journal.tail(2)] == [3, 4]
+
+    stop = threading.Event()
+    seen = []
+    position = db.journal.last_id()
+
+    def consume():
+        for event in db.journal.follow(position, event_types=['device_blocked'], poll_interval=30, stop=stop):
+            seen.append(event['data']['n'])
+            break
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    # poll_interval is 30s, so only the commit notification can wake it in time
+    time.sleep(0.1)
+    db.log_event('device_seen', {'n': 5})
+    db.log_event('device_blocked', {'n': 6}, wait=True)
+    thread.join(5)
+    stop.set()
+    db.journal.wake()
+    assert not thread.is_alive()
+    assert seen == [6]
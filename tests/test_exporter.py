@@ -0,0 +1,75 @@
+import csv
+import gzip
+import json
+
+import pytest
+
+from src.core.exporter import StreamingExporter, detect_format
+
+@pytest.fixture
+def exporter(db):
+    with db.pool.transaction() as cursor:
+        cursor.executemany('INSERT INTO devices (ip, first_seen, last_seen, status) VALUES (?, ?, ?, ?)', [
+            ('10.0.0.1', 100, 100, 'online'),
+            ('10.0.0.2', 200, 200, 'blocked'),
+            ('10.0.0.3', 300, 300, 'online')
+        ])
+    return StreamingExporter(db.pool.read, batch_size=2)
+
+def test_detect_format():
+    assert detect_format('events.jsonl.gz') == ('ndjson', 'gzip')
+    assert detect_format('devices.csv') == ('csv', None)
+    assert detect_format('dump.json.zst') == ('json', 'zstd')
+    assert detect_format('export') == ('ndjson', None)
+
+def test_ndjson_gzip_round_trip(exporter, tmp_path):
+    path = tmp_path / 'devices.jsonl.gz'
+
+    assert exporter.export('devices', path) == 3
+
+    with gzip.open(path, 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['ip'] for row in rows] == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert not (tmp_path / 'devices.jsonl.gz.part').exists()
+
+def test_csv_with_since_until_and_filter(exporter, tmp_path):
+    path = tmp_path / 'devices.csv'
+
+    assert exporter.export('devices', path, since=100, until=300, value='online') == 1
+
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['ip'] for row in rows] == ['10.0.0.1']
+
+def test_json_document(exporter, db, tmp_path):
+    db.log_event('device_new', {'ip': '10.0.0.1'}, source='scanner')
+    db.writer.flush()
+    path = tmp_path / 'events.json'
+
+    assert exporter.export('events', path) == 1
+
+    document = json.loads(path.read_text())
+    assert document['total_events'] == 1
+    # Payloads are nested objects, not escaped strings
+    assert document['events'][0]['event_data'] == {'ip': '10.0.0.1'}
+
+    empty = tmp_path / 'none.json'
+    assert exporter.export('devices', empty, since=1000) == 0
+    assert json.loads(empty.read_text())['devices'] == []
+
+def test_failed_export_leaves_nothing_behind(exporter, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        yield '{}'
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(exporter, '_records', fail)
+    path = tmp_path / 'devices.jsonl'
+
+    with pytest.raises(RuntimeError):
+        exporter.export('devices', path)
+    assert not any(p.name.startswith('devices') for p in tmp_path.iterdir())
+
+def test_unknown_table_and_format(exporter, tmp_path):
+    with pytest.raises(ValueError):
+        exporter.export('secrets', tmp_path / 'x.jsonl')
+    with pytest.raises(ValueError):
+        exporter.export('devices', tmp_path / 'x.jsonl', fmt='xml')
@@ -0,0 +1,67 @@
+import pytest
+
+def test_block_devices_applies_once(fw, db, kernel):
+    devices = [{'ip': '10.0.0.1', 'mac': 'aa:bb:cc:dd:ee:01'}, {'ip': '10.0.0.2'}]
+
+    assert sorted(fw.block_devices(devices)) == ['10.0.0.1', '10.0.0.2']
+    rules = list(kernel.chains['RPT-SWI'])
+    assert '-s 10.0.0.1/32 -j DROP' in rules
+    assert '-s 10.0.0.1/32 -m mac --mac-source AA:BB:CC:DD:EE:01 -j DROP' in rules
+
+    # Already blocked: nothing changes, nothing is duplicated
+    assert fw.block_devices(devices) == []
+    assert kernel.chains['RPT-SWI'] == rules
+    db.writer.flush()
+    assert db.firewall_rules.count() == 2
+
+def test_unblock_devices_removes_rules_and_journal(fw, db, kernel):
+    fw.block_devices([{'ip': '10.0.0.1', 'mac': 'aa:bb:cc:dd:ee:01'}, {'ip': '10.0.0.2'}])
+
+    assert fw.unblock_devices(['10.0.0.1']) == ['10.0.0.1']
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.2/32 -j DROP']
+    db.writer.flush()
+    assert [rule['ip'] for rule in db.firewall_rules.active()] == ['10.0.0.2']
+    assert not fw.is_blocked('10.0.0.1')
+    assert fw.is_blocked('10.0.0.2')
+
+def test_block_devices_undoes_kernel_change_when_journal_fails(fw, db, kernel, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(db.firewall_rules, 'insert', fail)
+
+    with pytest.raises(RuntimeError):
+        fw.block_devices([{'ip': '10.0.0.1'}])
+    assert kernel.chains['RPT-SWI'] == []
+    assert not fw.is_blocked('10.0.0.1')
+
+def test_failed_kernel_transaction_changes_nothing(fw, db, kernel):
+    kernel.fail_restore = True
+
+    with pytest.raises(RuntimeError):
+        fw.block_devices([{'ip': '10.0.0.1'}])
+    db.writer.flush()
+    assert db.firewall_rules.count() == 0
+    assert not fw.is_blocked('10.0.0.1')
+
+def test_journal_and_status_commit_together(fw, db, kernel, monkeypatch):
+    db.upsert_devices([{'ip': '10.0.0.1'}])
+    write_devices_status = db.write_devices_status
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(db, 'write_devices_status', fail)
+
+    with pytest.raises(RuntimeError):
+        fw.block_devices([{'ip': '10.0.0.1'}])
+    # The rule inserted before the failure was rolled back with it
+    assert db.firewall_rules.count() == 0
+    assert kernel.chains['RPT-SWI'] == []
+
+    monkeypatch.setattr(db, 'write_devices_status', write_devices_status)
+    fw.block_devices([{'ip': '10.0.0.1'}])
+    monkeypatch.setattr(db, 'write_devices_status', fail)
+
+    with pytest.raises(RuntimeError):
+        fw.unblock_devices(['10.0.0.1'])
+    assert db.firewall_rules.count() == 1
+    assert db.get_device('10.0.0.1')['status'] == 'blocked'
+    assert fw.is_blocked('10.0.0.1')
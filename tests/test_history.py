@@ -0,0 +1,37 @@
+import pytest
+
+def _device(db, ip='10.0.0.1'):
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', (ip, 0, 0))
+        return cursor.lastrowid
+
+def test_intervals_include_one_starting_at_until(db):
+    device_id = _device(db)
+    with db.pool.transaction() as cursor:
+        db.history.record_sightings(cursor, [device_id], 1000)
+
+    assert db.history.get_intervals(device_id, since=0, until=1000) == [
+        {'start': 1000, 'end': 1000, 'sightings': 1}
+    ]
+    assert db.history.get_intervals(device_id, since=0, until=999) == []
+
+def test_analytics_uptime_and_heatmap_from_raw_intervals(db):
+    pytest.importorskip('pandas')
+    busy, idle = _device(db, '10.0.0.1'), _device(db, '10.0.0.2')
+    with db.pool.transaction() as cursor:
+        for ts in (0, 900, 1800):
+            db.history.record_sightings(cursor, [busy], ts)
+        for ts in (0, 900):
+            db.history.record_sightings(cursor, [idle], ts)
+
+    uptime = db.analytics.uptime(0, 3600)
+    assert list(uptime['ip']) == ['10.0.0.1', '10.0.0.2']
+    assert list(uptime['seconds_present']) == [1800, 900]
+    assert list(uptime['uptime_pct']) == [50.0, 25.0]
+
+    # 1970-01-01 00:00 UTC was a Thursday
+    fleet = db.analytics.heatmap(0, 3600, utc_offset=0)
+    assert fleet.shape == (7, 24)
+    assert fleet.loc['Thu', 0] == 0.75
+    assert fleet.to_numpy().sum() == 0.75
+    assert db.analytics.heatmap(0, 3600, device_id=busy, utc_offset=0).loc['Thu', 0] == 0.5
@@ -0,0 +1,54 @@
+import csv
+import json
+
+from src.core.importer import DeviceImporter, _resolve_columns
+
+INVENTORY = '''IP Address,MAC-Address,Host Name,Whitelisted,Comment
+10.0.0.1,aa-bb-cc-dd-ee-01,Printer.Example.,yes,office printer
+10.0.0.2,,nas,no,
+10.0.0.1,,dup,,
+300.0.0.1,,bad-ip,,
+10.0.0.3,zz:zz,bad-mac,,
+10.0.0.4,,,maybe,
+,,no-ip,,
+'''
+
+def test_aliases_resolve_to_fields():
+    columns = _resolve_columns(['IP Address', 'hw-address', 'FQDN', 'Manufacturer', 'is trusted', 'Notes'])
+    assert columns == {
+        'ip': 'IP Address', 'mac': 'hw-address', 'hostname': 'FQDN',
+        'vendor': 'Manufacturer', 'trusted': 'is trusted', 'notes': 'Notes'
+    }
+
+def test_import_reports_rejections_and_counts(db, tmp_path):
+    db.upsert_devices([{'ip': '10.0.0.2', 'hostname': 'old'}])
+    path = tmp_path / 'inventory.csv'
+    path.write_text(INVENTORY)
+
+    result = DeviceImporter(db, batch_size=1).run(path)
+
+    assert (result['read'], result['new'], result['updated'], result['rejected']) == (7, 1, 1, 5)
+    with open(result['report'], newline='') as f:
+        reasons = {row['line']: row['reason'] for row in csv.DictReader(f)}
+    assert reasons == {
+        '4': 'duplicate of line 2',
+        '5': "invalid ip '300.0.0.1'",
+        '6': "invalid mac 'zz:zz'",
+        '7': "invalid trusted value 'maybe'",
+        '8': 'missing ip'
+    }
+    printer = db.get_device('10.0.0.1')
+    assert printer['mac'] == 'AA:BB:CC:DD:EE:01'
+    assert printer['hostname'] == 'printer.example'
+    assert printer['trusted'] == 1 and printer['notes'] == 'office printer'
+    # Imported fields fill in, never blank out
+    assert db.get_device('10.0.0.2')['hostname'] == 'nas'
+
+def test_dry_run_writes_nothing(db, tmp_path):
+    path = tmp_path / 'inventory.jsonl'
+    path.write_text(json.dumps({'ip': '10.0.0.9'}) + '\nnot json\n')
+
+    result = DeviceImporter(db).run(path, dry_run=True)
+
+    assert (result['read'], result['new'], result['updated'], result['rejected']) == (2, 0, 0, 1)
+    assert db.get_device('10.0.0.9') is None
@@ -0,0 +1,74 @@
+import subprocess
+
+import pytest
+
+from src.core.ipset import IpsetBlocklist, classify
+
+SAVE = '''create rpt-swi-ip hash:ip family inet hashsize 1024 maxelem 262144 counters
+add rpt-swi-ip 10.0.0.1 packets 5 bytes 300
+add rpt-swi-ip 10.0.0.2 packets 0 bytes 0
+create rpt-swi-net hash:net family inet hashsize 1024 maxelem 262144 counters
+add rpt-swi-net 10.1.0.0/16 packets 2 bytes 120
+create rpt-swi-mac hash:mac hashsize 1024 maxelem 262144
+add rpt-swi-mac AA:BB:CC:DD:EE:01
+create other hash:ip family inet hashsize 1024 maxelem 65536
+add other 192.168.1.1
+'''
+
+class FakeIpset:
+    def __init__(self):
+        self.calls = []
+        self.entries = {'rpt-swi-ip': 2, 'rpt-swi-net': 1, 'rpt-swi-mac': 1}
+
+    def run(self, args, input=None, check=True):
+        self.calls.append((args, input))
+        out = ''
+        if args[:2] == ['ipset', 'save']:
+            out = SAVE
+        elif args[:2] == ['ipset', 'list']:
+            out = (f'Name: {args[2]}\nType: hash:ip\nRevision: 4\nHeader: family inet\n'
+                   f'Size in memory: 200\nReferences: 2\nNumber of entries: {self.entries.get(args[2], 0)}\n')
+        return subprocess.CompletedProcess(args, 0, out, '')
+
+@pytest.fixture
+def ipset(monkeypatch):
+    fake = FakeIpset()
+    blocklist = IpsetBlocklist()
+    monkeypatch.setattr(blocklist, '_run', fake.run)
+    return blocklist, fake
+
+def test_classify():
+    assert classify('10.0.0.1') == ('ip', '10.0.0.1')
+    assert classify('10.0.0.1/32') == ('ip', '10.0.0.1')
+    assert classify('10.1.2.3/16') == ('net', '10.1.0.0/16')
+    assert classify('fd00::1') == ('ip6', 'fd00::1')
+    assert classify('fd00::/64') == ('net6', 'fd00::/64')
+    assert classify('aa-bb-cc-dd-ee-01') == ('mac', 'AA:BB:CC:DD:EE:01')
+    with pytest.raises(ValueError):
+        classify('not-an-address')
+
+def test_apply_is_one_restore_script(ipset):
+    blocklist, fake = ipset
+
+    assert blocklist.apply(add=['10.0.0.1', '10.1.2.3/16', 'aabbccddee01'], remove=['fd00::1']) == 4
+
+    restores = [(args, script) for args, script in fake.calls if args[:2] == ['ipset', 'restore']]
+    assert restores == [(['ipset', 'restore', '-exist'],
+                         'add rpt-swi-ip 10.0.0.1\n'
+                         'add rpt-swi-net 10.1.0.0/16\n'
+                         'add rpt-swi-mac AA:BB:CC:DD:EE:01\n'
+                         'del rpt-swi-ip6 fd00::1\n')]
+
+def test_save_output_is_parsed(ipset):
+    blocklist, _ = ipset
+
+    entries = blocklist.entries()
+    assert entries['ip'] == ['10.0.0.1', '10.0.0.2']
+    assert entries['net'] == ['10.1.0.0/16']
+    assert entries['mac'] == ['AA:BB:CC:DD:EE:01']
+    # Sets without counters report none
+    assert blocklist.counters() == {'10.0.0.1': (5, 300), '10.0.0.2': (0, 0), '10.1.0.0/16': (2, 120)}
+
+def test_counts_read_set_headers(ipset):
+    blocklist, _ = ipset
+    assert blocklist.counts() == {'ip': 2, 'ip6': 0, 'net': 1, 'net6': 0, 'mac': 1}
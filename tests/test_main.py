@@ -0,0 +1,40 @@
+import pytest
+
+from src import main
+
+def test_blocklist_status_counts_entries_not_sets(monkeypatch):
+    monkeypatch.setattr(main.IpsetBlocklist, 'ensure', lambda self: None)
+    monkeypatch.setattr(main.IpsetBlocklist, 'counts',
+                        lambda self: {'ip': 3, 'ip6': 0, 'net': 1, 'net6': 0, 'mac': 2})
+    manager = main.FirewallManager(None, backend='ipset')
+
+    status = manager.get_firewall_status()
+
+    assert status['total_rules'] == 6
+    assert status['blocked_ips'] == 4
+
+@pytest.fixture
+def main_db(tmp_path):
+    database = main.DeviceDatabase(str(tmp_path / 'devices.db'))
+    yield database
+    database.close()
+
+def test_block_device_persists_status_and_event(main_db, monkeypatch):
+    monkeypatch.setattr(main.IpsetBlocklist, 'ensure', lambda self: None)
+    monkeypatch.setattr(main.IpsetBlocklist, 'block', lambda self, *values: len(values))
+    monkeypatch.setattr(main.IpsetBlocklist, 'unblock', lambda self, *values: len(values))
+    main_db.add_device({'ip': '10.0.0.1', 'mac': 'AA:BB:CC:DD:EE:01'})
+    manager = main.FirewallManager(main_db, backend='ipset')
+
+    assert manager.block_device('10.0.0.1', 'AA:BB:CC:DD:EE:01')
+    main_db.writer.flush()
+
+    assert not main_db.connection.in_transaction
+    assert [d['ip'] for d in manager.list_blocked_devices()] == ['10.0.0.1']
+    assert [e['event_type'] for e in main_db.journal.tail()] == ['device_blocked']
+
+    assert manager.unblock_device('10.0.0.1', 'AA:BB:CC:DD:EE:01')
+    main_db.writer.flush()
+
+    assert manager.list_blocked_devices() == []
+    assert [e['event_type'] for e in main_db.journal.tail()] == ['device_blocked', 'device_unblocked']
@@ -0,0 +1,123 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from src.core.migrations import SCHEMA_VERSION, migrate, schema_version
+from src.core.statistics import read_counters, recompute_counters
+
+@pytest.fixture
+def new_york(monkeypatch):
+    # POSIX form, so no tzdata is needed; UTC-5/-4 like America/New_York
+    monkeypatch.setenv('TZ', 'EST+5EDT,M3.2.0,M11.1.0')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def legacy_database(path):
+    """A devices.db as the standalone tool created it before migrations"""
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip_address TEXT UNIQUE NOT NULL,
+            mac_address TEXT,
+            hostname TEXT,
+            vendor TEXT,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT,
+            is_trusted INTEGER DEFAULT 0,
+            is_blocked INTEGER DEFAULT 0,
+            notes TEXT
+        );
+        CREATE TABLE scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            scan_type TEXT,
+            devices_found INTEGER
+        );
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            event_type TEXT,
+            event_source TEXT,
+            event_data TEXT,
+            severity TEXT
+        );
+        CREATE TABLE firewall_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_type TEXT,
+            target_ip TEXT,
+            action TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            is_active INTEGER DEFAULT 1
+        );
+    ''')
+    return connection
+
+def test_legacy_timestamps_keep_their_instant_outside_utc(tmp_path, new_york):
+    connection = legacy_database(tmp_path / 'devices.db')
+    # What the sqlite3 datetime adapter stored for datetime.now(): local time text
+    local_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    connection.execute(
+        'INSERT INTO devices (ip_address, mac_address, first_seen, last_seen, status) VALUES (?, ?, ?, ?, ?)',
+        ('10.0.0.5', 'aa:bb:cc:dd:ee:ff', local_now, local_now, 'online')
+    )
+    # DEFAULT CURRENT_TIMESTAMP fills these with UTC text
+    connection.execute("INSERT INTO scans (scan_type, devices_found) VALUES ('arp', 1)")
+    connection.execute("INSERT INTO events (event_type) VALUES ('program_start')")
+    connection.execute("INSERT INTO firewall_rules (rule_type, target_ip) VALUES ('block', '10.0.0.5')")
+    connection.commit()
+    now = time.time()
+
+    cursor = connection.cursor()
+    assert migrate(cursor) == (0, SCHEMA_VERSION)
+    connection.commit()
+
+    cursor.execute('SELECT first_seen, last_seen FROM devices')
+    for value in cursor.fetchone():
+        assert abs(value - now) < 5
+    for sql in ('SELECT scan_time FROM scans', 'SELECT event_time FROM events',
+                'SELECT created_at FROM firewall_rules'):
+        cursor.execute(sql)
+        assert abs(cursor.fetchone()[0] - now) < 5, sql
+
+    cursor.execute('SELECT ip, mac, is_blocked FROM devices')
+    assert cursor.fetchone() == ('10.0.0.5', 'aa:bb:cc:dd:ee:ff', 0)
+    connection.close()
+
+def test_migrate_is_a_no_op_when_current(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'devices.db')
+    cursor = connection.cursor()
+    migrate(cursor)
+    assert schema_version(cursor) == SCHEMA_VERSION
+    assert migrate(cursor) == (SCHEMA_VERSION, SCHEMA_VERSION)
+    connection.close()
+
+def test_newer_schema_is_refused(tmp_path):
+    connection = sqlite3.connect(tmp_path / 'devices.db')
+    connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+    with pytest.raises(RuntimeError):
+        migrate(connection.cursor())
+    connection.close()
+
+def test_counters_are_seeded_from_legacy_rows(tmp_path):
+    connection = legacy_database(tmp_path / 'devices.db')
+    connection.executemany(
+        'INSERT INTO devices (ip_address, status, is_trusted, is_blocked) VALUES (?, ?, ?, ?)',
+        [('10.0.0.1', 'online', 1, 0), ('10.0.0.2', 'offline', 0, 1), ('10.0.0.3', 'online', 0, 0)]
+    )
+    connection.execute("INSERT INTO scans (scan_type, devices_found) VALUES ('arp', 3)")
+    connection.commit()
+
+    cursor = connection.cursor()
+    migrate(cursor)
+    counters = read_counters(cursor)
+    assert (counters['total_devices'], counters['online_devices']) == (3, 2)
+    assert (counters['blocked_devices'], counters['trusted_devices'], counters['total_scans']) == (1, 1, 1)
+    assert counters == recompute_counters(cursor)
+    connection.close()
@@ -0,0 +1,80 @@
+import socket
+import struct
+
+from src.core.nflog import (
+    NFULA_HWADDR, NFULA_PAYLOAD, PACKET_TYPE, NflogListener, _attr, parse_packet
+)
+
+SRC4, DST4 = socket.inet_aton('10.0.0.5'), socket.inet_aton('10.0.0.1')
+SRC6, DST6 = socket.inet_pton(socket.AF_INET6, 'fd00::5'), socket.inet_pton(socket.AF_INET6, 'fd00::1')
+
+def ipv4(protocol=6, port=22, size=60, fragment=0):
+    header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, size, 0, fragment, 64, protocol, 0, SRC4, DST4)
+    return header + struct.pack('!HH', 40000, port)
+
+def ipv6(protocol=17, port=53, payload_length=20):
+    header = struct.pack('!IHBB16s16s', 6 << 28, payload_length, protocol, 64, SRC6, DST6)
+    return header + struct.pack('!HH', 40000, port)
+
+def netlink_packet(payload, mac=None, extra=b''):
+    attrs = extra + _attr(NFULA_PAYLOAD, payload)
+    if mac:
+        attrs += _attr(NFULA_HWADDR, struct.pack('!H2x', len(mac)) + mac + b'\0' * (8 - len(mac)))
+    body = struct.pack('=BBH', socket.AF_INET, 0, 0) + attrs
+    return struct.pack('=IHHII', 16 + len(body), PACKET_TYPE, 0, 0, 0) + body
+
+def test_parse_ipv4_tcp():
+    assert parse_packet(ipv4()) == (SRC4, DST4, 6, 22, 60)
+
+def test_parse_ipv4_later_fragment_has_no_port():
+    assert parse_packet(ipv4(fragment=0x2000 | 185)) == (SRC4, DST4, 6, None, 60)
+
+def test_parse_ipv4_icmp_type():
+    packet = ipv4(protocol=1)[:20] + bytes([8, 0, 0, 0])
+    assert parse_packet(packet) == (SRC4, DST4, 1, 8, 60)
+
+def test_parse_ipv6_udp():
+    assert parse_packet(ipv6()) == (SRC6, DST6, 17, 53, 60)
+
+def test_parse_truncated_packets():
+    assert parse_packet(ipv4()[:19]) is None
+    assert parse_packet(ipv6()[:39]) is None
+    # Header present, transport header cut off by the copy range
+    assert parse_packet(ipv4()[:21]) == (SRC4, DST4, 6, None, 60)
+    assert parse_packet(b'\x10' * 40) is None
+
+def test_handle_skips_unknown_attributes_and_messages():
+    listener = NflogListener(1, sink=lambda events: None)
+    mac = bytes.fromhex('aabbccddee01')
+    unknown = _attr(42, b'\x01\x02\x03')
+    data = netlink_packet(ipv4(), mac=mac, extra=unknown)
+    # A message of another type, then one with no payload attribute
+    data += struct.pack('=IHHII', 20, 0x0300, 0, 0, 0) + b'\0' * 4
+    data += struct.pack('=IHHII', 20, PACKET_TYPE, 0, 0, 0) + b'\0' * 4
+
+    assert listener.handle(data, now=100) == 1
+    events = []
+    listener.sink = events.extend
+    listener.flush()
+    assert events[0]['data'] == {
+        'ip': '10.0.0.5', 'mac': 'AA:BB:CC:DD:EE:01', 'dst': '10.0.0.1', 'protocol': 'tcp',
+        'port': 22, 'packets': 1, 'bytes': 60, 'first_seen': 100, 'last_seen': 100
+    }
+
+def test_flows_are_aggregated_and_least_recent_evicted():
+    batches = []
+    listener = NflogListener(1, sink=batches.append, max_flows=2)
+
+    listener.record(SRC4, DST4, 6, 22, 60, now=1)
+    listener.record(SRC4, DST4, 6, 80, 60, now=2)
+    listener.record(SRC4, DST4, 6, 22, 40, now=3)
+    # Port 80 was seen least recently, so the new flow evicts it
+    listener.record(SRC4, DST4, 17, 53, 90, now=4)
+
+    assert listener.flush() == 3
+    flows = {(e['data']['protocol'], e['data']['port']): e['data'] for e in batches[0]}
+    assert flows[('tcp', 22)]['packets'] == 2 and flows[('tcp', 22)]['bytes'] == 100
+    assert flows[('tcp', 22)]['last_seen'] == 3
+    assert flows[('tcp', 80)]['packets'] == 1
+    assert flows[('udp', 53)]['packets'] == 1
+    assert listener.status()['packets'] == 4 and listener.status()['flows'] == 0
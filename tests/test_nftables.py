@@ -0,0 +1,96 @@
+import json
+import subprocess
+
+import pytest
+
+from src.core.nftables import NftablesBlocklist
+
+def element(key):
+    # Interval maps list networks as prefixes
+    if '/' in key:
+        addr, length = key.split('/')
+        return {'prefix': {'addr': addr, 'len': int(length)}}
+    return key
+
+def listing(**maps):
+    """`nft -j list table inet rpt_swi` output with the given {map: [(key, verdict), ...]}"""
+    items = [{'metainfo': {'json_schema_version': 1}}, {'table': {'family': 'inet', 'name': 'rpt_swi'}}]
+    for name in ('ip', 'net', 'ip6', 'net6', 'mac'):
+        nft_map = {'family': 'inet', 'name': name, 'table': 'rpt_swi', 'map': 'verdict'}
+        elements = [
+            [{'elem': {'val': element(key), 'counter': {'packets': 7, 'bytes': 420}}}, {verdict: None}]
+            for key, verdict in maps.get(name, [])
+        ]
+        if elements:
+            nft_map['elem'] = elements
+        items.append({'map': nft_map})
+    return json.dumps({'nftables': items})
+
+class FakeNft:
+    def __init__(self, output=None):
+        self.output = output
+        self.scripts = []
+
+    def run(self, args, input=None, check=True):
+        if args[:2] == ['nft', '-f']:
+            self.scripts.append(input)
+            return subprocess.CompletedProcess(args, 0, '', '')
+        if self.output is None:
+            return subprocess.CompletedProcess(args, 1, '', 'No such file or directory')
+        return subprocess.CompletedProcess(args, 0, self.output, '')
+
+@pytest.fixture
+def nft(monkeypatch):
+    fake = FakeNft(listing())
+    blocklist = NftablesBlocklist()
+    monkeypatch.setattr(blocklist, '_run', fake.run)
+    return blocklist, fake
+
+def test_missing_table_is_created_once(nft):
+    blocklist, fake = nft
+    fake.output = None
+
+    blocklist.ensure()
+    blocklist.ensure()
+
+    assert fake.scripts == [blocklist.ruleset()]
+    assert 'ip saddr vmap @ip' in fake.scripts[0]
+    assert 'flags interval' in fake.scripts[0]
+
+def test_empty_table_gets_one_script(nft):
+    blocklist, fake = nft
+
+    assert blocklist.apply(add=['10.0.0.1', '10.1.0.0/16', 'aa:bb:cc:dd:ee:01']) == 3
+    assert fake.scripts == [
+        'add element inet rpt_swi ip { 10.0.0.1 : drop }\n'
+        'add element inet rpt_swi net { 10.1.0.0/16 : drop }\n'
+        'add element inet rpt_swi mac { aa:bb:cc:dd:ee:01 : drop }\n'
+    ]
+
+def test_apply_diffs_against_current_maps(nft):
+    blocklist, fake = nft
+    fake.output = listing(ip=[('10.0.0.1', 'drop'), ('10.0.0.2', 'accept')], net=[('10.1.0.0/16', 'drop')])
+
+    # 10.0.0.1 is already dropped; 10.0.0.2 flips verdict; 10.0.0.3 is not there to remove
+    assert blocklist.apply(add=['10.0.0.1', '10.0.0.2'], remove=['10.1.0.0/16', '10.0.0.3']) == 3
+    assert fake.scripts == [
+        'delete element inet rpt_swi ip { 10.0.0.2 }\n'
+        'delete element inet rpt_swi net { 10.1.0.0/16 }\n'
+        'add element inet rpt_swi ip { 10.0.0.2 : drop }\n'
+    ]
+    assert blocklist.apply(add=['10.0.0.1']) == 0
+    assert len(fake.scripts) == 1
+
+def test_listing_is_parsed(nft):
+    blocklist, fake = nft
+    fake.output = listing(ip=[('10.0.0.1', 'drop'), ('10.0.0.2', 'accept')], mac=[('aa:bb:cc:dd:ee:01', 'drop')])
+
+    assert blocklist.entries()['ip'] == ['10.0.0.1']
+    assert blocklist.counts() == {'ip': 2, 'net': 0, 'ip6': 0, 'net6': 0, 'mac': 1}
+    assert blocklist.counters() == {'10.0.0.1': (7, 420), 'aa:bb:cc:dd:ee:01': (7, 420)}
+    assert blocklist.contains('10.0.0.1') and not blocklist.contains('10.0.0.2')
+
+def test_unknown_verdict_is_rejected(nft):
+    blocklist, _ = nft
+    with pytest.raises(ValueError):
+        blocklist.apply(add=['10.0.0.1'], verdict='reject')
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+DAY = 86400
+
+def test_database_runs_retention_in_the_background(db):
+    assert db.retention._thread is not None and db.retention._thread.is_alive()
+
+def test_purged_devices_take_their_history_with_them(db):
+    now = int(time.time())
+    old = now - 400 * DAY
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', ('10.0.0.1', old, old))
+        stale = cursor.lastrowid
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', ('10.0.0.2', now, now))
+        fresh = cursor.lastrowid
+        for device_id, ts in ((stale, old), (fresh, now - 60)):
+            cursor.execute('INSERT INTO device_presence (device_id, start_ts, end_ts) VALUES (?, ?, ?)',
+                           (device_id, ts, ts + 60))
+            for width in (3600, DAY):
+                cursor.execute('''
+                    INSERT INTO device_presence_rollup (granularity, device_id, bucket_ts, seconds_present)
+                    VALUES (?, ?, ?, 60)
+                ''', (width, device_id, ts - ts % width))
+
+    report = db.retention.run(now)
+
+    assert report['devices'] == 1
+    with db.pool.read() as cursor:
+        cursor.execute('SELECT id FROM devices')
+        assert [row[0] for row in cursor.fetchall()] == [fresh]
+        for table in ('device_presence', 'device_presence_rollup'):
+            cursor.execute(f'SELECT DISTINCT device_id FROM {table}')
+            assert [row[0] for row in cursor.fetchall()] == [fresh], table
+
+def test_notification_purge_uses_an_index(db):
+    with db.pool.read() as cursor:
+        cursor.execute('''
+            EXPLAIN QUERY PLAN
+            SELECT id FROM notifications WHERE is_read = 1 AND created_at < ? ORDER BY created_at LIMIT ?
+        ''', (0, 10))
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+    assert 'idx_notifications_read' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_old_read_notifications_are_purged(db):
+    now = int(time.time())
+    with db.pool.transaction() as cursor:
+        cursor.executemany('INSERT INTO notifications (created_at, type, is_read) VALUES (?, ?, ?)', [
+            (now - 90 * DAY, 'old_read', 1),
+            (now - 90 * DAY, 'old_unread', 0),
+            (now, 'new_read', 1)
+        ])
+
+    assert db.retention.run(now)['notifications'] == 1
+    with db.pool.read() as cursor:
+        cursor.execute('SELECT type FROM notifications ORDER BY id')
+        assert [row[0] for row in cursor.fetchall()] == ['old_unread', 'new_read']
+
+def test_presence_history_is_purged_in_batches(db, monkeypatch):
+    now = int(time.time())
+    old = now - 400 * DAY
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, first_seen, last_seen) VALUES (?, ?, ?)', ('10.0.0.1', old, now))
+        device_id = cursor.lastrowid
+        cursor.executemany('INSERT INTO device_presence (device_id, start_ts, end_ts) VALUES (?, ?, ?)',
+                           [(device_id, old + i * 3600, old + i * 3600 + 60) for i in range(5)]
+                           + [(device_id, now - 60, now - 60)])
+    statements = []
+    db.pool.connection().set_trace_callback(statements.append)
+    db.retention.batch_size = 2
+
+    report = db.retention.run(now)
+
+    db.pool.connection().set_trace_callback(None)
+    assert report['history']['intervals'] == 5
+    assert not any(s.startswith('DELETE FROM device_presence WHERE end_ts') for s in statements)
+    assert sum(s.startswith('BEGIN') for s in statements) >= 3
+    assert db.history.get_intervals(device_id, since=0, until=now) == [
+        {'start': now - 60, 'end': now - 60, 'sightings': 1}
+    ]
+
+def test_scans_do_not_roll_up_or_purge_history(db, monkeypatch):
+    monkeypatch.setattr(db.history, 'rollup', lambda now=None: pytest.fail('rollup on the scan path'))
+
+    db.upsert_devices([{'ip': '10.0.0.1'}])
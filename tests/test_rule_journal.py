@@ -0,0 +1,34 @@
+import time
+
+def rule(ip='10.0.0.9', **fields):
+    return dict({'type': 'block', 'ip': ip, 'timestamp': time.time()}, **fields)
+
+def test_covered_rules_are_not_saved_twice(db):
+    journal = db.firewall_rules
+    assert len(journal.append([rule()], wait=True)) == 1
+    assert journal.append([rule()], wait=True) == []
+    # A permanent rule covers any timed one
+    assert journal.append([rule(expires_at=int(time.time()) + 60)], wait=True) == []
+
+def test_future_schedule_does_not_hide_an_immediate_block(db):
+    now = int(time.time())
+    journal = db.firewall_rules
+    assert len(journal.append([rule(starts_at=now + 3600, expires_at=now + 7200)], wait=True)) == 1
+    assert len(journal.append([rule()], wait=True)) == 1
+    assert journal.count() == 2
+
+def test_short_block_does_not_hide_a_longer_one(db):
+    now = int(time.time())
+    journal = db.firewall_rules
+    journal.append([rule(expires_at=now + 60)], wait=True)
+    assert len(journal.append([rule()], wait=True)) == 1
+
+def test_block_during_a_scheduled_window_survives_sync(fw, db, kernel):
+    now = int(time.time())
+    assert fw.schedule_block('10.0.0.9', now + 3600, now + 7200)
+    assert fw.block_device({'ip': '10.0.0.9'})
+
+    fw._recent_changes.clear()
+    fw.sync_desired_state()
+    assert fw.is_blocked('10.0.0.9')
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.9/32 -j DROP']
@@ -0,0 +1,70 @@
+import time
+
+from src.core.scheduler import EXPIRE, START, BlockScheduler
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+def test_run_due_hands_over_due_entries_in_order():
+    batches = []
+    scheduler = BlockScheduler(batches.append, batch_size=2)
+    scheduler.push_many([(300, EXPIRE, 3), (100, START, 1), (200, EXPIRE, 2)])
+
+    assert scheduler.next_deadline() == 100
+    assert scheduler.run_due(now=250) == 2
+    assert batches == [[(100, START, 1), (200, EXPIRE, 2)]]
+    assert scheduler.pending() == 1
+    assert scheduler.run_due(now=250) == 0
+
+def test_background_thread_wakes_for_an_earlier_deadline():
+    seen = []
+    scheduler = BlockScheduler(seen.extend)
+    scheduler.start()
+    try:
+        scheduler.push(time.time() + 3600, EXPIRE, 1)
+        scheduler.push(time.time(), EXPIRE, 2)
+        assert wait_for(lambda: [entry[2] for entry in seen] == [2])
+        assert scheduler.pending() == 1
+    finally:
+        scheduler.stop()
+
+def test_timed_block_expires(fw, db, kernel):
+    expires_at = int(time.time()) + 1
+    assert fw.block_devices([{'ip': '10.0.0.7'}], expires_at=expires_at) == ['10.0.0.7']
+    assert fw.is_blocked('10.0.0.7')
+
+    assert wait_for(lambda: not fw.is_blocked('10.0.0.7'))
+    assert kernel.chains['RPT-SWI'] == []
+    assert db.firewall_rules.count() == 0
+
+def test_expiry_keeps_a_permanent_block_of_the_same_device(fw, db, kernel):
+    expires_at = int(time.time()) + 1
+    fw.block_devices([{'ip': '10.0.0.7'}], expires_at=expires_at)
+    assert fw.block_ip('10.0.0.7', 'permanent')
+    db.writer.flush()
+    assert db.firewall_rules.count() == 2
+
+    # The timed rule is retired; the permanent one is left in place
+    assert wait_for(lambda: db.firewall_rules.count() == 1)
+    assert fw.is_blocked('10.0.0.7')
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.7/32 -j DROP']
+    assert [rule['type'] for rule in db.firewall_rules.active()] == ['block_ip']
+
+def test_scheduled_block_starts_and_expires(fw, db, kernel):
+    now = int(time.time())
+    assert fw.schedule_block('10.0.0.9', now + 1, now + 2)
+    db.writer.flush()
+    assert not fw.is_blocked('10.0.0.9')
+
+    assert wait_for(lambda: fw.is_blocked('10.0.0.9'))
+    # Starting applies the saved rule; it does not journal a second one
+    assert db.firewall_rules.count() == 1
+
+    assert wait_for(lambda: not fw.is_blocked('10.0.0.9'))
+    assert kernel.chains['RPT-SWI'] == []
+    assert db.firewall_rules.count() == 0
@@ -0,0 +1,116 @@
+import pytest
+
+from src.core import firewall
+from src.core.rule_index import RuleIndex, parse_iptables_counters, parse_iptables_save
+
+PORT_RULE = '-p tcp -m tcp --dport 23 -j DROP'
+
+@pytest.fixture
+def no_grace(monkeypatch):
+    monkeypatch.setattr(firewall, 'SYNC_GRACE_SECONDS', 0)
+
+def test_sync_prunes_duplicates_and_strays(fw, db, kernel, no_grace):
+    fw.block_devices([{'ip': '10.0.0.1'}])
+    kernel.chains['RPT-SWI'] += ['-s 10.0.0.1/32 -j DROP', '-s 10.9.9.9/32 -j DROP']
+    # Port rules in INPUT may belong to another tool: deduplicated, never dropped
+    kernel.chains['INPUT'] += [PORT_RULE, PORT_RULE]
+
+    result = fw.sync_desired_state()
+
+    assert (result['added'], result['removed']) == (0, 3)
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.1/32 -j DROP']
+    assert kernel.chains['INPUT'].count(PORT_RULE) == 1
+
+def test_sync_without_prune_only_adds(fw, db, kernel, no_grace):
+    fw.block_devices([{'ip': '10.0.0.1'}])
+    kernel.chains['RPT-SWI'] = ['-s 10.9.9.9/32 -j DROP']
+
+    result = fw.sync_desired_state(prune=False)
+
+    assert (result['added'], result['removed']) == (1, 0)
+    assert sorted(kernel.chains['RPT-SWI']) == ['-s 10.0.0.1/32 -j DROP', '-s 10.9.9.9/32 -j DROP']
+
+def test_sync_skips_rules_changed_within_the_grace_period(fw, db, kernel):
+    fw.block_devices([{'ip': '10.0.0.1'}])
+    kernel.chains['RPT-SWI'] = []
+
+    assert fw.sync_desired_state()['added'] == 0
+    assert kernel.chains['RPT-SWI'] == []
+
+    fw._recent_changes.clear()
+    assert fw.sync_desired_state()['added'] == 1
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.1/32 -j DROP']
+
+def test_sync_lets_the_whitelist_win(fw, db, kernel, no_grace):
+    db.add_trusted_device({'ip': '10.0.0.2', 'mac': 'AA:BB:CC:DD:EE:02'})
+    fw.block_devices([{'ip': '10.0.0.1'}, {'ip': '10.0.0.2'}])
+
+    result = fw.sync_desired_state()
+
+    assert result['removed'] == 1
+    assert kernel.chains['RPT-SWI'] == ['-s 10.0.0.1/32 -j DROP']
+
+def test_sync_keeps_blocks_recorded_only_on_the_device_row(fw, db, kernel, no_grace):
+    # src/main.py blocks by flagging the row, without a saved rule
+    with db.pool.transaction() as cursor:
+        cursor.execute('INSERT INTO devices (ip, mac, first_seen, last_seen, is_blocked) VALUES (?, ?, 0, 0, 1)',
+                       ('10.0.0.3', 'AA:BB:CC:DD:EE:03'))
+    kernel.chains['RPT-SWI'] = ['-s 10.0.0.3/32 -j DROP']
+
+    result = fw.sync_desired_state()
+
+    assert (result['added'], result['removed']) == (1, 0)
+    assert sorted(kernel.chains['RPT-SWI']) == [
+        '-s 10.0.0.3/32 -j DROP',
+        '-s 10.0.0.3/32 -m mac --mac-source AA:BB:CC:DD:EE:03 -j DROP'
+    ]
+
+def test_whitelisting_a_blocked_device_allows_it(fw, db, kernel, no_grace):
+    fw.block_devices([{'ip': '10.0.0.4'}])
+
+    fw.whitelist_device({'ip': '10.0.0.4'})
+    fw.sync_desired_state()
+
+    assert kernel.chains['RPT-SWI'] == []
+    device = db.get_device('10.0.0.4')
+    assert device['status'] == 'allowed' and not device['is_blocked']
+
+def test_rule_index_parses_dump_and_reports_drift():
+    dump = '\n'.join([
+        '*filter',
+        ':INPUT ACCEPT [0:0]',
+        ':RPT-SWI - [0:0]',
+        '-A INPUT -j RPT-SWI',
+        f'-A INPUT {PORT_RULE}',
+        '-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT',
+        '-A RPT-SWI -s 10.0.0.1/32 -j DROP',
+        '-A RPT-SWI -s 10.0.0.1/32 -m mac --mac-source aa:bb:cc:dd:ee:ff -j DROP',
+        '-A RPT-SWI -s 192.168.5.0/24 -j DROP',
+        'COMMIT'
+    ])
+    exists, handles = parse_iptables_save(dump)
+    assert exists
+    assert handles == [
+        ('INPUT', PORT_RULE),
+        ('RPT-SWI', '-s 10.0.0.1/32 -j DROP'),
+        ('RPT-SWI', '-s 10.0.0.1/32 -m mac --mac-source aa:bb:cc:dd:ee:ff -j DROP'),
+        ('RPT-SWI', '-s 192.168.5.0/24 -j DROP')
+    ]
+    counters = parse_iptables_counters('[3:180] -A RPT-SWI -s 10.0.0.1/32 -j DROP\n[1:60] -A INPUT -j ACCEPT')
+    assert counters == [(('RPT-SWI', '-s 10.0.0.1/32 -j DROP'), 3, 180)]
+
+    kernel = [handles]
+    index = RuleIndex(lambda: (True, kernel[0]))
+    assert index.reconcile()['added'] == handles
+    assert index.is_blocked('10.0.0.1') and index.is_blocked('192.168.5.77')
+    assert not index.is_blocked('10.0.0.2')
+    status = index.status()
+    assert (status['total_rules'], status['blocked_ips'], status['blocked_macs']) == (4, 2, 1)
+    assert status['blocked_ports'] == [(23, 'tcp', 'input')]
+
+    # Someone deleted the network rule and added one behind our back
+    stray = ('RPT-SWI', '-s 10.9.9.9/32 -j DROP')
+    kernel[0] = handles[:3] + [stray]
+    assert index.reconcile() == {'added': [stray], 'removed': [handles[3]]}
+    assert not index.is_blocked('192.168.5.77')
+    assert index.is_blocked('10.9.9.9')
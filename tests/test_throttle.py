@@ -0,0 +1,67 @@
+import subprocess
+
+import pytest
+
+from src.core import throttle
+from src.core.throttle import DeviceThrottle, normalize_rate, rate_bits
+
+class FakeTc:
+    """Records commands; answers tc qdisc show with a configurable root qdisc"""
+
+    def __init__(self, root='qdisc fq_codel 0: root refcnt 2 limit 10240p'):
+        self.root = root
+        self.calls = []
+
+    def run(self, args, input=None, capture_output=False, text=False, check=False, **kwargs):
+        self.calls.append((args, input))
+        command = args[4:] if args[:3] == ['ip', 'netns', 'exec'] else args
+        out = ''
+        if command[:3] == ['tc', 'qdisc', 'show']:
+            out = self.root + '\n'
+        elif command[:3] == ['tc', 'qdisc', 'replace']:
+            self.root = 'qdisc htb 1: root refcnt 2 r2q 10 default 0'
+        elif command[:3] == ['ipset', 'save', 'rpt-swi-throttle']:
+            out = ''
+        elif command[:3] == ['iptables', '-t', 'mangle'] and '-C' in command:
+            return subprocess.CompletedProcess(args, 1, '', '')
+        return subprocess.CompletedProcess(args, 0, out, '')
+
+    def commands(self):
+        return [args for args, _ in self.calls]
+
+@pytest.fixture
+def tc(monkeypatch):
+    fake = FakeTc()
+    monkeypatch.setattr(throttle.subprocess, 'run', fake.run)
+    return fake
+
+def test_rates_are_normalized():
+    assert normalize_rate(512) == '512kbit'
+    assert rate_bits('1mbit') == rate_bits('125kbps') == 1000000
+    with pytest.raises(ValueError):
+        normalize_rate('fast')
+
+def test_netns_prefixes_every_command(tc):
+    shaper = DeviceThrottle(interface='veth0', netns='rpt-test')
+
+    shaper.throttle('10.0.0.5', rate='2mbit')
+
+    assert all(args[:4] == ['ip', 'netns', 'exec', 'rpt-test'] for args in tc.commands())
+    batches = {args[4]: script for args, script in tc.calls if script}
+    assert batches['tc'] == 'class replace dev veth0 parent 1: classid 1:1 htb rate 2mbit ceil 2mbit\n'
+    assert batches['ipset'] == 'add rpt-swi-throttle 10.0.0.5 skbprio 1:1\n'
+
+def test_default_root_qdisc_is_replaced(tc):
+    DeviceThrottle(interface='eth0').ensure()
+
+    assert ['tc', 'qdisc', 'replace', 'dev', 'eth0', 'root', 'handle', '1:', 'htb'] in tc.commands()
+
+def test_foreign_root_qdisc_is_left_alone(tc):
+    tc.root = 'qdisc cake 8001: root refcnt 2 bandwidth 100Mbit'
+    shaper = DeviceThrottle(interface='eth0')
+
+    with pytest.raises(RuntimeError, match='cake'):
+        shaper.ensure()
+    shaper.destroy()
+
+    assert not any(args[:3] in (['tc', 'qdisc', 'replace'], ['tc', 'qdisc', 'del']) for args in tc.commands())